@@ -0,0 +1,75 @@
+import re
+import numpy as np
+import pandas as pd
+
+# One line of the address file: "12. Rudagatan 51, (64.7307, 21.0628)"
+NUMBER = r"([-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?)"
+ADDRESS_LINE = re.compile(
+    rf"^[ \t]*(\d+)\.[ \t]*(.*?),[ \t]*\([ \t]*{NUMBER}[ \t]*,[ \t]*{NUMBER}[ \t]*\)[ \t]*\r?$",
+    re.MULTILINE,
+)
+
+
+def parse_address_text(text):
+    """
+    Parses the lines of an address file. The number in front of each line is the number of the Individ.
+    Returns a dataframe indexed by Individ ("Individ <number>") with Adress, Latitude and Longitude.
+    Raises ValueError for lines that do not parse, duplicate numbers and coordinates out of range.
+    """
+    matches = ADDRESS_LINE.findall(text)
+    lines = [line for line in text.splitlines() if line.strip()]
+    if len(matches) != len(lines):
+        bad = [line for line in lines if not ADDRESS_LINE.match(line)]
+        raise ValueError(f"{len(bad)} address lines could not be parsed, the first is: {bad[0]!r}")
+
+    if not matches:
+        return pd.DataFrame({"Adress": pd.Series(dtype=object), "Latitude": pd.Series(dtype=np.float64),
+                             "Longitude": pd.Series(dtype=np.float64)}, index=pd.Index([], name="Individ"))
+
+    numbers, addresses, latitudes, longitudes = zip(*matches)
+    latitudes = np.array(latitudes, dtype=np.float64)
+    longitudes = np.array(longitudes, dtype=np.float64)
+    registry = pd.DataFrame({"Adress": [address.strip() for address in addresses],
+                             "Latitude": latitudes, "Longitude": longitudes},
+                            index=pd.Index([f"Individ {int(number)}" for number in numbers], name="Individ"))
+    validate_address_registry(registry)
+    return registry
+
+
+def validate_address_registry(registry):
+    """
+    Raises ValueError if an Individ occurs twice or a coordinate is not a valid latitude/longitude.
+    """
+    duplicated = registry.index[registry.index.duplicated()]
+    if len(duplicated):
+        raise ValueError(f"Duplicate address numbers: {', '.join(dict.fromkeys(duplicated))}")
+
+    invalid = ~(registry["Latitude"].between(-90, 90) & registry["Longitude"].between(-180, 180))
+    if invalid.any():
+        raise ValueError(f"Coordinates out of range for {', '.join(registry.index[invalid])}")
+
+
+def load_address_registry(file_path):
+    """
+    Reads the address file at file_path, see parse_address_text.
+    """
+    with open(file_path, encoding="utf-8") as f:
+        return parse_address_text(f.read())
+
+
+def attach_addresses(visits_df, registry):
+    """
+    Adds Adress, Latitude and Longitude from registry to visits_df (matched on the stripped Individ).
+    Raises ValueError if a visit has no address.
+    """
+    visits_df = visits_df.copy()
+    visits_df["Individ"] = visits_df["Individ"].str.strip()
+
+    positions = registry.index.get_indexer(visits_df["Individ"])
+    if (positions < 0).any():
+        missing = dict.fromkeys(visits_df["Individ"][positions < 0])
+        raise ValueError(f"No address for {', '.join(missing)}")
+
+    for column in ("Adress", "Latitude", "Longitude"):
+        visits_df[column] = registry[column].to_numpy()[positions]
+    return visits_df
@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+from contextlib import redirect_stdout
+
+# The Project modules are imported as top level modules, as when running main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import synthetic_workbook, synthetic_grid
+from data_processing import ladda_data, rensa_medarb_data
+from dataframe_creation import (skapa_brukare_df, skapa_brukare_dag_df, addera_adress_till_df, skift_df,
+                                TIDSFÖNSTER, REGEX_TID_MÖNSTER, REGEX_DAG_MÖNSTER)
+from route_optimization import generate_matrices, optimize_routes
+from week import DEPOT_LOCATION, SKIFT_TIDER
+
+# (brukare, medarbetare, grid side) per size
+DEFAULT_SIZES = [(50, 17, 30), (150, 50, 50), (400, 130, 80)]
+RESULTS_FILE = "benchmark_results.json"
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+# Wall time target in seconds for a new process running the lightweight commands of main.py
+# once the workbook cache is filled (most of it is the pandas import)
+COLD_START_TARGET = 1.5
+COLD_START_COMMANDS = {"validate": ["validate"], "build-visits": ["build-visits", "Måndag", "em"]}
+
+# Set to False to skip the traced run of every stage
+MEASURE_MEMORY = True
+
+
+def timed(function, *args, **kwargs):
+    """
+    Returns the result of function and its wall time in seconds.
+    """
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, round(time.perf_counter() - start, 4)
+
+
+def run_stage(stages, name, function, *args, repeat=True, **kwargs):
+    """
+    Runs function and records the wall time of this first (cold) run under name. With repeat it runs
+    again for the warm time, with the caches of the first run filled, and if MEASURE_MEMORY once more
+    with tracemalloc for the peak memory (tracing slows the run down too much to time it at the same time).
+    The solve passes repeat=False, it would take its whole time limit again, and gets no warm time or peak.
+    Returns the result of the first run.
+    """
+    warm_seconds = peak = None
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        result, seconds = timed(function, *args, **kwargs)
+
+        if repeat:
+            warm_seconds = timed(function, *args, **kwargs)[1]
+            if MEASURE_MEMORY:
+                tracemalloc.start()
+                function(*args, **kwargs)
+                peak = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+                tracemalloc.stop()
+
+    stages[name] = {"seconds": seconds, "warm_seconds": warm_seconds, "peak_mb": peak}
+    return result
+
+
+def cold_start(arguments, repeats=3):
+    """
+    Returns the best wall time of running main.py with arguments in a new process.
+    The first run is not timed, it fills the workbook cache.
+    """
+    command = [sys.executable, MAIN] + arguments
+    subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        seconds.append(time.perf_counter() - start)
+    return round(min(seconds), 4)
+
+
+def benchmark_size(n_brukare, n_medarbetare, side, time_limit, seed=0, dag="Måndag", fm=False):
+    """
+    Generates a workbook, address file and road grid of the given size in a temporary directory
+    and times every stage of the pipeline for one day and shift on them, and the cold start
+    of the commands in COLD_START_COMMANDS.
+    """
+    stages = {}
+    with tempfile.TemporaryDirectory() as directory:
+        workbook_path = os.path.join(directory, "planering.xlsx")
+        address_path = os.path.join(directory, "adresser.txt")
+        synthetic_workbook(workbook_path, address_path, n_brukare, n_medarbetare, seed)
+        G = synthetic_grid(side, seed)
+
+        cwd = os.getcwd()
+        os.chdir(directory)  # optimize_routes writes route_output.txt in the working directory
+        try:
+            data = run_stage(stages, "ladda_data", ladda_data, workbook_path, cache_dir=None)
+            medarbetare_df = rensa_medarb_data(data["medarbetare"])
+            brukare_tidsfönster_df = run_stage(stages, "skapa_brukare_df", skapa_brukare_df, data["brukare"],
+                                               TIDSFÖNSTER, REGEX_TID_MÖNSTER)
+            dag_df = run_stage(stages, "skapa_brukare_dag_df", skapa_brukare_dag_df, data["brukare"],
+                               brukare_tidsfönster_df, REGEX_DAG_MÖNSTER[dag])
+            dag_df = run_stage(stages, "addera_adress_till_df", addera_adress_till_df, address_path, dag_df)
+            shift = skift_df(dag_df, fm)
+
+            customer_locations = list(zip(shift['Latitude'].astype("float"), shift['Longitude'].astype("float")))
+            run_stage(stages, "generate_matrices", generate_matrices, G, customer_locations, DEPOT_LOCATION)
+            report = run_stage(stages, "optimize_routes", optimize_routes, shift, medarbetare_df, G, DEPOT_LOCATION,
+                               len(medarbetare_df), *SKIFT_TIDER[fm], cache_dir=None, time_limit=time_limit,
+                               repeat=False)
+            cold_starts = {name: cold_start(["--data", workbook_path, "--addresses", address_path] + arguments)
+                           for name, arguments in COLD_START_COMMANDS.items()}
+        finally:
+            os.chdir(cwd)
+
+    return {
+        "brukare": n_brukare,
+        "medarbetare": n_medarbetare,
+        "grid_nodes": G.number_of_nodes(),
+        "visits": len(dag_df),
+        "shift_visits": len(shift),
+        "objective": None if report is None else report["objective"],
+        "stages": stages,
+        "cold_start": cold_starts,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_benchmarks(sizes=None, time_limit=10, results_file=RESULTS_FILE):
+    """
+    Benchmarks every size in sizes (see DEFAULT_SIZES) and writes the results as JSON.
+    seconds is the first run of a stage and warm_seconds the second one. Peak memory is the Python/NumPy
+    allocations traced during the stage, max_rss_mb is the whole process.
+    """
+    if sizes is None:
+        sizes = DEFAULT_SIZES
+
+    results = []
+    for n_brukare, n_medarbetare, side in sizes:
+        result = benchmark_size(n_brukare, n_medarbetare, side, time_limit)
+        results.append(result)
+        print(f"{n_brukare} brukare, {n_medarbetare} medarbetare, {result['grid_nodes']} grid nodes: "
+              + ", ".join(f"{name} {stage['seconds']:.3f} s"
+                          + ("" if stage["warm_seconds"] is None else f" (warm {stage['warm_seconds']:.3f} s)")
+                          for name, stage in result["stages"].items()))
+        for name, seconds in result["cold_start"].items():
+            if seconds > COLD_START_TARGET:
+                print(f"main.py {name} took {seconds:.2f} s to start, the target is {COLD_START_TARGET} s")
+
+    with open(results_file, "w") as f:
+        json.dump({
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "time_limit": time_limit,
+            "cold_start_target": COLD_START_TARGET,
+            "results": results,
+        }, f, ensure_ascii=False, indent=1)
+    return results
+
+
+if __name__ == '__main__':
+    # Mäter alla steg på syntetiska data: python Project/benchmarks/run.py [antal brukare,...] [tidsgräns i sekunder]
+    sizes = None
+    if len(sys.argv) > 1:
+        sizes = [(n, max(2, n // 3), max(10, int(n ** 0.5 * 4))) for n in map(int, sys.argv[1].split(","))]
+    time_limit = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    run_benchmarks(sizes, time_limit)
+    print(f"Results written to {RESULTS_FILE}")
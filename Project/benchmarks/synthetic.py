@@ -0,0 +1,125 @@
+import math
+import random
+
+import networkx as nx
+from openpyxl import Workbook
+
+from dataframe_creation import TIDSFÖNSTER
+
+# Area around the depot in week.DEPOT_LOCATION, (north, south, east, west) as in the Koordinater sheet
+BBOX = (64.74, 64.68, 21.25, 21.09)
+
+# Share of the brukare with a visit in each time window, roughly as in the fictional workbook
+BESÖK_ANDEL = {"Morgon": 0.65, "Förmiddag": 0.2, "Lunch": 0.35, "Eftermiddag": 0.25,
+               "Middag": 0.4, "Tidig kväll": 0.3, "Sen kväll": 0.5}
+LÄKEMEDEL_FÖNSTER = ["morg", "lunch", "em", "middag", "sen kväll"]
+DAGAR = ["mån", "tis", "ons", "tor", "fre"]
+
+BRUKARE_KOLUMNER = ['Kräver körkort', 'Behöver läkemedel', 'Behöver insulin', 'Har stomi', 'Röker', 'Har hund',
+                    'Har katt', 'Kräver man', 'Kräver kvinna', 'Kräver >18'] + [namn for namn, tider in TIDSFÖNSTER] + \
+                   ['Dusch', 'Aktivering', 'Adress']
+MEDARBETARE_ANDEL = {'Tål hund': 0.85, 'Tål katt': 0.85, 'Tål rök': 0.85, 'Man': 0.3, 'Kvinna': None, 'Körkort': 0.8,
+                     'Läkemedelsdelegering': 0.6, 'Insulindelegering': 0.4, 'Stomidelegering': 0.4, '18 år el mer': 0.9}
+
+
+def ja(rnd, andel):
+    return 'Ja' if rnd.random() < andel else '-'
+
+
+def brukare_rad(rnd, individ):
+    """
+    Returns one row of the brukare sheet with random needs, visits, shower and activation.
+    """
+    besök = {}
+    for namn, andel in BESÖK_ANDEL.items():
+        if rnd.random() >= andel:
+            besök[namn] = '-'
+        elif rnd.random() < 0.03:
+            besök[namn] = f"{rnd.choice([10, 15, 20, 30])}*2"
+        else:
+            besök[namn] = rnd.choice([5, 10, 10, 15, 15, 20, 30])
+
+    läkemedel = ', '.join(sorted(rnd.sample(LÄKEMEDEL_FÖNSTER, rnd.randint(1, 3)), key=LÄKEMEDEL_FÖNSTER.index)) \
+        if rnd.random() < 0.3 else '-'
+    dusch = rnd.choice([f"{rnd.choice(DAGAR)} {rnd.choice([30, 35])} min", ' + '.join(rnd.sample(DAGAR, 2)),
+                        rnd.choice(DAGAR).title()]) if rnd.random() < 0.4 else '-'
+    aktivering = rnd.choice([f"{rnd.choice(DAGAR)} {rnd.choice([45, 60])} min", rnd.choice(DAGAR)]) \
+        if rnd.random() < 0.2 else '-'
+
+    return [individ, ja(rnd, 0.15), läkemedel, 'morg' if rnd.random() < 0.05 else '-', 'morg' if rnd.random() < 0.05 else '-',
+            ja(rnd, 0.06), ja(rnd, 0.07), ja(rnd, 0.05),
+            'vid dusch' if dusch != '-' and rnd.random() < 0.05 else '-',
+            'vid dusch' if dusch != '-' and rnd.random() < 0.2 else '-',
+            ja(rnd, 0.08)] + [besök[namn] for namn, tider in TIDSFÖNSTER] + [dusch, aktivering, None]
+
+
+def medarbetare_rad(rnd, medarbetare):
+    värden = {}
+    for kolumn, andel in MEDARBETARE_ANDEL.items():
+        if andel is None:
+            värden[kolumn] = 'Nej' if värden['Man'] == 'Ja' else 'Ja'
+        else:
+            värden[kolumn] = 'Ja' if rnd.random() < andel else 'Nej'
+    return [medarbetare] + list(värden.values())
+
+
+def synthetic_workbook(workbook_path, address_path, n_brukare, n_medarbetare, seed=0, bbox=BBOX):
+    """
+    Writes a planning workbook with the sheet layout of the fictional one, and an address file
+    with a random location inside bbox for every brukare.
+    """
+    rnd = random.Random(seed)
+    wb = Workbook()
+
+    brukare_ws = wb.active
+    brukare_ws.title = 'Individer, brukare'
+    brukare_ws.append([None] * (len(BRUKARE_KOLUMNER) + 1))
+    brukare_ws.append([None] + BRUKARE_KOLUMNER)
+    for i in range(n_brukare):
+        brukare_ws.append(brukare_rad(rnd, f"Individ {i + 1}"))
+
+    medarbetare_ws = wb.create_sheet('Medarbetare')
+    medarbetare_ws.append([f"{n_medarbetare} syntetiska medarbetare"])
+    medarbetare_ws.append([None])
+    medarbetare_ws.append([None] + list(MEDARBETARE_ANDEL))
+    for i in range(n_medarbetare):
+        medarbetare_ws.append(medarbetare_rad(rnd, f"Medarbetare {i + 1}"))
+
+    koordinater_ws = wb.create_sheet('Koordinater')
+    for namn, värde in zip(['North:', 'South:', 'East:', 'West:'], bbox):
+        koordinater_ws.append([namn, värde])
+    wb.save(workbook_path)
+
+    north, south, east, west = bbox
+    with open(address_path, 'w', encoding='utf-8') as f:
+        for i in range(n_brukare):
+            f.write(f"{i + 1}. Syntetgatan {i + 1}, ({rnd.uniform(south, north)}, {rnd.uniform(west, east)})\n")
+
+
+def synthetic_grid(side, seed=0, bbox=BBOX):
+    """
+    Returns a side x side road grid over bbox with two-way streets, lengths a little longer than
+    the straight line and a mix of speed limits (some missing).
+    """
+    rnd = random.Random(seed)
+    north, south, east, west = bbox
+    G = nx.MultiDiGraph(crs="epsg:4326")
+    for i in range(side):
+        for j in range(side):
+            G.add_node(i * side + j, y=south + (north - south) * i / (side - 1), x=west + (east - west) * j / (side - 1))
+
+    meters_per_degree = 111320.0
+    dy = (north - south) / (side - 1) * meters_per_degree
+    dx = (east - west) / (side - 1) * meters_per_degree * math.cos(math.radians((north + south) / 2))
+    for i in range(side):
+        for j in range(side):
+            for di, dj, straight in ((0, 1, dx), (1, 0, dy)):
+                a, b = i + di, j + dj
+                if a < side and b < side:
+                    data = {'length': straight * rnd.uniform(1.0, 1.3)}
+                    maxspeed = rnd.choice(['30', '50', '50', '70', None])
+                    if maxspeed is not None:
+                        data['maxspeed'] = maxspeed
+                    G.add_edge(i * side + j, a * side + b, **data)
+                    G.add_edge(a * side + b, i * side + j, **data)
+    return G
@@ -0,0 +1,182 @@
+import sys
+import time
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from route_optimization import STOP_TIME
+
+
+def csr_from_adjacency(adjacency):
+    """
+    Converts an adjacency from route_optimization.build_adjacency to CSR arrays.
+    Returns a dict with node_ids, index_of (OSM id -> int), indptr, indices and per edge
+    the search weight, length and travel time.
+    """
+    all_ids = list(adjacency)
+    for edges in adjacency.values():
+        all_ids.extend(v for v, weight, length, edge_time in edges)
+    node_ids = np.array(list(dict.fromkeys(all_ids)), dtype=np.int64)
+    index_of = {node: i for i, node in enumerate(node_ids.tolist())}
+
+    rows, cols, weights, lengths, times = [], [], [], [], []
+    for u, edges in adjacency.items():
+        for v, weight, length, edge_time in edges:
+            rows.append(index_of[u])
+            cols.append(index_of[v])
+            weights.append(weight)
+            lengths.append(length)
+            times.append(edge_time)
+    rows = np.array(rows, dtype=np.int64)
+    cols = np.array(cols, dtype=np.int64)
+
+    # Sort edges by (row, col) so each row of the CSR arrays is contiguous and searchable
+    order = np.lexsort((cols, rows))
+    rows, cols = rows[order], cols[order]
+    indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(node_ids)), out=indptr[1:])
+
+    return {
+        "node_ids": node_ids,
+        "index_of": index_of,
+        "indptr": indptr,
+        "indices": cols,
+        "edge_keys": rows * len(node_ids) + cols,
+        "weight": np.array(weights)[order],
+        "length": np.array(lengths)[order],
+        "travel_time": np.array(times)[order],
+    }
+
+
+def accumulate_along_tree(predecessors, edge_values):
+    """
+    Sums edge_values along the shortest path tree given by predecessors (one row per source).
+    edge_values holds the value of the edge from each node's predecessor to the node.
+    Uses pointer jumping, so it needs about log2(path length) vectorized passes.
+    """
+    totals = np.where(predecessors >= 0, edge_values, 0.0)
+    pointers = predecessors.copy()
+    active = pointers >= 0
+    while active.any():
+        safe = np.where(active, pointers, 0)
+        totals = totals + np.where(active, np.take_along_axis(totals, safe, axis=1), 0.0)
+        pointers = np.where(active, np.take_along_axis(pointers, safe, axis=1), -1)
+        active = pointers >= 0
+    return totals
+
+
+def csr_matrix_rows(csr, origins, nodes, batch_size=64):
+    """
+    Computes the time and distance rows for every origin against nodes with SciPy's compiled
+    Dijkstra on the CSR arrays. Nodes without a path are unreachable (inf), as in the python backend.
+    Returns two arrays of shape (len(origins), len(nodes)).
+    """
+    n = len(csr["node_ids"])
+    graph = csr_matrix((csr["weight"], csr["indices"], csr["indptr"]), shape=(n, n))
+    target_index = np.array([csr["index_of"].get(node, -1) for node in nodes], dtype=np.int64)
+    target_found = target_index >= 0
+
+    time_rows = np.full((len(origins), len(nodes)), np.inf)
+    distance_rows = np.full((len(origins), len(nodes)), np.inf)
+    origin_rows = [row for row, node in enumerate(origins) if node in csr["index_of"]]
+
+    for start in range(0, len(origin_rows), batch_size):
+        batch = origin_rows[start:start + batch_size]
+        sources = [csr["index_of"][origins[row]] for row in batch]
+        dist, predecessors = dijkstra(graph, directed=True, indices=sources, return_predecessors=True)
+
+        # Position of the edge predecessor -> node in the CSR arrays
+        reached = predecessors >= 0
+        keys = np.where(reached, predecessors.astype(np.int64) * n + np.arange(n), 0)
+        edge_position = np.minimum(np.searchsorted(csr["edge_keys"], keys), len(csr["edge_keys"]) - 1)
+
+        times = accumulate_along_tree(predecessors, csr["travel_time"][edge_position])
+        lengths = accumulate_along_tree(predecessors, csr["length"][edge_position])
+
+        columns = target_index[target_found]
+        batch_times = np.where(np.isinf(dist[:, columns]), np.inf, times[:, columns] + STOP_TIME)
+        batch_lengths = np.where(np.isinf(dist[:, columns]), np.inf, lengths[:, columns])
+        time_rows[np.ix_(batch, np.flatnonzero(target_found))] = batch_times
+        distance_rows[np.ix_(batch, np.flatnonzero(target_found))] = batch_lengths
+
+    # No travel for the same node
+    same = np.array(origins, dtype=object)[:, None] == np.array(nodes, dtype=object)[None, :]
+    time_rows[same] = 0
+    distance_rows[same] = 0
+    return time_rows, distance_rows
+
+
+def networkx_matrix_rows(G, origins, nodes, default_speed_kph=50):
+    """
+    The matrices the way they were computed before the Dijkstra backends: NetworkX shortest
+    paths by length, with the time and distance summed over the first parallel edge of each hop.
+    Slow, only used as the baseline in benchmark_backends.
+    """
+    import networkx as nx
+    from graph_preprocessing import add_travel_times
+    from route_optimization import DRIVE_TIME_FACTOR
+
+    add_travel_times(G, default_speed_kph)
+    time_rows = np.full((len(origins), len(nodes)), np.inf)
+    distance_rows = np.full((len(origins), len(nodes)), np.inf)
+    for row, node_u in enumerate(origins):
+        paths = nx.single_source_dijkstra_path(G, node_u, weight='length')
+        for column, node_v in enumerate(nodes):
+            if node_u == node_v:
+                time_rows[row, column] = distance_rows[row, column] = 0
+            elif node_v in paths:
+                path = paths[node_v]
+                edges = [G.get_edge_data(u, v)[0] for u, v in zip(path, path[1:])]
+                time_rows[row, column] = sum(data['travel_time_s'] for data in edges) * DRIVE_TIME_FACTOR + STOP_TIME
+                distance_rows[row, column] = sum(data['length'] for data in edges)
+    return time_rows, distance_rows
+
+
+def benchmark_backends(G, nodes, default_speed_kph=50):
+    """
+    Times the python and csr matrix backends on G for nodes against the NetworkX baseline
+    and prints their largest difference from it.
+    """
+    from graph_snapshot import networkx_graph
+    from route_optimization import build_adjacency, matrix_rows, graph_csr
+
+    start = time.perf_counter()
+    baseline_times, baseline_distances = networkx_matrix_rows(networkx_graph(G), nodes, nodes, default_speed_kph)
+    baseline_seconds = time.perf_counter() - start
+
+    adjacency = build_adjacency(G, default_speed_kph)
+    start = time.perf_counter()
+    python_times, python_distances = matrix_rows(adjacency, nodes, nodes)
+    python_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    csr = graph_csr(G, default_speed_kph)
+    conversion_seconds = time.perf_counter() - start
+    csr_times, csr_distances = matrix_rows(adjacency, nodes, nodes, backend="csr", csr=csr)
+    csr_seconds = time.perf_counter() - start - conversion_seconds
+
+    finite = np.isfinite(baseline_times)
+    print(f"{len(nodes)} nodes, {G.number_of_nodes()} graph nodes")
+    print(f"networkx baseline: {baseline_seconds:.3f} s")
+    for name, seconds, times, distances in (("python", python_seconds, python_times, python_distances),
+                                            ("csr", csr_seconds, csr_times, csr_distances)):
+        note = f" + {conversion_seconds:.3f} s conversion, once per graph" if name == "csr" else ""
+        print(f"{name:6} backend   : {seconds:.3f} s{note} ({baseline_seconds / seconds:.0f}x), "
+              f"max difference {np.abs(baseline_times[finite] - times[finite]).max():.6f} s, "
+              f"{np.abs(baseline_distances[finite] - distances[finite]).max():.6f} m, "
+              f"same unreachable pairs: {bool((np.isfinite(times) == finite).all())}")
+
+
+if __name__ == '__main__':
+    # Jämför backends med NetworkX på ett syntetiskt rutnät: python Project/csr_graph.py [sida] [antal noder]
+    import networkx as nx
+
+    side = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    G = nx.MultiDiGraph(nx.grid_2d_graph(side, side).to_directed())
+    G = nx.convert_node_labels_to_integers(G)
+    rng = np.random.default_rng(0)
+    for u, v, data in G.edges(data=True):
+        data['length'] = float(rng.uniform(50, 300))
+        data['maxspeed'] = str(rng.choice([30, 50, 70]))
+    benchmark_backends(G, rng.choice(G.number_of_nodes(), count, replace=False).tolist())
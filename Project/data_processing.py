@@ -1,20 +1,54 @@
+import numpy as np
 import pandas as pd
 
-def ladda_data(file_path):
+from workbook_cache import load_workbook, WORKBOOK_CACHE_DIR
+from address_registry import load_address_registry
+
+# Bit of every constraint and capability name, so compatibility can be checked with integer masks.
+# Names that are not in the table get OKÄND_KRAV, which no medarbetare has.
+KRAV = ['license', 'smoker', 'dog', 'cat', '>18', 'man', 'woman', 'medication', 'insulin', 'stoma',
+        'double_staffing', 'shower', 'activation', 'dog_friendly', 'cat_friendly']
+KRAV_BIT = {namn: 1 << bit for bit, namn in enumerate(KRAV)}
+OKÄND_KRAV = 1 << len(KRAV)
+
+def ladda_data(file_path, cache_dir=WORKBOOK_CACHE_DIR):
     """
     Load Excel data and return a dictionary of dataframes.
+    The sheets are parsed once and then read from the workbook cache in cache_dir.
     """
-    # Load the Excel file from the given file path
-    excel_data = pd.ExcelFile(file_path)
-    
-    # Parse the sheets into separate dataframes
+    sheets = load_workbook(file_path, cache_dir)
+
     data = {
-        'brukare': excel_data.parse('Individer, brukare', header=1),
-        'medarbetare': excel_data.parse('Medarbetare', header=2)
+        'brukare': sheets['brukare'],
+        'medarbetare': sheets['medarbetare']
     }
 
     return data
 
+def ladda_koordinater(file_path, cache_dir=WORKBOOK_CACHE_DIR):
+    """
+    Load the bounding box (north, south, east, west) of the area from the Koordinater sheet.
+    """
+    coordinates_df = load_workbook(file_path, cache_dir)['koordinater']
+    return tuple(float(c) for c in coordinates_df.iloc[:, 1])
+
+def krav_mask(krav):
+    """
+    Encodes a Series of comma separated constraint or capability names as integer bitmasks.
+    Empty names mean no requirement.
+    """
+    dummies = krav.fillna('').astype(str).str.get_dummies(sep=',')
+    if dummies.empty:
+        return pd.Series(0, index=krav.index, dtype=np.int64)
+    bitar = np.array([KRAV_BIT.get(namn.strip(), OKÄND_KRAV) if namn.strip() else 0 for namn in dummies.columns], dtype=np.int64)
+    return pd.Series(np.bitwise_or.reduce(dummies.to_numpy(dtype=np.int64) * bitar, axis=1), index=krav.index)
+
+def krav_namn(mask):
+    """
+    Returns the names of the bits set in mask.
+    """
+    return [namn for namn in KRAV if mask & KRAV_BIT[namn]] + (['unknown'] if mask & OKÄND_KRAV else [])
+
 def rensa_brukar_data(brukare_df):
     """
     Cleans brukare data by filtering rows, converting boolean columns, and setting up constraints.
@@ -67,6 +101,7 @@ def rensa_brukar_data(brukare_df):
         'shower' if row.get('Dusch', False) else '',
         'activation' if row.get('Aktivering', False) else ''
     ])).strip(','), axis=1)
+    brukare_df['ConstraintMask'] = krav_mask(brukare_df['Constraints'])
 
     return brukare_df
 
@@ -101,6 +136,7 @@ def rensa_medarb_data(medarbetare_df):
         'stoma' if row['Stomidelegering'] else '',
         '>18' if row['18 år el mer'] else ''
     ]).strip(','), axis=1)
+    medarbetare_df['CapabilityMask'] = krav_mask(medarbetare_df['Capabilities'])
 
     return medarbetare_df
 
@@ -110,23 +146,8 @@ def read_addresses(file_path):
     :param file_path: Path to the address file
     :return: List of tuples containing address and coordinates (latitude, longitude)
     """
-    addresses = []
-    with open(file_path, 'r') as file:
-        for line in file:
-            try:
-                # Extract the address and coordinates by splitting the line based on the comma that separates address and coordinates
-                parts = line.split(", ", 1)  # Split only on the first comma
-                address_part = parts[0].split('. ', 1)[1]  # Split by '. ' to remove the initial numbering
-                coordinates = eval(parts[1].strip())  # Evaluate the string to a tuple (64.754, 21.046)
-
-                # Check if the parsed coordinates are valid
-                if isinstance(coordinates, tuple) and len(coordinates) == 2:
-                    addresses.append((address_part, coordinates))
-                else:
-                    print(f"Invalid coordinates format for address: {address_part}")
-            except (SyntaxError, IndexError, NameError, TypeError) as e:
-                print(f"Error parsing coordinates for line: {line.strip()}, Error: {e}")
-    return addresses
+    registry = load_address_registry(file_path)
+    return list(zip(registry["Adress"], zip(registry["Latitude"].tolist(), registry["Longitude"].tolist())))
 
 
 def assign_addresses_to_brukare(brukare_df, addresses):
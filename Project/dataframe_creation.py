@@ -1,7 +1,54 @@
-from data_processing import ladda_data
+from data_processing import ladda_data, krav_mask
+from address_registry import load_address_registry, attach_addresses
+from metrics import span
 import pandas as pd
+import numpy as np
 import re
 
+DATA_FIL = "Project/data/Studentuppgift fiktiv planering.xlsx"
+ADRESS_FIL = "Project/data/UppdateradeAddresser.txt"
+
+#Alla tidsfönster med regex för hur de skrivs i brukardatan
+TIDSFÖNSTER = [("Morgon","7-9"), ("Förmiddag","9-11"), ("Lunch","11-13"), ("Eftermiddag","13-15"), ("Middag","15-17"), ("Tidig kväll","17-19"), ("Sen kväll","19-21")]
+REGEX_TID_MÖNSTER = [ r'\b[mM]org\b', r'\b[fF]m\b', r'\b[lL]unch\b',  r'\b[eE]m\b', r'\b[mM]iddag\b',
+                     r'\b[tT]idig kväll\b', r'\b[sS]en kväll\b']
+
+#De olika Regex för de olika dagarna
+REGEX_DAG_MÖNSTER = {"Måndag" : r'\b[mM]ån', "Tisdag" : r'\b[tT]is', "Onsdag" : r'\b[oO]ns', "Torsdag" : r'\b[tT]or', "Fredag" : r'\b[fF]re'}
+
+#Tidsfönstrena som ingår i förmiddags- och eftermiddagsskiften
+FM_TIDSFÖNSTER = ["Morgon", "Förmiddag", "Lunch", "Eftermiddag"]
+EM_TIDSFÖNSTER = ["Middag", "Tidig kväll", "Sen kväll"]
+
+
+#Krav som inte beror på tidsfönstret, namn och kolumnen i brukardatan
+FASTA_KRAV = {'license': 'Kräver körkort', 'smoker': 'Röker', 'dog': 'Har hund', 'cat': 'Har katt', '>18': 'Kräver >18'}
+
+#Krav som gäller i de tidsfönster som kolumnen nämner
+FÖNSTER_KRAV = {'medication': 'Behöver läkemedel', 'insulin': 'Behöver insulin', 'stoma': 'Har stomi'}
+
+
+def ja_kolumn(brukare_df, kolumn):
+    """
+    Sant för raderna där kolumnen är "Ja", falskt för alla om kolumnen saknas
+    """
+    if kolumn not in brukare_df.columns:
+        return pd.Series(False, index=brukare_df.index)
+    return brukare_df[kolumn].eq("Ja")
+
+
+def krav_sträng(krav_flaggor):
+    """
+    Input: krav_flaggor, dataframe med en boolesk kolumn per krav
+
+    Slår ihop de krav som är sanna till en kommaseparerad sträng per rad, i kolumnernas ordning
+    """
+    krav = pd.Series("", index=krav_flaggor.index, dtype=object)
+    for namn in krav_flaggor.columns:
+        krav = krav + np.where(krav_flaggor[namn], namn + ",", "")
+    return krav.str.rstrip(",").astype(str)
+
+
 def skapa_brukare_df(brukare_df,tidsfönsterna,regex_filters):
     """
     Input: brukare_df, Det ska vara datan direkt från "ladda_data" funktionen i data_processing
@@ -12,89 +59,55 @@ def skapa_brukare_df(brukare_df,tidsfönsterna,regex_filters):
     """
     brukare_df.rename(columns={'Unnamed: 0': 'Individ'}, inplace=True)
 
-    index = 0
-    tidsfönster_brukare_data = []
-    for tidsfönster in tidsfönsterna:
-        regex_filter = regex_filters[index]
+    fasta_krav = pd.DataFrame({namn: ja_kolumn(brukare_df, kolumn) for namn, kolumn in FASTA_KRAV.items()})
+
+    tidsfönster_dfs = []
+    for tidsfönster, regex_filter in zip(tidsfönsterna, regex_filters):
+        besök = brukare_df[tidsfönster[0]]
+
+        #Tar ut de individer som ska ha besök i detta tidsfönster, dubbelbemanning skrivs som 2*30 eller 30*2
+        är_sträng = besök.map(lambda x: isinstance(x, str))
+        dubbel = är_sträng & besök.where(är_sträng, "").str.fullmatch(r"\d+\*\d+")
+        har_besök = besök.map(lambda x: isinstance(x, int)) | dubbel
+
+        #Tar ut tiden för besöket, vid dubbelbemanning är det det största av talen
+        tid = besök[har_besök].copy()
+        dubbel_tid = besök[dubbel].str.split("*", expand=True)
+        if not dubbel_tid.empty:
+            tid[dubbel] = dubbel_tid.astype(int).max(axis=1)
+
         #Tar ut individers krav under detta tidsfönster
-        läkemedel = brukare_df[brukare_df["Behöver läkemedel"].str.contains(regex_filter, na=False)]
-        insulin = brukare_df[brukare_df["Behöver insulin"].str.contains(regex_filter, na=False)]
-        stomi = brukare_df[brukare_df["Har stomi"].str.contains(regex_filter, na=False)]
-        dubbelbemanning_df = brukare_df[brukare_df[tidsfönster[0]].str.contains(r'\*', na=False)]
-        
-        #Tar ut de individer som ska ha besök i detta tidsfönster
-        individer = brukare_df[brukare_df[tidsfönster[0]].apply(
-            lambda x: isinstance(x, int) or 
-            (isinstance(x, str) and bool(re.fullmatch(r"\d+\*\d+", x))))]
-
-        for index, row in individer.iterrows():
-            individ = row["Individ"]
-
-            if läkemedel["Individ"].str.contains(individ, regex = False).any() == True:
-                behöver_läkemedel = True
-            else:
-                behöver_läkemedel = False
-        
-            if insulin["Individ"].str.contains(individ, regex = False).any() == True:
-                behöver_insulin = True
-            else:
-                behöver_insulin = False
-
-            if stomi["Individ"].str.contains(individ, regex = False).any() == True:
-                har_stomi = True
-            else:
-                har_stomi = False
-            
-            if dubbelbemanning_df["Individ"].str.contains(individ, regex = False).any() == True:
-                dubbel_tid = row[tidsfönster[0]].split('*')
-                #Tar ut den tiden för besöket, hanterar olika format som 2*30 och 30*2
-                if int(dubbel_tid[0]) > int(dubbel_tid[1]):
-                    riktig_tid = int(dubbel_tid[0])
-                else:
-                    riktig_tid = int(dubbel_tid[1])
-                #Skapar en rad i dataframe för besöket som ska utföras. 
-                # Det blir dubbla rader nu eftersom det ska vara dubbelbemanning                
-                
-                dubbel = 2 #För att det är dubbelbemmaning
-                for i in range(dubbel):
-                    tidsfönster_brukare_data.append({
-                        "Individ": individ,
-                        "Tid": riktig_tid,
-                        "Tidsfönster": tidsfönster,
-                        "Constraints": ",".join(filter(None,
-                            ['license' if row.get('Kräver körkort', False) == "Ja" else '',
-                            'smoker' if row.get('Röker', False) == "Ja" else  '',
-                            'dog' if row.get('Har hund', False) == "Ja" else '',
-                            'cat' if row.get('Har katt', False) == "Ja" else '',
-                            '>18' if row.get('Kräver >18', False) == "Ja"else '',
-                            'medication' if behöver_läkemedel else '',
-                            'insulin' if behöver_insulin else '',
-                            'stoma' if har_stomi else '']
-                        )).strip(',')
-                    })
-                 
-            else:
-                #Skapar en rad i dataframen för besöket som ska utföras
-                
-                tidsfönster_brukare_data.append({
-                        "Individ": individ,
-                        "Tid": row[tidsfönster[0]],
-                        "Tidsfönster": tidsfönster,
-                        "Constraints": ",".join(filter(None,
-                            ['license' if row.get('Kräver körkort', False) == "Ja" else '',
-                            'smoker' if row.get('Röker', False) == "Ja" else '',
-                            'dog' if row.get('Har hund', False) == "Ja" else '',
-                            'cat' if row.get('Har katt', False) == "Ja" else '',
-                            '>18' if row.get('Kräver >18', False) == "Ja" else '',
-                            'medication' if behöver_läkemedel else '',
-                            'insulin' if behöver_insulin else '',
-                            'stoma' if har_stomi else '']
-                        )).strip(',')
-                    })
-        
-        index =+ 1
-
-    return pd.DataFrame(tidsfönster_brukare_data)
+        krav_flaggor = fasta_krav[har_besök].copy()
+        for namn, kolumn in FÖNSTER_KRAV.items():
+            krav_flaggor[namn] = brukare_df.loc[har_besök, kolumn].str.contains(regex_filter, na=False)
+
+        tidsfönster_df = pd.DataFrame({
+            "Individ": brukare_df.loc[har_besök, "Individ"],
+            "Tid": tid.astype(np.int64),
+            "Tidsfönster": [tidsfönster] * int(har_besök.sum()),
+            "Constraints": krav_sträng(krav_flaggor),
+        })
+
+        #Dubbelbemanning ger två rader för besöket
+        tidsfönster_dfs.append(tidsfönster_df.loc[tidsfönster_df.index.repeat(np.where(dubbel[har_besök], 2, 1))])
+
+    tidsfönster_brukare_df = pd.concat(tidsfönster_dfs, ignore_index=True)
+    tidsfönster_brukare_df["ConstraintMask"] = krav_mask(tidsfönster_brukare_df["Constraints"])
+    return tidsfönster_brukare_df
+
+
+def extra_besök(brukare_df, kolumn, regex):
+    """
+    Input: brukare_df, brukare delen av data från ladda_data
+    kolumn, "Dusch" eller "Aktivering"
+    regex, filter för dagen
+
+    Tar ut individerna som behöver kolumnens besök under dagen och tiden det tar,
+    första tvåsiffriga talet i kolumnen eller 30 min om det inte finns någon bestämd tid
+    """
+    behov_df = brukare_df[brukare_df[kolumn].str.contains(regex, na=False)]
+    tid = behov_df[kolumn].str.extract(r'\b(\d{2})\b', expand=False).astype(float).fillna(30).astype(np.int64)
+    return behov_df.assign(Tid=tid).set_index("Individ")
 
 
 def skapa_brukare_dag_df(brukare_df, brukare_tidsfönster_df, regex):
@@ -105,165 +118,140 @@ def skapa_brukare_dag_df(brukare_df, brukare_tidsfönster_df, regex):
 
     Skapar en dataframe för den dagens regex filter som man kaller på den med
     """
+    brukare_tidsfönster_df = brukare_tidsfönster_df.copy()
+    nyckel = pd.MultiIndex.from_arrays([brukare_tidsfönster_df["Individ"], brukare_tidsfönster_df["Tidsfönster"].str[0]])
+
+    #Uppdaterar för dusch villkor, duschen läggs på förmiddagsbesöket
+    dusch = extra_besök(brukare_df, "Dusch", regex)
+    dusch["man"] = dusch["Kräver man"].astype(str).str.contains("vid dusch", regex=False)
+    dusch["woman"] = dusch["Kräver kvinna"].astype(str).str.contains("vid dusch", regex=False)
+    dusch.index = pd.MultiIndex.from_product([dusch.index, ["Förmiddag"]])
+
+    #Förlänger de förmiddagsbesök som redan finns och lägger till könskraven
+    träff = nyckel.isin(dusch.index)
+    dusch_träff = dusch.reindex(nyckel[träff])
+    brukare_tidsfönster_df.loc[träff, "Tid"] += dusch_träff["Tid"].to_numpy()
+    brukare_tidsfönster_df.loc[träff, "Constraints"] = (brukare_tidsfönster_df.loc[träff, "Constraints"]
+        + np.where(dusch_träff["man"], ",man", "") + np.where(dusch_träff["woman"], ",woman", "")).str.strip(",")
+
+    #Individer utan förmiddagsbesök får ett nytt besök
+    nya_dusch = dusch[~dusch.index.isin(nyckel)]
+    nya_dusch_df = pd.DataFrame({
+        "Individ": nya_dusch.index.get_level_values(0),
+        "Tid": nya_dusch["Tid"].to_numpy(),
+        "Tidsfönster": [("Förmiddag","9-11")] * len(nya_dusch),
+        "Constraints": krav_sträng(pd.DataFrame(
+            {**{namn: ja_kolumn(nya_dusch, kolumn) for namn, kolumn in FASTA_KRAV.items()},
+             "man": nya_dusch["man"], "woman": nya_dusch["woman"]})).to_numpy()})
+
+    #Uppdaterar för aktiverings villkor, aktiveringen läggs på eftermiddagsbesöket
+    aktivering = extra_besök(brukare_df, "Aktivering", regex)
+    aktivering.index = pd.MultiIndex.from_product([aktivering.index, ["Eftermiddag"]])
+
+    träff = nyckel.isin(aktivering.index)
+    brukare_tidsfönster_df.loc[träff, "Tid"] += aktivering["Tid"].reindex(nyckel[träff]).to_numpy()
+
+    nya_aktivering = aktivering[~aktivering.index.isin(nyckel)]
+    nya_aktivering_df = pd.DataFrame({
+        "Individ": nya_aktivering.index.get_level_values(0),
+        "Tid": nya_aktivering["Tid"].to_numpy(),
+        "Tidsfönster": [("Eftermiddag","13-15")] * len(nya_aktivering),
+        "Constraints": krav_sträng(pd.DataFrame(
+            {namn: ja_kolumn(nya_aktivering, kolumn) for namn, kolumn in FASTA_KRAV.items()})).to_numpy()})
+
+    brukare_tidsfönster_df = pd.concat([brukare_tidsfönster_df, nya_dusch_df, nya_aktivering_df], ignore_index=True)
+
+    #Kraven har ändrats av dusch och aktivering, så bitmaskerna räknas om
+    brukare_tidsfönster_df["ConstraintMask"] = krav_mask(brukare_tidsfönster_df["Constraints"])
+    return brukare_tidsfönster_df
 
-    tid_regex = r'\b\d{2}\b'
-    #Uppdaterar för dusch villkor
-    dusch_behov_df = brukare_df[brukare_df["Dusch"].str.contains(regex, na=False)]
-    #Itererar över de individer som ska ha dusch besök och sätter in det på förmiddagen
-    for index, row in dusch_behov_df.iterrows():
-        
-        dusch_tid = re.search(tid_regex,row["Dusch"])
-        if dusch_tid == None:
-            #Om det inte finns en bestämd duschtid så sätts det till 30 min
-            dusch_tid = 30
-        else:
-            dusch_tid = int(dusch_tid.group())
-        
-        krav_på_man = "vid dusch" in str(row["Kräver man"])
-        krav_på_kvinna = "vid dusch" in str(row["Kräver kvinna"])
-
-
-        #Kollar om ett besök redan ska ske på förmiddagen, om inte så lägger vi in ett nytt
-        if row["Individ"] in brukare_tidsfönster_df[brukare_tidsfönster_df["Tidsfönster"].apply(lambda x: x[0] == "Förmiddag")]["Individ"].values:
-            #Uppdaterar tiden för besöket
-            orginal_besökstid = brukare_tidsfönster_df.loc[
-                (brukare_tidsfönster_df["Tidsfönster"].apply(lambda x: x[0] == "Förmiddag")) & 
-                (brukare_tidsfönster_df["Individ"] == row["Individ"]), "Tid"].values
-            
-            ny_besökstid = [int(tid) + dusch_tid for tid in orginal_besökstid]
-
-            orginal_constraints = brukare_tidsfönster_df.loc[(
-                brukare_tidsfönster_df["Tidsfönster"].apply(lambda x: x[0] =="Förmiddag")) & (
-                brukare_tidsfönster_df["Individ"] == row["Individ"]), "Constraints"].values
-            
-            new_constraints = ",".join(filter(None,[str(orginal_constraints).strip("[]\'"), 
-                                    'man' if krav_på_man else '',
-                                    'woman' if krav_på_kvinna else '']
-                                    )).strip(',')
-
-            brukare_tidsfönster_df.loc[(
-                brukare_tidsfönster_df["Tidsfönster"].apply(lambda x: x[0] =="Förmiddag")) & (
-                brukare_tidsfönster_df["Individ"] == row["Individ"]), "Tid"] = ny_besökstid
-            
-            brukare_tidsfönster_df.loc[(
-                brukare_tidsfönster_df["Tidsfönster"].apply(lambda x: x[0] =="Förmiddag")) & (
-                brukare_tidsfönster_df["Individ"] == row["Individ"]), "Constraints"] = new_constraints
-        else:
-            nytt_besök = pd.DataFrame([{
-                "Individ": row["Individ"],
-                "Tid": dusch_tid,
-                "Tidsfönster": ("Förmiddag","9-11"),
-                "Constraints": ",".join(filter(None,
-                            ['license' if row.get('Kräver körkort', False) == "Ja" else '',
-                            'smoker' if row.get('Röker', False) == "Ja" else '',
-                            'dog' if row.get('Har hund', False) == "Ja" else '',
-                            'cat' if row.get('Har katt', False) == "Ja" else '',
-                            '>18' if row.get('Kräver >18', False) == "Ja" else '',
-                            'man' if krav_på_man else '',
-                            'woman' if krav_på_kvinna else '']
-                            )).strip(',')}])
-            
-            brukare_tidsfönster_df = pd.concat([brukare_tidsfönster_df, nytt_besök], ignore_index=True)
-
-    #Uppdaterar för aktiverings villkor
-    aktiverings_behov_df = brukare_df[brukare_df["Aktivering"].str.contains(regex, na=False)]
-    for index, row in aktiverings_behov_df.iterrows():
-        aktiverings_tid = re.search(tid_regex,row["Aktivering"])
-        if aktiverings_tid == None:
-            #Om det inte finns en bestämd aktiveringstid så sätts det till 30 min
-            aktiverings_tid = 30
-        else:
-            aktiverings_tid = int(aktiverings_tid.group())
-              #Kollar om ett besök redan ska ske på förmiddagen, om inte så lägger vi in ett nytt
-        
-        if row["Individ"] in brukare_tidsfönster_df[brukare_tidsfönster_df["Tidsfönster"].apply(lambda x: x[0] == "Eftermiddag")]["Individ"].values:
-            #Uppdaterar tiden för besöket
-            orginal_besökstid = brukare_tidsfönster_df.loc[(
-                brukare_tidsfönster_df["Tidsfönster"].apply(lambda x: x[0]=="Eftermiddag")) & (
-                brukare_tidsfönster_df["Individ"] == row["Individ"]), "Tid"].values
-            
-            ny_besökstid = orginal_besökstid + aktiverings_tid
-
-            brukare_tidsfönster_df.loc[(
-                brukare_tidsfönster_df["Tidsfönster"].apply(lambda x: x[0]=="Eftermiddag")) & (
-                brukare_tidsfönster_df["Individ"] == row["Individ"]), "Tid"] = ny_besökstid
-
-        else:
-
-            nytt_besök = pd.DataFrame([{
-                "Individ": row["Individ"],
-                "Tid": aktiverings_tid,
-                "Tidsfönster": ("Eftermiddag","13-15"),
-                "Constraints": ",".join(filter(None,
-                            ['license' if row.get('Kräver körkort', False) == "Ja" else '',
-                            'smoker' if row.get('Röker', False) == "Ja" else '',
-                            'dog' if row.get('Har hund', False) == "Ja" else '',
-                            'cat' if row.get('Har katt', False) == "Ja" else '',
-                            '>18' if row.get('Kräver >18', False) == "Ja" else '']
-                            )).strip(',')}])
-            
-            brukare_tidsfönster_df = pd.concat([brukare_tidsfönster_df, nytt_besök], ignore_index=True)  
+def addera_adress_till_df(fil,brukare_tidsfönster_df):
+    """
+    Input: fil, adressfilen med en rad per individ
+    brukare_tidsfönster_df, dataframe med besöken
 
-    return brukare_tidsfönster_df
+    Lägger till adress och koordinater för varje besök
+    """
+    return attach_addresses(brukare_tidsfönster_df, load_address_registry(fil))
 
-def addera_adress_till_df(fil,brukare_tidsfönster_df):   
-    adress_till_koordinater = {}
-    individ_till_adress = {}
-    individ_num = 1
+def skapa_veckomodell(data=None, adress_fil=ADRESS_FIL):
+    """
+    Input: data, datan från ladda_data, laddas från DATA_FIL om den inte ges
+    adress_fil, adressfilen med en rad per individ
 
-    with open(fil, 'r') as f:
-        for line in f:
-            #Delar upp adresserna i aderss och koordinater
-            parts = line.strip().split(", ")
-            adress = parts[0]
-            adress = adress.split(".")[1].strip(" ")
-            latitude =  float, parts[1].strip("()").split(", ")
-            longitude = float, parts[2].strip("()").split(", ")
-            individ = "Individ "+ str(individ_num)
-            #Skapar en dict för adrss kopplat till koordinater
-            adress_till_koordinater[adress] = {"Latitude": latitude, "Longitude": longitude}
-            individ_till_adress[individ] = adress
-            individ_num += 1
+    Gör det som inte beror på dagen en gång: besöken i alla tidsfönster från skapa_brukare_df
+    och adresserna från adress_fil.
+    Dagarnas dataframes skapas sedan med dag_df som bara lägger på dagens dusch och aktivering
+    """
+    if data is None:
+        data = ladda_data(DATA_FIL)
 
-    brukare_tidsfönster_df["Individ"] = brukare_tidsfönster_df["Individ"].str.strip()
+    #Skapar dicts för alla olika tidsfönster som besök kan ske med data om brukare
+    with span("skapa_brukare_df"):
+        brukare_tidsfönster_df = skapa_brukare_df(data["brukare"], TIDSFÖNSTER, REGEX_TID_MÖNSTER)
 
-    #Nu adderar vi adress och koordinater till dataframe för dagen
-    brukare_tidsfönster_df["Adress"] = brukare_tidsfönster_df["Individ"].map(individ_till_adress)
-    brukare_tidsfönster_df["Latitude"] = brukare_tidsfönster_df["Adress"].map(lambda x: adress_till_koordinater[x]["Latitude"])
-    brukare_tidsfönster_df["Longitude"] = brukare_tidsfönster_df["Adress"].map(lambda x: adress_till_koordinater[x]["Longitude"])
+    with span("load_address_registry"):
+        adresser = load_address_registry(adress_fil)
 
-    brukare_tidsfönster_df["Latitude"] = brukare_tidsfönster_df["Latitude"].apply(lambda x: x[1] if isinstance(x, tuple) else x)
-    brukare_tidsfönster_df["Longitude"] = brukare_tidsfönster_df["Longitude"].apply(lambda x: x[1] if isinstance(x, tuple) else x)
+    return {"brukare": data["brukare"], "brukare_tidsfönster": brukare_tidsfönster_df, "adresser": adresser}
 
-    brukare_tidsfönster_df["Latitude"] = brukare_tidsfönster_df["Latitude"].apply(lambda x: x[0] if isinstance(x, list) else x)
-    brukare_tidsfönster_df["Longitude"] = brukare_tidsfönster_df["Longitude"].apply(lambda x: x[0] if isinstance(x, list) else x)
 
+def dag_df(veckomodell, dag):
+    """
+    Input: veckomodell, från skapa_veckomodell
+    dag, veckodagen som schemat ska skapas för
 
-    return brukare_tidsfönster_df
+    Skapar dataframen med dagens besök, inklusive adress och koordinater
+    """
+    with span("skapa_brukare_dag_df"):
+        dag_df = skapa_brukare_dag_df(veckomodell["brukare"], veckomodell["brukare_tidsfönster"], REGEX_DAG_MÖNSTER[str(dag).title()])
 
-def dataframe_creation(dag):
+    with span("attach_addresses"):
+        return attach_addresses(dag_df, veckomodell["adresser"])
 
-    dag = str(dag)
 
-    # Test användning
-    data = ladda_data("project/data/Studentuppgift fiktiv planering.xlsx")
-    
-    
+def dataframe_creation(dag, data=None, adress_fil=ADRESS_FIL):
+    """
+    Input: dag, veckodagen som schemat ska skapas för
+    data, datan från ladda_data, laddas från DATA_FIL om den inte ges
+    adress_fil, adressfilen med en rad per individ
 
-    tidsfönster = [("Morgon","7-9"), ("Förmiddag","9-11"), ("Lunch","11-13"), ("Eftermiddag","13-15"), ("Middag","15-17"), ("Tidig kväll","17-19"), ("Sen kväll","19-21")]
-    regex_tid_mönster = [ r'\b[mM]org\b', r'\b[fF]m\b', r'\b[lL]unch\b',  r'\b[eE]m\b', r'\b[mM]iddag\b', 
-                         r'\b[tT]idig kväll\b', r'\b[sS]en kväll\b']
+    Skapar dataframen med dagens besök, inklusive adress och koordinater
+    """
+    return dag_df(skapa_veckomodell(data, adress_fil), dag)
 
-    #Skapar dicts för alla olika tidsfönster som besök kan ske med data om brukare
-    brukare_tidsfönster_df = skapa_brukare_df(data["brukare"], tidsfönster, regex_tid_mönster)
-
-    #De olika Regex för de olika dagarana
-    #TODO: detta kan göras mer andvändarvänligt med if statement eller mapping 
-    regex_dag_mönster = {"Måndag" : r'\b[mM]ån', "Tisdag" : r'\b[tT]is', "Onsdag" : r'\b[oO]ns', "Torsdag" : r'\b[tT]or', "Fredag" : r'\b[fF]re'}
-    
-    #Test med en mån dataframe
-    dag_df = skapa_brukare_dag_df(data["brukare"], brukare_tidsfönster_df, regex_dag_mönster[dag.title()])
-    
-    dag_df = addera_adress_till_df("Project/data/UppdateradeAddresser.txt", dag_df)
-
-    return dag_df
+
+def vecko_dfs(dagar=None, data=None, adress_fil=ADRESS_FIL):
+    """
+    Input: dagar, veckodagarna som ska skapas, alla i REGEX_DAG_MÖNSTER om de inte ges
+    data, datan från ladda_data, laddas från DATA_FIL om den inte ges
+    adress_fil, adressfilen med en rad per individ
+
+    Skapar dataframen för varje dag men gör skapa_brukare_df bara en gång
+    """
+    veckomodell = skapa_veckomodell(data, adress_fil)
+    return {dag: dag_df(veckomodell, dag) for dag in (dagar or REGEX_DAG_MÖNSTER)}
+
+
+def veckodag(text):
+    """
+    Input: text, början på en veckodag, t.ex. "mån" eller "Måndag"
+
+    Returnerar veckodagen som den heter i REGEX_DAG_MÖNSTER
+    """
+    for dag in REGEX_DAG_MÖNSTER:
+        if len(text) >= 3 and dag.lower().startswith(text.lower()):
+            return dag
+    raise ValueError(f"okänd dag {text!r}, ange mån-fre")
+
+
+def skift_df(brukare_dag_df, fm):
+    """
+    Input: brukare_dag_df, dataframe från dataframe_creation
+    fm, True för förmiddagsskiftet och False för eftermiddagsskiftet
+
+    Tar ut besöken i skiftets tidsfönster
+    """
+    skift_tidsfönster = FM_TIDSFÖNSTER if fm else EM_TIDSFÖNSTER
+    skift = brukare_dag_df[brukare_dag_df["Tidsfönster"].apply(lambda x: x[0] in skift_tidsfönster)]
+    return skift.reset_index(drop=True)
@@ -0,0 +1,374 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.cluster.vq import kmeans2
+
+from snapping import project, snap_to_nodes
+from metrics import span
+from route_optimization import (prepare_routing_inputs, solve_inputs, format_report, build_adjacency, node_matrices,
+                                cached_node_matrices, graph_csr, STOPS_PER_VEHICLE)
+
+VISITS_PER_CLUSTER = 80  # Default cluster size when the number of clusters is not given
+UNCOVERED_PENALTY = 100000  # Drop penalty of the visits in a cluster, large enough that only visits that do not fit are dropped
+REBALANCE_ROUNDS = 5  # Rounds of moving idle vehicles or dropped visits between the clusters
+RESOLVE_TIME_SHARE = 4  # Re-solves after the first solve of the clusters get time_limit / RESOLVE_TIME_SHARE
+RESOLVE_STAGNATION_SECONDS = 5  # and stop when they have not improved for this long
+
+
+def cluster_visits(brukare_df, n_clusters, seed=0):
+    """
+    Partitions the visits into n_clusters geographic clusters with k-means on projected coordinates.
+    Returns the cluster label of every row and the cluster centroids (in meters).
+    """
+    latitudes = brukare_df['Latitude'].astype("float").to_numpy()
+    longitudes = brukare_df['Longitude'].astype("float").to_numpy()
+    points = project(latitudes, longitudes, float(latitudes.mean()))
+    centroids, labels = kmeans2(points, n_clusters, minit='++', seed=seed)
+    return labels, centroids
+
+
+def split_medarbetare(inputs, labels, n_clusters):
+    """
+    Splits the vehicles over the clusters in proportion to the service time of the clusters.
+    Each cluster first gets vehicles that can serve its visits (using inputs["allowed_vehicles"]),
+    the rest fill up the clusters that are furthest below their share.
+    Returns a list with the vehicle ids of each cluster.
+    """
+    num_vehicles = inputs["num_vehicles"]
+    service_times = np.asarray(inputs["service_times"][1:], dtype=np.float64)
+    demand = np.bincount(labels, weights=service_times + 1, minlength=n_clusters)
+    share = demand / demand.sum() * num_vehicles
+
+    # Largest remainder, but at least one vehicle per cluster
+    targets = np.maximum(np.floor(share).astype(int), 1)
+    for cluster in np.argsort(-(share - np.floor(share))):
+        if targets.sum() >= num_vehicles:
+            break
+        targets[cluster] += 1
+
+    assigned = [[] for _ in range(n_clusters)]
+    free = set(range(num_vehicles))
+
+    # Coverage: pick the vehicle that can serve most of the still uncovered visits of the cluster
+    for cluster in np.argsort(-demand):
+        uncovered = [set(allowed) for node, allowed in enumerate(inputs["allowed_vehicles"][1:])
+                     if labels[node] == cluster and allowed is not None]
+        while uncovered and free and len(assigned[cluster]) < targets[cluster]:
+            best = max(sorted(free), key=lambda v: sum(v in allowed for allowed in uncovered))
+            if not any(best in allowed for allowed in uncovered):
+                break
+            assigned[cluster].append(best)
+            free.discard(best)
+            uncovered = [allowed for allowed in uncovered if best not in allowed]
+
+    # Fill up the clusters that are furthest below their share
+    for vehicle_id in sorted(free):
+        cluster = int(np.argmax(share - np.array([len(vehicles) for vehicles in assigned])))
+        assigned[cluster].append(vehicle_id)
+
+    # Every cluster needs a vehicle, a cluster without one could not be solved at all
+    for cluster in range(n_clusters):
+        if not assigned[cluster]:
+            donor = max(range(n_clusters), key=lambda other: len(assigned[other]))
+            if len(assigned[donor]) > 1:
+                assigned[cluster].append(assigned[donor].pop())
+
+    return assigned
+
+
+def subset_inputs(inputs, customer_nodes, vehicle_ids, matrices=None):
+    """
+    Returns routing inputs for the depot plus customer_nodes, served by vehicle_ids.
+    Every visit can be dropped with UNCOVERED_PENALTY, so a cluster always has a solution even if its
+    vehicles cannot fit all of its visits (rebalance_clusters moves vehicles to it then).
+    matrices is the (time_matrix, distance_matrix) of the depot and customer_nodes, taken from the
+    matrices of inputs if None.
+    """
+    node_index = [0] + list(customer_nodes)
+    local_vehicle = {vehicle_id: i for i, vehicle_id in enumerate(vehicle_ids)}
+    if matrices is None:
+        matrices = (np.asarray(inputs["time_matrix"], dtype=np.float64)[np.ix_(node_index, node_index)],
+                    np.asarray(inputs["distance_matrix"], dtype=np.float64)[np.ix_(node_index, node_index)])
+    time_matrix, distance_matrix = (np.asarray(matrix, dtype=np.float64) for matrix in matrices)
+
+    allowed_vehicles = [None]
+    drop_penalties = [None]
+    for node in customer_nodes:
+        allowed = inputs["allowed_vehicles"][node]
+        if allowed is None:
+            allowed_vehicles.append(None)
+            drop_penalties.append(inputs["drop_penalties"][node])
+            continue
+        # An empty list leaves only dropping the visit, until a vehicle that can serve it joins the cluster
+        allowed_vehicles.append([local_vehicle[v] for v in allowed if v in local_vehicle])
+        drop_penalties.append(UNCOVERED_PENALTY)
+
+    return {
+        "time_matrix": time_matrix.tolist(),
+        "distance_matrix": distance_matrix.tolist(),
+        "nodes": [inputs["nodes"][node] for node in node_index],
+        "time_windows": [inputs["time_windows"][node] for node in node_index],
+        "service_times": [inputs["service_times"][node] for node in node_index],
+        "allowed_vehicles": allowed_vehicles,
+        "drop_penalties": drop_penalties,
+        "individer": [inputs["individer"][node] for node in node_index],
+        "num_vehicles": len(vehicle_ids),
+        "shift_start": inputs["shift_start"],
+        "shift_end": inputs["shift_end"],
+    }
+
+
+def solve_sub_problem(args):
+    return solve_inputs(*args)
+
+
+def sub_problem(inputs, customer_nodes, vehicle_ids, current, time_limit, stagnation_seconds=None, matrices_for=None):
+    """
+    Returns the arguments of solve_sub_problem for customer_nodes served by vehicle_ids, starting from
+    the routes in current (vehicle id -> nodes of inputs) that stay within customer_nodes.
+    """
+    local_node = {node: i + 1 for i, node in enumerate(customer_nodes)}
+    initial_routes = [[local_node[node] for node in current.get(vehicle_id, []) if node in local_node]
+                      for vehicle_id in vehicle_ids] if current else None
+    matrices = None if matrices_for is None else matrices_for(customer_nodes)
+    return subset_inputs(inputs, customer_nodes, vehicle_ids, matrices), time_limit, initial_routes, stagnation_seconds
+
+
+def solve_sub_problems(pool, problems, groups):
+    """
+    Solves the sub_problem arguments in problems with pool (map if None), groups holds the
+    (customer_nodes, vehicle_ids) of each. Returns the reports mapped back to the full problem.
+    """
+    results = (map if pool is None else pool.map)(solve_sub_problem, problems)
+    return [to_global_report(report, customer_nodes, vehicle_ids)
+            for report, (customer_nodes, vehicle_ids) in zip(results, groups)]
+
+
+def to_global_report(report, customer_nodes, vehicle_ids):
+    """
+    Maps the node indices and vehicles of a sub-problem report back to the full problem.
+    """
+    if report is None:
+        return None
+    node_index = [0] + list(customer_nodes)
+    timetable = {}
+    for local_vehicle, schedule in report["timetable"].items():
+        vehicle_id = vehicle_ids[local_vehicle - 1]
+        timetable[vehicle_id + 1] = [dict(entry, Vehicle=vehicle_id + 1, Node=node_index[entry['Node']])
+                                     for entry in schedule]
+    return {
+        "objective": report["objective"],
+        "routes": {vehicle_ids[v]: [node_index[node] for node in route] for v, route in report["routes"].items()},
+        "timetable": timetable,
+        "summary": dict(report["summary"]),
+    }
+
+
+def merge_reports(reports):
+    """
+    Merges the reports of disjoint sub-problems into one report, None if no sub-problem was solved.
+    """
+    if all(report is None for report in reports):
+        return None
+    merged = {"objective": 0, "routes": {}, "timetable": {}, "summary": {}}
+    for report in reports:
+        if report is None:
+            continue
+        merged["objective"] += report["objective"]
+        merged["routes"].update(report["routes"])
+        merged["timetable"].update(report["timetable"])
+        for name, value in report["summary"].items():
+            merged["summary"][name] = merged["summary"].get(name, 0) + value
+    return merged
+
+
+def neighbour_pairs(centroids):
+    """
+    Returns the pairs of clusters where one is the nearest other cluster of the other.
+    """
+    pairs = set()
+    for cluster, centroid in enumerate(centroids):
+        distances = np.linalg.norm(centroids - centroid, axis=1)
+        distances[cluster] = np.inf
+        if np.isfinite(distances).any():
+            pairs.add(tuple(sorted((cluster, int(np.argmin(distances))))))
+    return sorted(pairs)
+
+
+def repair_boundaries(inputs, clusters, reports, centroids, time_limit, stagnation_seconds=None, matrices_for=None,
+                      pool=None):
+    """
+    Re-solves pairs of neighbouring clusters together, starting from their current routes,
+    and keeps the joint routes if they are cheaper. The pairs share no cluster, so they are solved
+    in parallel and a merged cluster never grows again (pairs with a cluster already taken are skipped).
+    clusters and reports are updated in place, see sub_problem for the other arguments.
+    """
+    pairs = []
+    taken = set()
+    for a, b in neighbour_pairs(centroids):
+        if a in taken or b in taken or reports[a] is None or reports[b] is None:
+            continue
+        taken.update((a, b))
+        pairs.append((a, b))
+
+    groups = [(clusters[a][0] + clusters[b][0], clusters[a][1] + clusters[b][1]) for a, b in pairs]
+    problems = [sub_problem(inputs, customer_nodes, vehicle_ids, {**reports[a]["routes"], **reports[b]["routes"]},
+                            time_limit, stagnation_seconds, matrices_for)
+                for (a, b), (customer_nodes, vehicle_ids) in zip(pairs, groups)]
+    for (a, b), group, joint in zip(pairs, groups, solve_sub_problems(pool, problems, groups)):
+        if joint is not None and joint["objective"] < reports[a]["objective"] + reports[b]["objective"]:
+            print(f"Boundary repair of clusters {a} and {b} saved {reports[a]['objective'] + reports[b]['objective'] - joint['objective']}")
+            clusters[a] = group
+            clusters[b] = ([], [])
+            reports[a] = joint
+            reports[b] = None
+
+
+def dropped_visits(inputs, customer_nodes, report):
+    """
+    Returns the visits of customer_nodes that report does not serve, leaving out the visits
+    no medarbetare can serve.
+    """
+    served = set() if report is None else {node for route in report["routes"].values() for node in route}
+    return [node for node in customer_nodes if node not in served and inputs["allowed_vehicles"][node] is not None]
+
+
+def resolve_clusters(inputs, clusters, reports, cluster_ids, time_limit, stagnation_seconds=None, matrices_for=None,
+                     pool=None):
+    """
+    Solves the clusters in cluster_ids again in parallel, each starting from its current routes,
+    and keeps the new reports that have a solution.
+    """
+    groups = [clusters[cluster] for cluster in cluster_ids]
+    problems = [sub_problem(inputs, customer_nodes, vehicle_ids,
+                            {} if reports[cluster] is None else reports[cluster]["routes"],
+                            time_limit, stagnation_seconds, matrices_for)
+                for cluster, (customer_nodes, vehicle_ids) in zip(cluster_ids, groups)]
+    for cluster, report in zip(cluster_ids, solve_sub_problems(pool, problems, groups)):
+        if report is not None:
+            reports[cluster] = report
+
+
+def rebalance_clusters(inputs, clusters, reports, centroids, time_limit, stagnation_seconds=None, matrices_for=None,
+                       pool=None):
+    """
+    Serves the visits the clusters drop. The clusters with dropped visits, most dropped first, get the
+    idle vehicles (without a route) of the clusters without dropped visits that can serve them and are
+    solved again. The dropped visits of a cluster that this does not help, for example evening visits a
+    vehicle cannot reach without earlier stops, move to the nearest other cluster instead. A visit moves
+    at most once, so visits no cluster can fit are left dropped. Every round solves the clusters it
+    changed in parallel, at most REBALANCE_ROUNDS rounds. clusters and reports are updated in place.
+    """
+    moved = set()
+
+    def still_dropped(cluster):
+        return [node for node in dropped_visits(inputs, clusters[cluster][0], reports[cluster]) if node not in moved]
+
+    for _ in range(REBALANCE_ROUNDS):
+        dropped = [still_dropped(cluster) for cluster in range(len(clusters))]
+        shorts = sorted((cluster for cluster in range(len(clusters)) if dropped[cluster]),
+                        key=lambda cluster: -len(dropped[cluster]))
+        if not shorts:
+            return
+
+        idle = [(cluster, vehicle_id) for cluster, ((_, vehicle_ids), report) in enumerate(zip(clusters, reports))
+                if not dropped[cluster]
+                for vehicle_id in vehicle_ids if report is None or vehicle_id not in report["routes"]]
+        helped = []
+        for short in shorts:
+            # The idle vehicles that can serve most of the dropped visits first
+            useful = sorted(((sum(vehicle_id in inputs["allowed_vehicles"][node] for node in dropped[short]), cluster,
+                              vehicle_id) for cluster, vehicle_id in idle), reverse=True)
+            useful = [(cluster, vehicle_id) for served, cluster, vehicle_id in useful if served > 0]
+            useful = useful[:math.ceil(len(dropped[short]) / (STOPS_PER_VEHICLE - 1))]
+            for cluster, vehicle_id in useful:
+                idle.remove((cluster, vehicle_id))
+                clusters[cluster][1].remove(vehicle_id)
+                clusters[short][1].append(vehicle_id)
+            if useful:
+                print(f"Moved {len(useful)} idle vehicles to cluster {short} for its {len(dropped[short])} dropped visits")
+                helped.append(short)
+        resolve_clusters(inputs, clusters, reports, helped, time_limit, stagnation_seconds, matrices_for, pool)
+
+        changed = set()
+        for short in shorts:
+            remaining = still_dropped(short)
+            if short in helped and len(remaining) < len(dropped[short]):
+                continue
+            moved.update(remaining)
+            others = [cluster for cluster in range(len(clusters)) if cluster != short and clusters[cluster][1]]
+            if not remaining or not others:
+                continue
+            target = min(others, key=lambda cluster: np.linalg.norm(centroids[cluster] - centroids[short]))
+            for node in remaining:
+                clusters[short][0].remove(node)
+                clusters[target][0].append(node)
+            print(f"Moved {len(remaining)} dropped visits from cluster {short} to cluster {target}")
+            # The objective of short still has the penalties of the visits it no longer has
+            changed.update((short, target))
+        resolve_clusters(inputs, clusters, reports, sorted(changed), time_limit, stagnation_seconds, matrices_for, pool)
+
+
+def optimize_routes_decomposed(brukare_df, medarbetare_df, G, depot_location, antal_medarbetare, shift_start, shift_end,
+                               n_clusters=None, workers=None, time_limit=60, repair=False, cache_dir="matrix_cache",
+                               matrix_workers=1, matrix_backend="python"):
+    """
+    Plans the routes for one shift by clustering the visits geographically, splitting the
+    medarbetare over the clusters and solving each cluster in its own process.
+    The travel matrices are computed per cluster, through the matrix cache in cache_dir unless it is
+    None (the cache then also keeps the entries between the clusters, from the same searches).
+    Visits a cluster has to drop get idle vehicles or move to another cluster, see rebalance_clusters.
+    With repair=True neighbouring clusters are afterwards re-solved pairwise. These re-solves start
+    from good routes, so they get time_limit / RESOLVE_TIME_SHARE and stop after RESOLVE_STAGNATION_SECONDS
+    without improvement.
+    Prints the timetable, writes it to route_output.txt and returns the merged report.
+    """
+    # Only the snapped nodes are needed for the full problem
+    latitudes = [depot_location[0]] + list(brukare_df['Latitude'].astype("float"))
+    longitudes = [depot_location[1]] + list(brukare_df['Longitude'].astype("float"))
+    nodes = snap_to_nodes(G, latitudes, longitudes)[0].tolist()
+    inputs = prepare_routing_inputs(brukare_df, medarbetare_df, G, depot_location, antal_medarbetare,
+                                    shift_start, shift_end, matrices=(None, None, nodes))
+
+    def matrices_for(customer_nodes):
+        cluster_nodes = [nodes[node] for node in [0] + list(customer_nodes)]
+        with span("node_matrices"):
+            if cache_dir is None:
+                return node_matrices(build_adjacency(G), cluster_nodes, matrix_workers, matrix_backend,
+                                     graph_csr(G, backend=matrix_backend))
+            return cached_node_matrices(G, cluster_nodes, cache_dir, workers=matrix_workers, backend=matrix_backend)
+
+    if n_clusters is None:
+        n_clusters = math.ceil(len(brukare_df) / VISITS_PER_CLUSTER)
+    n_clusters = max(1, min(n_clusters, antal_medarbetare, len(brukare_df)))
+
+    labels, centroids = cluster_visits(brukare_df, n_clusters)
+    vehicles = split_medarbetare(inputs, labels, n_clusters)
+    clusters = [([node + 1 for node in np.flatnonzero(labels == cluster).tolist()], vehicles[cluster])
+                for cluster in range(n_clusters)]
+
+    resolve_time_limit = max(1, time_limit // RESOLVE_TIME_SHARE)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        reports = solve_sub_problems(pool, [sub_problem(inputs, customer_nodes, vehicle_ids, {}, time_limit,
+                                                        matrices_for=matrices_for)
+                                            for customer_nodes, vehicle_ids in clusters], clusters)
+        rebalance_clusters(inputs, clusters, reports, centroids, resolve_time_limit, RESOLVE_STAGNATION_SECONDS,
+                           matrices_for, pool)
+        if repair:
+            repair_boundaries(inputs, clusters, reports, centroids, resolve_time_limit, RESOLVE_STAGNATION_SECONDS,
+                              matrices_for, pool)
+
+    report = merge_reports(reports)
+    output_string = format_report(report)
+    if report is not None:
+        served = {node for route in report["routes"].values() for node in route}
+        report["unserved"] = [inputs["individer"][node] for node in range(1, len(inputs["nodes"])) if node not in served]
+    if report is not None and report["unserved"]:
+        output_string += f"Unserved visits          : {', '.join(report['unserved'])}\n"
+    print(output_string)
+
+    with open('route_output.txt', 'w') as f:
+        f.write(output_string)
+
+    return report
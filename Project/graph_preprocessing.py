@@ -0,0 +1,59 @@
+import math
+
+EARTH_RADIUS = 6371009  # meters
+
+
+def parse_speed_kph(maxspeed, default_speed_kph=50):
+    """
+    Converts the maxspeed attribute of an edge to kph.
+    Lists take the first value, missing or unparsable values fall back to default_speed_kph.
+    """
+    if isinstance(maxspeed, list):
+        maxspeed = maxspeed[0]  # Take the first value if it's a list
+    try:
+        return float(maxspeed)
+    except (ValueError, TypeError):
+        return default_speed_kph
+
+
+def great_circle_length(G, u, v):
+    """
+    Returns the great circle distance in meters between two nodes of G.
+    """
+    lat1, lon1 = math.radians(G.nodes[u]['y']), math.radians(G.nodes[u]['x'])
+    lat2, lon2 = math.radians(G.nodes[v]['y']), math.radians(G.nodes[v]['x'])
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(h))
+
+
+def clean_length(G, u, v, length):
+    """
+    Returns the length of an edge as a float, measured from the node coordinates if it is missing or invalid.
+    """
+    try:
+        length = float(length)
+    except (ValueError, TypeError):
+        return great_circle_length(G, u, v)
+    if math.isnan(length) or length < 0:
+        return great_circle_length(G, u, v)
+    return length
+
+
+def add_travel_times(G, default_speed_kph=50):
+    """
+    Sets a float 'length' (meters) and 'travel_time_s' (seconds at the speed limit) on every edge of G.
+    Runs once per graph and default speed, later calls return immediately unless edges were added or
+    removed since (the edge count is stored with the speed).
+    """
+    if (G.graph.get("travel_time_default_kph") == default_speed_kph
+            and G.graph.get("travel_time_edges") == G.number_of_edges()):
+        return G
+
+    for u, v, data in G.edges(data=True):
+        data['length'] = clean_length(G, u, v, data.get('length'))
+        speed_mps = parse_speed_kph(data.get('maxspeed', default_speed_kph), default_speed_kph) * 1000 / 3600
+        data['travel_time_s'] = data['length'] / speed_mps
+
+    G.graph["travel_time_default_kph"] = default_speed_kph
+    G.graph["travel_time_edges"] = G.number_of_edges()
+    return G
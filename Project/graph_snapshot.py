@@ -0,0 +1,151 @@
+import os
+import sys
+import json
+import hashlib
+import numpy as np
+
+from graph_preprocessing import parse_speed_kph, add_travel_times
+from metrics import count
+
+SNAPSHOT_DIR = "graph_snapshots"
+
+
+def snapshot_key(bbox, network_type):
+    """
+    Returns the key of the snapshot for a bounding box and network type.
+    """
+    bbox = [round(float(c), 6) for c in bbox]
+    return hashlib.sha1(json.dumps([bbox, network_type]).encode()).hexdigest()[:16]
+
+
+def build_graph(bbox, network_type='drive'):
+    """
+    Downloads the road graph for the bounding box and keeps its largest strongly connected component.
+    """
+    import osmnx as ox
+
+    G = ox.graph_from_bbox(bbox=bbox, network_type=network_type)
+    G = ox.truncate.largest_component(G, strongly=True)
+    return G
+
+
+def save_graph_snapshot(G, bbox, network_type, snapshot_dir=SNAPSHOT_DIR, default_speed_kph=50):
+    """
+    Saves G as flat arrays: node ids and coordinates, and per edge the node positions,
+    key, length, parsed maxspeed (nan when missing) and travel time at default_speed_kph.
+    """
+    add_travel_times(G, default_speed_kph)
+    path = os.path.join(snapshot_dir, snapshot_key(bbox, network_type))
+    os.makedirs(path, exist_ok=True)
+
+    node_ids = list(G.nodes)
+    position = {node: i for i, node in enumerate(node_ids)}
+    edges = list(G.edges(keys=True, data=True))
+
+    arrays = {
+        "node_ids": np.array(node_ids, dtype=np.int64),
+        "x": np.array([G.nodes[node]['x'] for node in node_ids], dtype=np.float64),
+        "y": np.array([G.nodes[node]['y'] for node in node_ids], dtype=np.float64),
+        "edge_u": np.array([position[u] for u, v, key, data in edges], dtype=np.int32),
+        "edge_v": np.array([position[v] for u, v, key, data in edges], dtype=np.int32),
+        "edge_key": np.array([key for u, v, key, data in edges], dtype=np.int32),
+        "length": np.array([data['length'] for u, v, key, data in edges], dtype=np.float64),
+        "maxspeed": np.array([parse_speed_kph(data.get('maxspeed'), np.nan) for u, v, key, data in edges],
+                             dtype=np.float64),
+        "travel_time_s": np.array([data['travel_time_s'] for u, v, key, data in edges], dtype=np.float64),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + ".npy"), array)
+
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"bbox": [float(c) for c in bbox], "network_type": network_type,
+                   "crs": str(G.graph.get("crs", "epsg:4326")), "default_speed_kph": default_speed_kph}, f)
+
+
+def load_graph_arrays(bbox, network_type, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Memory maps the arrays of a saved snapshot. Returns None if there is no snapshot.
+    """
+    path = os.path.join(snapshot_dir, snapshot_key(bbox, network_type))
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        return None
+    with open(os.path.join(path, "meta.json")) as f:
+        arrays = {"meta": json.load(f)}
+    for name in ("node_ids", "x", "y", "edge_u", "edge_v", "edge_key", "length", "maxspeed", "travel_time_s"):
+        if os.path.exists(os.path.join(path, name + ".npy")):
+            arrays[name] = np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+    return arrays
+
+
+class SnapshotGraph:
+    """
+    A road graph loaded from a snapshot. It keeps the memory mapped arrays in G.graph["arrays"]
+    instead of building a NetworkX graph, build_adjacency, snap_index and graph_fingerprint read
+    the arrays directly. Use networkx_graph where a real MultiDiGraph is needed.
+    """
+
+    def __init__(self, arrays):
+        self.graph = {"crs": arrays["meta"]["crs"], "arrays": arrays}
+
+    def number_of_nodes(self):
+        return len(self.graph["arrays"]["node_ids"])
+
+    def number_of_edges(self):
+        return len(self.graph["arrays"]["edge_u"])
+
+
+def graph_from_arrays(arrays):
+    """
+    Returns the road graph of the snapshot arrays without copying them.
+    """
+    return SnapshotGraph(arrays)
+
+
+def networkx_graph(G):
+    """
+    Returns G as a MultiDiGraph with the attributes route_optimization uses, rebuilt edge by edge
+    if G was loaded from a snapshot. Only meant for tools and comparisons, the planning does not need it.
+    """
+    import networkx as nx
+
+    if not isinstance(G, SnapshotGraph):
+        return G
+    arrays = G.graph["arrays"]
+    H = nx.MultiDiGraph(crs=G.graph["crs"])
+    node_ids = arrays["node_ids"].tolist()
+    H.add_nodes_from((node, {'x': x, 'y': y})
+                     for node, x, y in zip(node_ids, arrays["x"].tolist(), arrays["y"].tolist()))
+
+    edges = []
+    for u, v, key, length, maxspeed in zip(arrays["edge_u"].tolist(), arrays["edge_v"].tolist(),
+                                           arrays["edge_key"].tolist(), arrays["length"].tolist(),
+                                           arrays["maxspeed"].tolist()):
+        data = {'length': length}
+        if maxspeed == maxspeed:  # nan means no usable maxspeed
+            data['maxspeed'] = maxspeed
+        edges.append((node_ids[u], node_ids[v], key, data))
+    H.add_edges_from(edges)
+    return H
+
+
+def load_graph(bbox, network_type='drive', snapshot_dir=SNAPSHOT_DIR, refresh=False):
+    """
+    Returns the road graph for the bounding box from the local snapshot.
+    The graph is only downloaded if there is no snapshot yet or refresh is True.
+    """
+    arrays = None if refresh else load_graph_arrays(bbox, network_type, snapshot_dir)
+    count("graph_snapshot_hits" if arrays is not None else "graph_downloads")
+    if arrays is None:
+        print("Downloading road graph, this needs network access...")
+        save_graph_snapshot(build_graph(bbox, network_type), bbox, network_type, snapshot_dir)
+        arrays = load_graph_arrays(bbox, network_type, snapshot_dir)
+    return graph_from_arrays(arrays)
+
+
+if __name__ == '__main__':
+    # Laddar ner vägnätet på nytt: python Project/graph_snapshot.py [excelfil]
+    from data_processing import ladda_koordinater
+
+    file_path = sys.argv[1] if len(sys.argv) > 1 else "Project/data/Studentuppgift fiktiv planering.xlsx"
+    load_graph(ladda_koordinater(file_path), 'drive', refresh=True)
+    print("Road graph snapshot refreshed.")
@@ -1,57 +1,268 @@
-from data_processing import ladda_data, rensa_medarb_data
-from dataframe_creation import dataframe_creation
-from route_optimization import *  # Import the optimize_routes function
-import osmnx as ox  # Ensure OSMnx is available for graph creation
-import pandas as pd
-
-def main():
-    # Load data from Excel file
-    data = ladda_data("Project/data/Studentuppgift fiktiv planering.xlsx")
-    
-    medarbetare_df = rensa_medarb_data(data["medarbetare"])
+import os
+import sys
+import argparse
+
+from metrics import enable_metrics, span, write_metrics
+from dataframe_creation import DATA_FIL, ADRESS_FIL, veckodag
+
+# Only pandas is loaded here, every command imports the rest of what it uses, so validate and
+# build-visits start without networkx, osmnx, scipy or ortools (validate --network loads scipy)
+SKIFT = {"fm": True, "em": False}
+
 
-    coordinates_df = pd.read_excel("Project/data/Studentuppgift fiktiv planering.xlsx", "Koordinater", header=None)
-    coordinates = np.asarray(coordinates_df.iloc[:,1])
+def weekday(text):
+    try:
+        return veckodag(text)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
 
 
+def load_shift(args):
+    """
+    Returns the data from ladda_data and the visits of the day and shift in args.
+    """
+    from data_processing import ladda_data
+    from dataframe_creation import dataframe_creation, skift_df
 
-    dag = input("Ange dag för schema (mån-fre): ")
-    FM = input("Ange 1 för förmiddag, Ange 0 för eftermiddag: ")
+    # After the first run the Excel file is read from the workbook cache
+    with span("ladda_data"):
+        data = ladda_data(args.data)
+    with span("dataframe_creation"):
+        brukare_dag_df = dataframe_creation(args.dag, data, args.addresses)
+    if args.skift is None:
+        return data, brukare_dag_df
+    return data, skift_df(brukare_dag_df, SKIFT[args.skift])
 
-    dag = dag.title()
 
-    brukare_dag_df = dataframe_creation(dag) 
+def load_road_graph(args):
+    """
+    Loads the road graph from the local snapshot, it is only downloaded the first time
+    (run graph_snapshot.py to download it again).
+    """
+    from data_processing import ladda_koordinater
+    from graph_snapshot import load_graph
 
-    fm_tidsfönster = ["Morgon", "Förmiddag", "Lunch", "Eftermiddag"]
-    em_tidsfönster = ["Middag", "Tidig kväll", "Sen kväll"]
+    with span("load_graph"):
+        return load_graph(ladda_koordinater(args.data), network_type='drive')
 
-    fm_df = brukare_dag_df[brukare_dag_df["Tidsfönster"].apply(lambda x: x[0] in fm_tidsfönster)]
-    fm_df = fm_df.reset_index(drop=True)
-    em_df = brukare_dag_df[brukare_dag_df["Tidsfönster"].apply(lambda x: x[0] in em_tidsfönster)]
-    em_df = em_df.reset_index(drop=True)
 
+def validate(args):
+    """
+    Checks the workbook and the address file without planning anything. Returns 1 if a visit
+    has no address or the files cannot be read, problems the planning handles are only warnings.
+    """
+    import numpy as np
+    from data_processing import ladda_data, ladda_koordinater, rensa_medarb_data, krav_namn
+    from dataframe_creation import skapa_veckomodell
+    from address_registry import attach_addresses
 
-    # Create a graph for route optimization using OSMnx
-    place_name = "Skellefteå, Sweden"
-    G = ox.graph_from_bbox(bbox=coordinates, network_type='drive');
-    G = ox.utils_graph.truncate.largest_component(G, strongly=True);
+    try:
+        data = ladda_data(args.data)
+        medarbetare_df = rensa_medarb_data(data["medarbetare"])
+        veckomodell = skapa_veckomodell(data, args.addresses)
+    except (OSError, KeyError, ValueError) as error:
+        print(f"Fel: {error!r}")
+        return 1
 
-    depot_location = (64.71128317136987, 21.16924807421642)
+    besök = veckomodell["brukare_tidsfönster"]
+    try:
+        besök = attach_addresses(besök, veckomodell["adresser"])
+    except ValueError as error:
+        print(f"Fel: {error}")
+        return 1
+    print(f"{besök['Individ'].nunique()} brukare, {len(besök)} besök i veckomodellen, {len(medarbetare_df)} medarbetare")
 
-    fm_df.to_excel("fm.xlsx", index=False)
-    em_df.to_excel("em.xlsx", index=False)
+    # Visits whose constraints no medarbetare has are dropped by the routing with a penalty
+    capability_masks = medarbetare_df["CapabilityMask"].to_numpy(dtype=np.int64)
+    constraint_masks = besök["ConstraintMask"].to_numpy(dtype=np.int64)
+    servable = ((constraint_masks[:, None] & ~capability_masks[None, :]) == 0).any(axis=1)
+    for (individ, tidsfönster), mask in zip(besök.loc[~servable, ["Individ", "Tidsfönster"]].itertuples(index=False),
+                                            constraint_masks[~servable]):
+        print(f"Varning: ingen medarbetare uppfyller kraven {krav_namn(mask)} för {individ} ({tidsfönster[0]})")
 
-    antal_medarbetare = len(medarbetare_df)
+    north, south, east, west = ladda_koordinater(args.data)
+    adresser = veckomodell["adresser"]
+    outside = ~(adresser["Latitude"].between(south, north) & adresser["Longitude"].between(west, east))
+    for individ in adresser.index[outside]:
+        print(f"Varning: adressen för {individ} ligger utanför området i fliken Koordinater")
 
-    
+    # Addresses far from every road node get long walks that the matrices do not include. Only
+    # checked with --network, against the road graph snapshot if it has been downloaded, since it
+    # loads scipy and builds the snapping index
+    if args.network:
+        from graph_snapshot import load_graph_arrays, graph_from_arrays
+        arrays = load_graph_arrays((north, south, east, west), 'drive')
+        if arrays is None:
+            print("Vägnätet är inte nedladdat ännu, avståndet till vägnätet kontrolleras inte")
+        else:
+            from snapping import far_from_network, MAX_SNAP_DISTANCE
+            far = far_from_network(graph_from_arrays(arrays), adresser)
+            for individ, distance in far['Snap Distance'].items():
+                print(f"Varning: adressen för {individ} ligger {distance:.0f} m från vägnätet "
+                      f"(mer än {MAX_SNAP_DISTANCE} m)")
 
-    if FM == 1:
-        shift_start = 7
-        shift_end = 15
+    print("OK")
+    return 0
+
+
+def build_visits(args):
+    """
+    Prints the visits of a day (and shift), or writes them to an .xlsx or .csv file.
+    """
+    _, besök = load_shift(args)
+    if args.out is None:
+        print(besök[["Individ", "Tidsfönster", "Tid", "Constraints", "Adress"]].to_string(index=False))
+    elif args.out.endswith(".csv"):
+        besök.to_csv(args.out, index=False)
     else:
-        shift_start = 15
-        shift_end = 22
-    
-    optimize_routes(em_df, medarbetare_df, G, depot_location, antal_medarbetare, shift_start, shift_end)
+        besök.to_excel(args.out, index=False)
+
+
+def build_matrix(args):
+    """
+    Computes the travel matrices of a shift into the matrix cache, so the next solve only reads them.
+    """
+    from route_optimization import generate_matrices
+    from week import DEPOT_LOCATION
+
+    _, shift = load_shift(args)
+    G = load_road_graph(args)
+    customer_locations = list(zip(shift['Latitude'].astype("float"), shift['Longitude'].astype("float")))
+    with span("generate_matrices"):
+        _, _, nodes = generate_matrices(G, customer_locations, DEPOT_LOCATION, cache_dir="matrix_cache",
+                                        workers=args.workers, backend=args.backend)
+    print(f"Matrices for {len(nodes)} locations are in matrix_cache")
+
+
+def solve(args):
+    """
+    Plans the routes of one shift, starting from the routes of the previous run of the same shift,
+    with --decompose cluster by cluster (see decomposition.optimize_routes_decomposed) or with
+    --portfolio with several search strategies in parallel (see portfolio.solve_portfolio).
+    """
+    from data_processing import rensa_medarb_data
+    from route_optimization import optimize_routes
+    from week import DEPOT_LOCATION, SKIFT_TIDER
+
+    data, shift = load_shift(args)
+    medarbetare_df = rensa_medarb_data(data["medarbetare"])
+    G = load_road_graph(args)
+    fm = SKIFT[args.skift]
+    if args.decompose is not None:
+        from decomposition import optimize_routes_decomposed
+
+        with span("optimize_routes_decomposed"):
+            report = optimize_routes_decomposed(shift, medarbetare_df, G, DEPOT_LOCATION, len(medarbetare_df),
+                                                *SKIFT_TIDER[fm], n_clusters=args.decompose or None,
+                                                time_limit=args.time_limit, matrix_workers=args.workers,
+                                                matrix_backend=args.backend)
+        return 0 if report is not None else 1
+    if args.portfolio:
+        from route_optimization import prepare_routing_inputs, format_report
+        from portfolio import solve_portfolio
+
+        inputs = prepare_routing_inputs(shift, medarbetare_df, G, DEPOT_LOCATION, len(medarbetare_df), *SKIFT_TIDER[fm],
+                                        matrix_workers=args.workers, matrix_backend=args.backend)
+        with span("solve_portfolio"):
+            report = solve_portfolio(inputs, args.time_limit)
+        output_string = format_report(report)
+        print(output_string)
+        with open('route_output.txt', 'w') as f:
+            f.write(output_string)
+        return 0 if report is not None else 1
+    with span("optimize_routes"):
+        report = optimize_routes(shift, medarbetare_df, G, DEPOT_LOCATION, len(medarbetare_df), *SKIFT_TIDER[fm],
+                                 matrix_workers=args.workers, matrix_backend=args.backend,
+                                 warm_start_file=None if args.no_warm_start else "warm_start.json",
+                                 warm_start_key=args.skift.upper(), time_limit=args.time_limit)
+    return 0 if report is not None else 1
+
+
+def week(args):
+    """
+    Plans every shift of the week, see week.solve_week.
+    """
+    from week import solve_week, write_week_schedule
+
+    write_week_schedule(solve_week(file_path=args.data, workers=args.workers, time_limit=args.time_limit,
+                                   adress_fil=args.addresses, matrix_workers=args.matrix_workers,
+                                   decompose=args.decompose, portfolio=args.portfolio))
+    print("Week schedule written to week_schedule.json and route_output_week.txt")
+
+
+def serve(args):
+    """
+    Runs the scheduling service, see service.py.
+    """
+    from service import run_service
+
+    run_service(args.host, args.port, args.data, args.addresses, args.workers, args.matrix_workers)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="main.py", description="Ruttplanering för hemtjänsten")
+    parser.add_argument("--data", default=DATA_FIL, help="excelfilen med brukare och medarbetare")
+    parser.add_argument("--addresses", default=ADRESS_FIL, help="adressfilen med en rad per individ")
+    parser.add_argument("--metrics", default=os.environ.get("METRICS_FILE"),
+                        help="spara tidsmätningen i en .json- eller .csv-fil (eller sätt METRICS_FILE)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def command(name, function, description, day=False, shift=None, solver=False, modes=False):
+        subparser = commands.add_parser(name, help=description, description=description)
+        subparser.set_defaults(function=function)
+        if day:
+            subparser.add_argument("dag", type=weekday, help="dagen som ska schemaläggas (mån-fre)")
+        if shift == "optional":
+            subparser.add_argument("skift", nargs="?", choices=SKIFT, help="bara förmiddags- eller eftermiddagsskiftet")
+        elif shift == "required":
+            subparser.add_argument("skift", choices=SKIFT, help="förmiddags- eller eftermiddagsskiftet")
+        if solver:
+            subparser.add_argument("--workers", type=int, default=1, help="antal processer för matriserna")
+            subparser.add_argument("--backend", choices=["python", "csr"], default="python",
+                                   help="motorn för kortaste vägar, se route_optimization.matrix_rows")
+        if modes:
+            mode = subparser.add_mutually_exclusive_group()
+            mode.add_argument("--decompose", type=int, nargs="?", const=0, metavar="N",
+                              help="dela upp besöken i N geografiska kluster som planeras parallellt "
+                                   "(ett kluster per 80 besök om N inte anges)")
+            mode.add_argument("--portfolio", action="store_true",
+                              help="kör flera sökstrategier parallellt och behåll den bästa planen")
+        return subparser
+
+    command("validate", validate, "kontrollera arbetsboken och adressfilen") \
+        .add_argument("--network", action="store_true",
+                      help="kontrollera även avståndet från adresserna till vägnätet (laddar scipy, startar långsammare)")
+    command("build-visits", build_visits, "skriv ut dagens besök", day=True, shift="optional") \
+        .add_argument("--out", help="spara besöken i en .xlsx- eller .csv-fil i stället")
+    command("build-matrix", build_matrix, "beräkna restidsmatriserna för ett skift", day=True, shift="required", solver=True)
+    solve_parser = command("solve", solve, "planera rutterna för ett skift", day=True, shift="required", solver=True,
+                           modes=True)
+    solve_parser.add_argument("--time-limit", type=int, default=120, help="tidsgräns för sökningen i sekunder")
+    solve_parser.add_argument("--no-warm-start", action="store_true", help="börja inte från förra körningens rutter")
+    week_parser = command("week", week, "planera alla skift i veckan", modes=True)
+    week_parser.add_argument("--time-limit", type=int, default=120, help="tidsgräns per skift i sekunder")
+    week_parser.add_argument("--workers", type=int, default=None, help="antal processer, en per kärna om det inte anges")
+    week_parser.add_argument("--matrix-workers", type=int, default=None,
+                             help="antal processer för matriserna, samma som --workers om det inte anges")
+    serve_parser = command("serve", serve, "starta schemaläggningstjänsten som håller data, vägnät och matriser laddade")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--workers", type=int, default=None, help="antal processer för optimeringen")
+    serve_parser.add_argument("--matrix-workers", type=int, default=1, help="antal processer för matriserna")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    # --metrics (or METRICS_FILE) records how long every stage takes
+    if args.metrics:
+        enable_metrics()
+    result = args.function(args)
+    if args.metrics:
+        write_metrics(args.metrics)
+    return result or 0
+
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    sys.exit(main())
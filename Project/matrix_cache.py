@@ -0,0 +1,150 @@
+import os
+import time
+import hashlib
+import tempfile
+import numpy as np
+
+
+def graph_fingerprint(G, cost_parameters=()):
+    """
+    Hashes the nodes and edge attributes that the travel matrices depend on, and cost_parameters
+    (the default speed and the time factors the matrices were computed with).
+    A changed graph or cost model gets a new fingerprint, so old matrix entries are never reused for it.
+    """
+    hasher = hashlib.sha1()
+    hasher.update(f"{tuple(cost_parameters)};".encode())
+    if "arrays" in G.graph:
+        # A graph snapshot, hash its arrays as they are
+        for name in ("node_ids", "x", "y", "edge_u", "edge_v", "edge_key", "length", "maxspeed"):
+            hasher.update(np.ascontiguousarray(G.graph["arrays"][name]).tobytes())
+        return hasher.hexdigest()[:16]
+    for node, data in sorted(G.nodes(data=True)):
+        hasher.update(f"{node}:{data.get('x')}:{data.get('y')};".encode())
+    for u, v, key, data in sorted(G.edges(keys=True, data=True), key=lambda edge: edge[:3]):
+        hasher.update(f"{u}>{v}:{key}:{data.get('length')}:{data.get('maxspeed')};".encode())
+    return hasher.hexdigest()[:16]
+
+
+def cache_path(cache_dir, fingerprint):
+    return os.path.join(cache_dir, f"matrices_{fingerprint}.npz")
+
+
+def empty_matrix_cache():
+    return {
+        "nodes": np.zeros(0, dtype=np.int64),
+        "time": np.zeros((0, 0)),
+        "distance": np.zeros((0, 0)),
+        "last_used": np.zeros(0),
+    }
+
+
+def load_matrix_cache(cache_dir, fingerprint):
+    """
+    Loads the cached node-pair matrices for the graph with the given fingerprint.
+    Returns an empty cache if nothing has been saved for this graph yet.
+    """
+    path = cache_path(cache_dir, fingerprint)
+    if not os.path.exists(path):
+        return empty_matrix_cache()
+    with np.load(path) as data:
+        return {name: data[name] for name in ("nodes", "time", "distance", "last_used")}
+
+
+def save_matrix_cache(cache_dir, fingerprint, cache, max_graphs=2):
+    """
+    Saves the cache for this graph and removes the files of the oldest other graphs
+    so that at most max_graphs fingerprints are kept on disk.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(cache_dir, fingerprint)
+
+    # A temporary file of its own, so several processes can save at the same time and the last one wins
+    tmp_file = tempfile.NamedTemporaryFile(dir=cache_dir, prefix="tmp_matrices_", suffix=".npz", delete=False)
+    try:
+        with tmp_file:
+            np.savez(tmp_file, **cache)
+        os.replace(tmp_file.name, path)
+    except BaseException:
+        if os.path.exists(tmp_file.name):
+            os.remove(tmp_file.name)
+        raise
+
+    files = [os.path.join(cache_dir, f) for f in os.listdir(cache_dir)
+             if f.startswith("matrices_") and f.endswith(".npz")]
+    files.sort(key=os.path.getmtime, reverse=True)
+    for old_file in files[max_graphs:]:
+        try:
+            os.remove(old_file)
+        except FileNotFoundError:
+            pass  # Removed by another process saving at the same time
+
+
+def invalidate_matrix_cache(cache_dir, fingerprint=None):
+    """
+    Removes the cached matrices for one graph, or for all graphs if fingerprint is None.
+    """
+    if not os.path.isdir(cache_dir):
+        return
+    for f in os.listdir(cache_dir):
+        if f.startswith("matrices_") and f.endswith(".npz"):
+            if fingerprint is None or f == os.path.basename(cache_path(cache_dir, fingerprint)):
+                os.remove(os.path.join(cache_dir, f))
+
+
+def missing_nodes(cache, nodes):
+    """
+    Returns the distinct nodes (in order of appearance) that have no rows in the cache yet.
+    """
+    known = set(cache["nodes"].tolist())
+    return [node for node in dict.fromkeys(nodes) if node not in known]
+
+
+def extend_matrix_cache(cache, new_nodes, time_rows, distance_rows, time_cols, distance_cols):
+    """
+    Adds new nodes to the cache.
+    time_rows/distance_rows hold the new nodes to all (old + new) nodes,
+    time_cols/distance_cols hold the old nodes to the new nodes.
+    """
+    n_old = len(cache["nodes"])
+    n = n_old + len(new_nodes)
+
+    time_matrix = np.empty((n, n))
+    distance_matrix = np.empty((n, n))
+    time_matrix[:n_old, :n_old] = cache["time"]
+    distance_matrix[:n_old, :n_old] = cache["distance"]
+    time_matrix[:n_old, n_old:] = time_cols
+    distance_matrix[:n_old, n_old:] = distance_cols
+    time_matrix[n_old:, :] = time_rows
+    distance_matrix[n_old:, :] = distance_rows
+
+    return {
+        "nodes": np.concatenate([cache["nodes"], np.asarray(new_nodes, dtype=np.int64)]),
+        "time": time_matrix,
+        "distance": distance_matrix,
+        "last_used": np.concatenate([cache["last_used"], np.zeros(len(new_nodes))]),
+    }
+
+
+def lookup_matrices(cache, nodes):
+    """
+    Returns the time and distance matrices for nodes (in that order) and marks them as used.
+    """
+    index_of = {node: i for i, node in enumerate(cache["nodes"].tolist())}
+    index = np.array([index_of[node] for node in nodes], dtype=np.int64)
+    cache["last_used"][index] = time.time()
+    return cache["time"][np.ix_(index, index)], cache["distance"][np.ix_(index, index)]
+
+
+def evict_matrix_cache(cache, max_nodes):
+    """
+    Drops the least recently used nodes until the cache holds at most max_nodes nodes.
+    """
+    if len(cache["nodes"]) <= max_nodes:
+        return cache
+    keep = np.sort(np.argsort(-cache["last_used"], kind="stable")[:max_nodes])
+    return {
+        "nodes": cache["nodes"][keep],
+        "time": cache["time"][np.ix_(keep, keep)],
+        "distance": cache["distance"][np.ix_(keep, keep)],
+        "last_used": cache["last_used"][keep],
+    }
@@ -0,0 +1,106 @@
+import csv
+import json
+import time
+import threading
+from contextvars import ContextVar
+from contextlib import contextmanager, nullcontext
+
+# What is recorded: spans and counters of the main process, from any thread (the service counts
+# from asyncio.to_thread). Not recorded: anything done in worker processes (the matrix rows with
+# workers > 1, the portfolio, the decomposed and the week solves), only the span around the pool is.
+
+# The active recorder, None while metrics are disabled so span and count cost one check
+_recorder = None
+_NULL_SPAN = nullcontext()
+# Guards the span list and the counters, which several threads add to
+_lock = threading.Lock()
+# The names of the open spans, per thread and asyncio task (asyncio.to_thread copies it to the thread)
+_span_stack = ContextVar("span_stack", default=())
+
+
+def enable_metrics():
+    """
+    Starts recording spans and counters, dropping anything recorded before.
+    """
+    global _recorder
+    _recorder = {"started": time.perf_counter(), "spans": [], "counters": {}}
+
+
+def disable_metrics():
+    global _recorder
+    _recorder = None
+
+
+def metrics_enabled():
+    return _recorder is not None
+
+
+@contextmanager
+def _timed_span(name):
+    recorder = _recorder
+    stack = _span_stack.get() + (name,)
+    token = _span_stack.set(stack)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorded = {"name": name, "path": "/".join(stack), "start": round(start - recorder["started"], 6),
+                    "seconds": round(time.perf_counter() - start, 6)}
+        with _lock:
+            recorder["spans"].append(recorded)
+        _span_stack.reset(token)
+
+
+def span(name):
+    """
+    Context manager that records the wall time of a stage under name (nested spans get a path
+    like "optimize_routes/search"). Does nothing while metrics are disabled.
+    """
+    if _recorder is None:
+        return _NULL_SPAN
+    return _timed_span(name)
+
+
+def count(name, value=1):
+    """
+    Adds value to the counter name. Does nothing while metrics are disabled.
+    Only the main process is counted, work done in worker processes is not.
+    """
+    recorder = _recorder
+    if recorder is not None:
+        with _lock:
+            recorder["counters"][name] = recorder["counters"].get(name, 0) + value
+
+
+def metrics():
+    """
+    Returns the recorded spans and counters, None while metrics are disabled.
+    """
+    recorder = _recorder
+    if recorder is None:
+        return None
+    with _lock:
+        return {"spans": list(recorder["spans"]), "counters": dict(recorder["counters"])}
+
+
+def write_metrics(path):
+    """
+    Writes the recorded spans and counters to path, as CSV if it ends with .csv and as JSON otherwise.
+    """
+    recorded = metrics()
+    if recorded is None:
+        return
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["type", "name", "path", "start", "seconds", "value"])
+            for recorded_span in sorted(recorded["spans"], key=lambda s: s["start"]):
+                writer.writerow(["span", recorded_span["name"], recorded_span["path"],
+                                 recorded_span["start"], recorded_span["seconds"], ""])
+            for name, value in recorded["counters"].items():
+                writer.writerow(["counter", name, "", "", "", value])
+    else:
+        with open(path, "w") as f:
+            json.dump({"time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                       "spans": sorted(recorded["spans"], key=lambda s: s["start"]),
+                       "counters": recorded["counters"]}, f, ensure_ascii=False, indent=1)
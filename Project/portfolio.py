@@ -0,0 +1,111 @@
+import json
+import time
+from multiprocessing import Manager
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from ortools.constraint_solver import routing_enums_pb2
+
+from route_optimization import build_routing_model, add_stopping_policy, default_search_parameters, solve_routing_model, extract_routes
+
+# OR-Tools routing has no random seed parameter, so the portfolio varies the strategies
+DEFAULT_PORTFOLIO = [
+    {"first_solution": "AUTOMATIC", "metaheuristic": "TABU_SEARCH"},
+    {"first_solution": "PATH_CHEAPEST_ARC", "metaheuristic": "GUIDED_LOCAL_SEARCH"},
+    {"first_solution": "PARALLEL_CHEAPEST_INSERTION", "metaheuristic": "SIMULATED_ANNEALING"},
+    {"first_solution": "SAVINGS", "metaheuristic": "GUIDED_LOCAL_SEARCH"},
+]
+
+PORTFOLIO_LOG = "portfolio_log.jsonl"
+MIN_SOLVE_SECONDS = 1  # Configurations that would get less time than this are skipped
+
+
+def search_parameters_for(config, time_limit):
+    """
+    Returns search parameters with the first solution strategy and metaheuristic named in config.
+    time_limit is in seconds and may have a fraction.
+    """
+    search_parameters = default_search_parameters(log_search=False)
+    search_parameters.time_limit.FromMilliseconds(int(time_limit * 1000))
+    search_parameters.first_solution_strategy = getattr(routing_enums_pb2.FirstSolutionStrategy, config["first_solution"])
+    search_parameters.local_search_metaheuristic = getattr(routing_enums_pb2.LocalSearchMetaheuristic, config["metaheuristic"])
+    return search_parameters
+
+
+def solve_config(args):
+    """
+    Solves inputs with one portfolio configuration until deadline (a time.time() value) or until
+    stop_event is set. A configuration that only starts when less than MIN_SOLVE_SECONDS are left is skipped.
+    Returns the report from extract_routes (None if no solution) and the solve time.
+    """
+    inputs, config, deadline, stop_event, target_objective = args
+    started = time.monotonic()
+    if deadline - time.time() < MIN_SOLVE_SECONDS or stop_event.is_set():
+        return None, 0.0
+    model = build_routing_model(inputs)
+    routing = model["routing"]
+    add_stopping_policy(model, target_objective=target_objective)
+
+    # The event lives in the manager process, so it is only asked twice a second
+    checked = {"at": started, "stop": False}
+
+    def stop_requested():
+        if not checked["stop"] and time.monotonic() - checked["at"] > 0.5:
+            checked["at"] = time.monotonic()
+            checked["stop"] = stop_event.is_set()
+        return checked["stop"]
+
+    routing.AddSearchMonitor(routing.solver().CustomLimit(stop_requested))
+
+    # Queued configurations only get what is left of the time limit of the whole portfolio
+    solution = solve_routing_model(model, search_parameters_for(config, max(deadline - time.time(), 0.1)))
+    report = extract_routes(model, solution)
+    if report is not None and target_objective is not None and report["objective"] <= target_objective:
+        stop_event.set()  # Good enough, the other configurations can stop
+    return report, time.monotonic() - started
+
+
+def solve_portfolio(inputs, time_limit=120, portfolio=None, workers=None, target_objective=None, log_file=PORTFOLIO_LOG):
+    """
+    Solves the same inputs from prepare_routing_inputs with every configuration of portfolio
+    in parallel processes and returns the lowest cost report, with the winning configuration
+    under "config". Every run is appended to log_file so the defaults can be tuned.
+    time_limit is for the whole portfolio, with fewer workers than configurations the queued
+    configurations share what is left of it.
+    """
+    if portfolio is None:
+        portfolio = DEFAULT_PORTFOLIO
+
+    with Manager() as manager, ProcessPoolExecutor(max_workers=workers or len(portfolio)) as pool:
+        stop_event = manager.Event()
+        deadline = time.time() + time_limit
+        futures = [pool.submit(solve_config, (inputs, config, deadline, stop_event, target_objective))
+                   for config in portfolio]
+
+        # Stop the configurations that are still running once the budget is used up
+        done, not_done = wait(futures, timeout=deadline - time.time() + 5)
+        if not_done:
+            stop_event.set()
+        results = [future.result() for future in futures]
+
+    best = None
+    for config, (report, seconds) in zip(portfolio, results):
+        if report is not None and (best is None or report["objective"] < best[1]["objective"]):
+            best = (config, report)
+
+    if log_file is not None:
+        with open(log_file, "a") as f:
+            f.write(json.dumps({
+                "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "visits": len(inputs["nodes"]) - 1,
+                "vehicles": inputs["num_vehicles"],
+                "time_limit": time_limit,
+                "results": [dict(config, objective=None if report is None else report["objective"], seconds=round(seconds, 2))
+                            for config, (report, seconds) in zip(portfolio, results)],
+                "winner": None if best is None else best[0],
+            }) + "\n")
+
+    if best is None:
+        return None
+    config, report = best
+    print(f"Best configuration: {config['first_solution']} + {config['metaheuristic']} ({report['objective']})")
+    return dict(report, config=config)
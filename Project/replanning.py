@@ -0,0 +1,236 @@
+import numpy as np
+import pandas as pd
+
+from data_processing import krav_mask
+from snapping import snap_to_nodes
+from route_optimization import (build_adjacency, reverse_adjacency, origin_rows, transit_matrices, time_window,
+                                vehicle_assignment, capability_masks_of, build_routing_model,
+                                default_search_parameters, extract_routes)
+from warm_start import cheapest_insertion, route_is_feasible
+
+REPAIR_PASSES = 2  # Relocate passes over the changed routes after an insertion or removal
+UNPLACED_PENALTY = 100000  # Drop penalty for a visit that does not fit into any route
+
+
+def replanning_graph(G, default_speed_kph=50):
+    """
+    Builds the forward and reversed adjacency of G once, so each added visit only needs
+    one search in each direction.
+    """
+    adjacency = build_adjacency(G, default_speed_kph)
+    return {"G": G, "adjacency": adjacency, "reverse": reverse_adjacency(adjacency)}
+
+
+def plan_from_report(inputs, report):
+    """
+    Returns a plan for the incremental functions below from inputs (prepare_routing_inputs)
+    and a report (extract_routes): the inputs, one list of node indices per vehicle and the report.
+    """
+    routes = [[] for _ in range(inputs["num_vehicles"])]
+    if report is not None:
+        for vehicle_id, route in report["routes"].items():
+            routes[vehicle_id] = list(route)
+    return {"inputs": inputs, "routes": routes, "report": report, "unplaced": []}
+
+
+def route_cost(route, time_transit):
+    stops = [0] + route + [0]
+    return sum(time_transit[a][b] for a, b in zip(stops, stops[1:]))
+
+
+def repair_routes(routes, vehicles, inputs, time_transit):
+    """
+    Relocates the stops of vehicles one at a time to their cheapest feasible position (on any allowed
+    vehicle) and keeps each move that lowers the total travel and service time and leaves every route
+    feasible. routes is changed in place.
+    """
+    for _ in range(REPAIR_PASSES):
+        improved = False
+        for vehicle_id in vehicles:
+            for node in list(routes[vehicle_id]):
+                if node not in routes[vehicle_id]:
+                    continue
+                before = [list(route) for route in routes]
+                cost_before = sum(route_cost(route, time_transit) for route in routes)
+                routes[vehicle_id].remove(node)
+                if (route_is_feasible(routes[vehicle_id], time_transit, inputs["time_windows"])
+                        and cheapest_insertion(routes, node, inputs, time_transit)
+                        and sum(route_cost(route, time_transit) for route in routes) < cost_before):
+                    improved = True
+                else:
+                    routes[:] = before
+        if not improved:
+            break
+
+
+def take_out_infeasible(routes, vehicles, inputs, time_transit):
+    """
+    Makes the routes of vehicles feasible again by taking out the stops that no longer fit, keeping
+    the others in order (a removed or changed visit can leave a wait longer than MAX_WAIT before the
+    next one). routes is changed in place, returns the nodes taken out.
+    """
+    taken_out = []
+    for vehicle_id in vehicles:
+        if route_is_feasible(routes[vehicle_id], time_transit, inputs["time_windows"]):
+            continue
+        kept = []
+        for node in routes[vehicle_id]:
+            if route_is_feasible(kept + [node], time_transit, inputs["time_windows"]):
+                kept.append(node)
+            else:
+                taken_out.append(node)
+        routes[vehicle_id] = kept
+    return taken_out
+
+
+def insert_nodes(inputs, routes, new_nodes, unplaced, changed_vehicles=()):
+    """
+    Makes the routes of changed_vehicles feasible, inserts new_nodes and the stops taken out of them by
+    cheapest feasible insertion, repairs the changed routes and the routes they went into and returns
+    the plan from finish_plan.
+    Visits that fit nowhere are added to unplaced and can be dropped, the other routes stay as they are.
+    """
+    time_transit = transit_matrices(inputs["time_matrix"], inputs["distance_matrix"], inputs["service_times"])[0].tolist()
+    new_nodes = list(new_nodes) + take_out_infeasible(routes, changed_vehicles, inputs, time_transit)
+    unplaced = list(unplaced)
+    for node in new_nodes:
+        if inputs["allowed_vehicles"][node] is None:
+            continue  # Nobody can serve it, the model drops it with its penalty
+        if not cheapest_insertion(routes, node, inputs, time_transit):
+            # Droppable with UNPLACED_PENALTY so the other routes are kept, a full solve may still fit it
+            unplaced.append(inputs["individer"][node])
+            inputs["drop_penalties"] = list(inputs["drop_penalties"])
+            inputs["drop_penalties"][node] = UNPLACED_PENALTY
+
+    touched = sorted(set(changed_vehicles) | {vehicle_id for vehicle_id, route in enumerate(routes)
+                                              if any(node in route for node in new_nodes)})
+    repair_routes(routes, touched, inputs, time_transit)
+    return finish_plan(inputs, routes, unplaced)
+
+
+def finish_plan(inputs, routes, unplaced):
+    """
+    Returns the plan for routes with its extract_routes report, the search only completes the schedule
+    of the given routes. Returns None if the model does not accept the routes, the routes are never
+    replaced by a new search.
+    """
+    model = build_routing_model(inputs)
+    routing = model["routing"]
+    assignment = routing.ReadAssignmentFromRoutes(routes, True)
+    if assignment is None:
+        return None
+    search_parameters = default_search_parameters(1, log_search=False)
+    search_parameters.solution_limit = 1
+    report = extract_routes(model, routing.SolveFromAssignmentWithParameters(assignment, search_parameters))
+    if report is None:
+        return None
+    return {"inputs": inputs, "routes": plan_from_report(inputs, report)["routes"], "report": report,
+            "unplaced": unplaced}
+
+
+def unchanged_plan(plan, individ):
+    """
+    Returns plan as it was with individ listed in unplaced, for a change the routes could not take.
+    """
+    print(f"The routes could not take the change for {individ}, the plan is unchanged.")
+    return dict(plan, unplaced=list(dict.fromkeys(plan["unplaced"] + [individ])))
+
+
+def add_visit(plan, visit, medarbetare_df, graph):
+    """
+    Adds one visit (a row like those of dataframe_creation: Individ, Tid, Tidsfönster, Constraints
+    or ConstraintMask, Latitude and Longitude) to plan. Only the matrix row and column of the new
+    location are computed, graph comes from replanning_graph. Returns the new plan.
+    """
+    inputs = dict(plan["inputs"])
+    nodes = list(inputs["nodes"])
+    node = snap_to_nodes(graph["G"], [float(visit["Latitude"])], [float(visit["Longitude"])])[0].tolist()[0]
+
+    time_matrix = np.asarray(inputs["time_matrix"], dtype=np.float64)
+    distance_matrix = np.asarray(inputs["distance_matrix"], dtype=np.float64)
+    if node in nodes:
+        # Same road node as another visit, its row and column are the same
+        existing = nodes.index(node)
+        time_row, distance_row = time_matrix[existing], distance_matrix[existing]
+        time_col, distance_col = time_matrix[:, existing], distance_matrix[:, existing]
+    else:
+        time_row, distance_row = (rows[0] for rows in origin_rows(graph["adjacency"], [node], nodes))
+        time_col, distance_col = (rows[0] for rows in origin_rows(graph["reverse"], [node], nodes))
+
+    n = len(nodes)
+    new_time = np.zeros((n + 1, n + 1))
+    new_distance = np.zeros((n + 1, n + 1))
+    new_time[:n, :n], new_time[n, :n], new_time[:n, n] = time_matrix, time_row, time_col
+    new_distance[:n, :n], new_distance[n, :n], new_distance[:n, n] = distance_matrix, distance_row, distance_col
+
+    if "ConstraintMask" in visit and not pd.isna(visit["ConstraintMask"]):
+        constraint_mask = int(visit["ConstraintMask"])
+    else:
+        constraint_mask = int(krav_mask(pd.Series([visit.get("Constraints", "")])).iloc[0])
+    allowed, penalties, _ = vehicle_assignment([constraint_mask], capability_masks_of(medarbetare_df, inputs["num_vehicles"]))
+
+    inputs.update({
+        "time_matrix": new_time.tolist(),
+        "distance_matrix": new_distance.tolist(),
+        "nodes": nodes + [node],
+        "time_windows": inputs["time_windows"] + [time_window(visit["Tidsfönster"], inputs["shift_start"])],
+        "service_times": inputs["service_times"] + [int(visit["Tid"]) * 60],
+        "allowed_vehicles": inputs["allowed_vehicles"] + allowed,
+        "drop_penalties": inputs["drop_penalties"] + penalties,
+        "individer": inputs["individer"] + [visit["Individ"]],
+    })
+    new_plan = insert_nodes(inputs, [list(route) for route in plan["routes"]], [n], plan["unplaced"])
+    return new_plan if new_plan is not None else unchanged_plan(plan, visit["Individ"])
+
+
+def remove_visit(plan, individ):
+    """
+    Removes every visit of individ (both rows of a double staffing visit) from plan
+    and returns the new plan.
+    """
+    inputs = plan["inputs"]
+    removed = {node for node, name in enumerate(inputs["individer"]) if node != 0 and name == individ}
+    if not removed:
+        raise ValueError(f"{individ} has no visit in the plan")
+    keep = [node for node in range(len(inputs["nodes"])) if node not in removed]
+    new_index = {node: i for i, node in enumerate(keep)}
+
+    new_inputs = dict(inputs)
+    new_inputs.update({
+        "time_matrix": np.asarray(inputs["time_matrix"])[np.ix_(keep, keep)].tolist(),
+        "distance_matrix": np.asarray(inputs["distance_matrix"])[np.ix_(keep, keep)].tolist(),
+    })
+    for name in ("nodes", "time_windows", "service_times", "allowed_vehicles", "drop_penalties", "individer"):
+        new_inputs[name] = [inputs[name][node] for node in keep]
+
+    touched = [vehicle_id for vehicle_id, route in enumerate(plan["routes"]) if removed.intersection(route)]
+    routes = [[new_index[node] for node in route if node not in removed] for route in plan["routes"]]
+    new_plan = insert_nodes(new_inputs, routes, [], [name for name in plan["unplaced"] if name != individ], touched)
+    return new_plan if new_plan is not None else unchanged_plan(plan, individ)
+
+
+def change_visit(plan, individ, tid=None, tidsfönster=None):
+    """
+    Changes the visit time (Tid, minutes) and/or the Tidsfönster of every visit of individ and
+    re-inserts the visits where they fit best. Returns the new plan.
+    """
+    inputs = dict(plan["inputs"])
+    changed = [node for node, name in enumerate(inputs["individer"]) if node != 0 and name == individ]
+    if not changed:
+        raise ValueError(f"{individ} has no visit in the plan")
+
+    inputs["service_times"] = list(inputs["service_times"])
+    inputs["time_windows"] = list(inputs["time_windows"])
+    inputs["drop_penalties"] = list(inputs["drop_penalties"])
+    for node in changed:
+        if inputs["allowed_vehicles"][node] is not None:
+            inputs["drop_penalties"][node] = None  # Mandatory again if it was unplaced
+        if tid is not None:
+            inputs["service_times"][node] = int(tid) * 60
+        if tidsfönster is not None:
+            inputs["time_windows"][node] = time_window(tidsfönster, inputs["shift_start"])
+
+    touched = [vehicle_id for vehicle_id, route in enumerate(plan["routes"]) if set(changed).intersection(route)]
+    routes = [[node for node in route if node not in changed] for route in plan["routes"]]
+    new_plan = insert_nodes(inputs, routes, changed, [name for name in plan["unplaced"] if name != individ], touched)
+    return new_plan if new_plan is not None else unchanged_plan(plan, individ)
@@ -1,5 +1,4 @@
 import re
-from copy import deepcopy
 
 def skapa_brukare_dict(brukare_df, tider, regex_filters):
     """
@@ -69,10 +68,16 @@ def skapa_medarbetare_dict(medarbetare_df, tider, regex_filters):
 def skapa_dag_dict(brukare_df, medarbetare_df, brukare_dag_dict, medarbetare_dag_dict, regex):
     """
     Create a dictionary representing the whole day with special conditions.
+    The input dicts are not changed: the Förmiddag and Eftermiddag windows are copied and the
+    brukare with shower or activation get new entries, everything else is shared with the input.
     """
     dag_dict = {}
     tid_regex = r'\b\d{2}\b'
 
+    brukare_dag_dict = dict(brukare_dag_dict)
+    brukare_dag_dict["Förmiddag"] = dict(brukare_dag_dict.get("Förmiddag", {}))
+    brukare_dag_dict["Eftermiddag"] = dict(brukare_dag_dict.get("Eftermiddag", {}))
+
     # Ensure that the 'Dusch' column is treated as string before applying .str.contains()
     dusch_behov_df = brukare_df[brukare_df["Dusch"].astype(str).str.contains(regex, na=False)]
 
@@ -81,12 +86,13 @@ def skapa_dag_dict(brukare_df, medarbetare_df, brukare_dag_dict, medarbetare_dag
         krav_på_man = "vid dusch" in str(row["Kräver man"])
         krav_på_kvinna = "vid dusch" in str(row["Kräver kvinna"])
         try:
-            brukare_dag_dict["Förmiddag"][row["Individ"]].update({
+            brukare_dag_dict["Förmiddag"][row["Individ"]] = {
+                **brukare_dag_dict["Förmiddag"][row["Individ"]],
                 "Tid": int(brukare_dag_dict["Förmiddag"][row["Individ"]]["Tid"]) + dusch_tid,
                 "Kräver man": krav_på_man,
                 "Kräver kvinna": krav_på_kvinna,
                 "Dusch": True
-            })
+            }
         except KeyError:
             brukare_dag_dict["Förmiddag"][row["Individ"]] = {
                 "Tid": dusch_tid,
@@ -110,10 +116,11 @@ def skapa_dag_dict(brukare_df, medarbetare_df, brukare_dag_dict, medarbetare_dag
     for index, row in aktiverings_behov_df.iterrows():
         aktiverings_tid = int(re.search(tid_regex, row["Aktivering"]).group() if re.search(tid_regex, row["Aktivering"]) else 30)
         try:
-            brukare_dag_dict["Eftermiddag"][row["Individ"]].update({
+            brukare_dag_dict["Eftermiddag"][row["Individ"]] = {
+                **brukare_dag_dict["Eftermiddag"][row["Individ"]],
                 "Tid": int(brukare_dag_dict["Eftermiddag"][row["Individ"]]["Tid"]) + aktiverings_tid,
                 "Aktivering": True
-            })
+            }
         except KeyError:
             brukare_dag_dict["Eftermiddag"][row["Individ"]] = {
                 "Tid": aktiverings_tid,
@@ -145,14 +152,10 @@ def create_weekly_dict(brukare_df, medarbetare_df, brukare_dag_dict, medarbetare
     :param medarbetare_df: DataFrame of medarbetare data
     :param brukare_dag_dict: Dictionary of brukare per time period
     :param medarbetare_dag_dict: Dictionary of medarbetare per time period
-    :return: Dictionary containing day-specific data
+    :return: Dictionary containing day-specific data, the days share the entries they do not change
     """
-    regex_dag_mönster = [r'\b[mM]ån', r'\b[tT]is', r'\b[oO]ns', r'\b[tT]or', r'\b[fF]re']
-    days_dict = {
-        "Måndag": skapa_dag_dict(brukare_df, medarbetare_df, deepcopy(brukare_dag_dict), deepcopy(medarbetare_dag_dict), regex_dag_mönster[0]),
-        "Tisdag": skapa_dag_dict(brukare_df, medarbetare_df, deepcopy(brukare_dag_dict), deepcopy(medarbetare_dag_dict), regex_dag_mönster[1]),
-        "Onsdag": skapa_dag_dict(brukare_df, medarbetare_df, deepcopy(brukare_dag_dict), deepcopy(medarbetare_dag_dict), regex_dag_mönster[2]),
-        "Torsdag": skapa_dag_dict(brukare_df, medarbetare_df, deepcopy(brukare_dag_dict), deepcopy(medarbetare_dag_dict), regex_dag_mönster[3]),
-        "Fredag": skapa_dag_dict(brukare_df, medarbetare_df, deepcopy(brukare_dag_dict), deepcopy(medarbetare_dag_dict), regex_dag_mönster[4]),
-    }
-    return days_dict
\ No newline at end of file
+    regex_dag_mönster = {"Måndag": r'\b[mM]ån', "Tisdag": r'\b[tT]is', "Onsdag": r'\b[oO]ns', "Torsdag": r'\b[tT]or', "Fredag": r'\b[fF]re'}
+    # skapa_dag_dict only copies what a day changes, so the days share the rest of the input dicts
+    days_dict = {dag: skapa_dag_dict(brukare_df, medarbetare_df, brukare_dag_dict, medarbetare_dag_dict, regex)
+                 for dag, regex in regex_dag_mönster.items()}
+    return days_dict
@@ -1,7 +1,15 @@
-import osmnx as ox
-import networkx as nx
 from ortools.constraint_solver import pywrapcp, routing_enums_pb2
 import numpy as np
+from heapq import heappush, heappop
+from itertools import count
+from time import monotonic
+from concurrent.futures import ProcessPoolExecutor
+from graph_preprocessing import add_travel_times
+from snapping import snap_to_nodes, MAX_SNAP_DISTANCE
+from data_processing import KRAV, krav_mask, krav_namn
+from metrics import span, count as count_metric
+from matrix_cache import (graph_fingerprint, load_matrix_cache, save_matrix_cache, missing_nodes,
+                          extend_matrix_cache, lookup_matrices, evict_matrix_cache)
 
 
 
@@ -19,137 +27,486 @@ def load_matrices(time_file="time_matrix.npy", distance_file="distance_matrix.np
 
 
 
+# Travel times are scaled up by 20 % and every visit costs 5 minutes of parking/walking
+DRIVE_TIME_FACTOR = 1.20
+STOP_TIME = 5 * 60
+
+
+def build_adjacency(G, default_speed_kph=50):
+    """
+    Collects the cost of every edge in G from the precomputed edge attributes.
+    Returns a dict node -> list of (neighbour, search weight, length, travel time).
+    The search weight is the shortest parallel edge (what nx.shortest_path uses), while
+    length and travel time are taken from the first parallel edge like before.
+    """
+    if "arrays" in G.graph:
+        return adjacency_from_arrays(G.graph["arrays"], default_speed_kph)
+
+    add_travel_times(G, default_speed_kph)
+    adjacency = {}
+    for u, neighbours in G.adj.items():
+        edges = []
+        for v, keydict in neighbours.items():
+            weight = min(data['length'] for data in keydict.values())
+            edge_data = keydict[0] if 0 in keydict else next(iter(keydict.values()))
+            edges.append((v, weight, edge_data['length'], edge_data['travel_time_s'] * DRIVE_TIME_FACTOR))
+        adjacency[u] = edges
+    return adjacency
+
+
+def adjacency_from_arrays(arrays, default_speed_kph=50):
+    """
+    Builds the same adjacency as build_adjacency from the edge arrays of a graph snapshot
+    (see graph_snapshot.save_graph_snapshot), without a NetworkX graph in between.
+    """
+    node_ids = np.asarray(arrays["node_ids"])
+    if "travel_time_s" in arrays and arrays["meta"].get("default_speed_kph") == default_speed_kph:
+        travel_time = np.asarray(arrays["travel_time_s"])
+    else:
+        # Saved with another default speed (or before it was saved), edges without maxspeed get the new one
+        speed_kph = np.where(np.isnan(arrays["maxspeed"]), default_speed_kph, arrays["maxspeed"])
+        travel_time = np.asarray(arrays["length"]) / (speed_kph * 1000 / 3600)
+
+    # Parallel edges next to each other with the lowest key first
+    order = np.lexsort((arrays["edge_key"], arrays["edge_v"], arrays["edge_u"]))
+    edge_u, edge_v = np.asarray(arrays["edge_u"])[order], np.asarray(arrays["edge_v"])[order]
+    length, travel_time = np.asarray(arrays["length"])[order], travel_time[order]
+    first = np.flatnonzero(np.r_[True, (edge_u[1:] != edge_u[:-1]) | (edge_v[1:] != edge_v[:-1])]) \
+        if len(order) else np.zeros(0, dtype=np.int64)
+    weight = np.minimum.reduceat(length, first) if len(first) else np.zeros(0)
+
+    adjacency = {node: [] for node in node_ids.tolist()}
+    for u, v, w, edge_length, edge_time in zip(node_ids[edge_u[first]].tolist(), node_ids[edge_v[first]].tolist(),
+                                               weight.tolist(), length[first].tolist(),
+                                               (travel_time[first] * DRIVE_TIME_FACTOR).tolist()):
+        adjacency[u].append((v, w, edge_length, edge_time))
+    return adjacency
+
+
+def single_source_costs(adjacency, source, targets):
+    """
+    Runs one Dijkstra search from source and stops when all targets are settled.
+    Returns two dicts node -> travel time and node -> distance, accumulated along the
+    predecessor tree of the search. Unreachable targets are missing from the dicts.
+    """
+    remaining = set(targets)
+    dist = {source: 0}
+    travel_time = {source: 0}
+    distance = {source: 0}
+    settled = set()
+    counter = count()
+    heap = [(0, next(counter), source)]
+
+    while heap and remaining:
+        d, _, u = heappop(heap)
+        if u in settled:
+            continue
+        settled.add(u)
+        remaining.discard(u)
+        for v, weight, length, edge_time in adjacency.get(u, ()):
+            new_dist = d + weight
+            if v not in settled and (v not in dist or new_dist < dist[v]):
+                dist[v] = new_dist
+                travel_time[v] = travel_time[u] + edge_time
+                distance[v] = distance[u] + length
+                heappush(heap, (new_dist, next(counter), v))
+
+    reached = settled.intersection(targets)
+    return ({node: travel_time[node] for node in reached},
+            {node: distance[node] for node in reached})
+
+
+def origin_rows(adjacency, origins, nodes):
+    """
+    Computes the time and distance rows for every origin in origins against nodes.
+    Returns two arrays of shape (len(origins), len(nodes)).
+    """
+    targets = set(nodes)
+    time_rows = np.empty((len(origins), len(nodes)))
+    distance_rows = np.empty((len(origins), len(nodes)))
+    for row, node_u in enumerate(origins):
+        times, distances = single_source_costs(adjacency, node_u, targets)
+        # No travel for the same node, inf if no path exists
+        time_rows[row] = [0 if node_u == node_v else times[node_v] + STOP_TIME if node_v in times else float('inf')
+                          for node_v in nodes]
+        distance_rows[row] = [0 if node_u == node_v else distances.get(node_v, float('inf'))
+                              for node_v in nodes]
+    return time_rows, distance_rows
+
+
+# Adjacency and target nodes of a matrix worker process, set once by init_matrix_worker
+_matrix_worker_state = {}
+
+
+def init_matrix_worker(adjacency, nodes):
+    _matrix_worker_state["adjacency"] = adjacency
+    _matrix_worker_state["nodes"] = nodes
+
+
+def matrix_worker_rows(origins):
+    return origin_rows(_matrix_worker_state["adjacency"], origins, _matrix_worker_state["nodes"])
+
+
+def matrix_rows(adjacency, origins, nodes, workers=1, backend="python", csr=None):
+    """
+    Computes the time and distance rows for every origin in origins against nodes.
+    backend "python" runs the Dijkstra search above, with workers > 1 blocks of origins
+    are searched in a process pool (the adjacency is sent to each worker once) and the
+    result is the same as with one worker.
+    backend "csr" uses SciPy's compiled Dijkstra on csr, the CSR arrays of the adjacency
+    kept with the graph (see graph_csr), or converts the adjacency if csr is None.
+    """
+    count_metric("matrix_pairs_computed", len(origins) * len(nodes))
+    if backend == "csr":
+        from csr_graph import csr_from_adjacency, csr_matrix_rows
+        return csr_matrix_rows(csr if csr is not None else csr_from_adjacency(adjacency), origins, nodes)
+    if backend != "python":
+        raise ValueError(f"Unknown matrix backend: {backend}")
+
+    if workers <= 1 or len(origins) < 2 * workers:
+        return origin_rows(adjacency, origins, nodes)
+
+    time_rows = np.empty((len(origins), len(nodes)))
+    distance_rows = np.empty((len(origins), len(nodes)))
+    blocks = [block.tolist() for block in np.array_split(np.arange(len(origins)), 4 * workers) if len(block)]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_matrix_worker,
+                             initargs=(adjacency, list(nodes))) as pool:
+        results = pool.map(matrix_worker_rows, [[origins[i] for i in block] for block in blocks])
+        for block, (block_times, block_distances) in zip(blocks, results):
+            time_rows[block[0]:block[-1] + 1] = block_times
+            distance_rows[block[0]:block[-1] + 1] = block_distances
+
+    return time_rows, distance_rows
+
+
+def reverse_adjacency(adjacency):
+    """
+    Reverses the edges of an adjacency from build_adjacency.
+    A search on the reversed adjacency gives the costs from every node to the source.
+    """
+    reverse = {u: [] for u in adjacency}
+    for u, edges in adjacency.items():
+        for v, weight, length, edge_time in edges:
+            reverse.setdefault(v, []).append((u, weight, length, edge_time))
+    return reverse
+
+
+def graph_csr(G, default_speed_kph=50, backend="csr", reverse=False):
+    """
+    Returns the CSR arrays of G (reversed if reverse) for the csr backend, None for the other backends.
+    They are built once per default speed and kept in G.graph, like the snapping index.
+    """
+    if backend != "csr":
+        return None
+    from csr_graph import csr_from_adjacency
+
+    cached = G.graph.setdefault("csr", {})
+    key = (default_speed_kph, reverse)
+    if key not in cached or cached[key]["edge_count"] != G.number_of_edges():
+        adjacency = build_adjacency(G, default_speed_kph)
+        csr = csr_from_adjacency(reverse_adjacency(adjacency) if reverse else adjacency)
+        cached[key] = {"edge_count": G.number_of_edges(), "csr": csr}
+    return cached[key]["csr"]
+
+
+def node_matrices(adjacency, nodes, workers=1, backend="python", csr=None):
+    """
+    Returns the time and distance matrices between all nodes, one search per distinct node.
+    """
+    unique_nodes = list(dict.fromkeys(nodes))
+    time_rows, distance_rows = matrix_rows(adjacency, unique_nodes, nodes, workers, backend, csr)
+    row_of = {node: row for row, node in enumerate(unique_nodes)}
+    rows = [row_of[node] for node in nodes]
+
+    return time_rows[rows].tolist(), distance_rows[rows].tolist()
+
+
+def cached_node_matrices(G, nodes, cache_dir, default_speed_kph=50, max_cached_nodes=2000, workers=1, backend="python"):
+    """
+    Returns the time and distance matrices between nodes using the on-disk matrix cache.
+    Only the rows and columns of nodes that are not cached for this graph are computed,
+    the merged result is saved back for the next run.
+    """
+    fingerprint = graph_fingerprint(G, (default_speed_kph, DRIVE_TIME_FACTOR, STOP_TIME))
+    cache = load_matrix_cache(cache_dir, fingerprint)
+    new_nodes = missing_nodes(cache, nodes)
+    count_metric("matrix_cache_hits", len(set(nodes)) - len(new_nodes))
+    count_metric("matrix_cache_misses", len(new_nodes))
+
+    if new_nodes:
+        adjacency = build_adjacency(G, default_speed_kph)
+        old_nodes = cache["nodes"].tolist()
+        all_nodes = old_nodes + new_nodes
+
+        # Rows: new nodes to every cached and new node
+        time_rows, distance_rows = matrix_rows(adjacency, new_nodes, all_nodes, workers, backend,
+                                               graph_csr(G, default_speed_kph, backend))
+
+        # Columns: every cached node to the new nodes, searched on the reversed graph
+        reverse = reverse_adjacency(adjacency)
+        time_cols, distance_cols = matrix_rows(reverse, new_nodes, old_nodes, workers, backend,
+                                               graph_csr(G, default_speed_kph, backend, reverse=True))
+
+        cache = extend_matrix_cache(cache, new_nodes, time_rows, distance_rows, time_cols.T, distance_cols.T)
+        print(f"Computed matrix entries for {len(new_nodes)} new nodes, {len(old_nodes)} were cached.")
+    else:
+        print("Loaded all matrix entries from cache.")
+
+    time_matrix, distance_matrix = lookup_matrices(cache, nodes)
+    cache = evict_matrix_cache(cache, max(max_cached_nodes, len(set(nodes))))
+    save_matrix_cache(cache_dir, fingerprint, cache)
+
+    return time_matrix.tolist(), distance_matrix.tolist()
+
+
 # Function to generate the time and distance matrix using distance and speed
-def generate_matrices(G, customer_locations, depot_location, default_speed_kph=50):
-    # Find the nearest nodes for the depot and customer locations
-    nearest_nodes = [ox.distance.nearest_nodes(G, lon, lat) for lat, lon in customer_locations]
-    depot_node = ox.distance.nearest_nodes(G, depot_location[1], depot_location[0])
-    nodes = [depot_node] + nearest_nodes
-
-    time_matrix = []
-    distance_matrix = []
-    
-    for node_u in nodes:
-        time_row = []
-        distance_row = []
-        for node_v in nodes:
-            if node_u == node_v:
-                time_row.append(0)  # No travel time for the same node
-                distance_row.append(0)  # No distance for the same node
-            else:
-                try:
-                    # Find the shortest path between nodes and get the total distance
-                    path_length = nx.shortest_path_length(G, source=node_u, target=node_v, weight='length')
-                    
-                    # Get the edges along the shortest path
-                    path_edges = zip(nx.shortest_path(G, source=node_u, target=node_v, weight='length'),
-                                     nx.shortest_path(G, source=node_u, target=node_v, weight='length')[1:])
-                    
-                    # Calculate total time and distance using distance / speed limit for each edge
-                    total_time = 0
-                    total_distance = 0
-                    for u, v in path_edges:
-                        edge_data = G.get_edge_data(u, v)[0]
-                        distance = edge_data['length']  # Length of the edge in meters
-                        speed_kph = edge_data.get('maxspeed', default_speed_kph)  # Speed limit in kph
-                        
-                        # Handle different cases for speed_kph (convert to float)
-                        if isinstance(speed_kph, list):
-                            speed_kph = speed_kph[0]  # Take the first value if it's a list
-                        try:
-                            speed_kph = float(speed_kph)  # Try converting to float
-                        except (ValueError, TypeError):
-                            # If conversion fails, fallback to default speed
-                            speed_kph = default_speed_kph
-                        
-                        # Convert speed to m/s and calculate time for this edge
-                        speed_mps = speed_kph * 1000 / 3600  # Convert kph to m/s
-                        time = distance / speed_mps  # Time = distance / speed
-                        total_time += time * 1.20
-                        total_distance += distance
-                    
-                    time_row.append(total_time + 5 * 60)
-                    distance_row.append(total_distance)
-                except nx.NetworkXNoPath:
-                    time_row.append(float('inf'))  # If no path exists, set a high penalty time
-                    distance_row.append(float('inf'))  # If no path exists, set a high penalty distance
-        time_matrix.append(time_row)
-        distance_matrix.append(distance_row)
+def generate_matrices(G, customer_locations, depot_location, default_speed_kph=50, cache_dir=None, workers=1, backend="python"):
+    # Find the nearest nodes for the depot and customer locations in one query
+    locations = [depot_location] + list(customer_locations)
+    with span("snap_to_nodes"):
+        snapped_nodes, snap_distances = snap_to_nodes(G, [lat for lat, lon in locations], [lon for lat, lon in locations])
+    nodes = snapped_nodes.tolist()
+    count_metric("locations_snapped", len(locations))
+
+    for location_idx in np.flatnonzero(snap_distances > MAX_SNAP_DISTANCE):
+        print(f"Location {locations[location_idx]} is {snap_distances[location_idx]:.0f} meters from the nearest road")
+
+    with span("node_matrices"):
+        if cache_dir is None:
+            # One shortest path search per distinct origin, rows are reused for repeated nodes
+            time_matrix, distance_matrix = node_matrices(build_adjacency(G, default_speed_kph), nodes, workers, backend,
+                                                         graph_csr(G, default_speed_kph, backend))
+        else:
+            time_matrix, distance_matrix = cached_node_matrices(G, nodes, cache_dir, default_speed_kph, workers=workers, backend=backend)
 
     return time_matrix, distance_matrix, nodes
 
 
+# Waiting allowed at each stop, and the stop capacity of a vehicle in the load dimension (the depot
+# start counts as one stop, so a route has at most STOPS_PER_VEHICLE - 1 visits)
+MAX_WAIT = 3600
+STOPS_PER_VEHICLE = 20
+
+# Transit used for pairs without a path, large enough to make the arc infeasible in the time dimension
+UNREACHABLE = 10 ** 7
+
+
+def transit_matrices(time_matrix, distance_matrix, service_times):
+    """
+    Converts the travel matrices to dense int64 arrays for the solver.
+    The time transit includes the service time at the from node, values are truncated like int().
+    """
+    time_array = np.asarray(time_matrix, dtype=np.float64)
+    distance_array = np.asarray(distance_matrix, dtype=np.float64)
+    time_transit = np.where(np.isfinite(time_array), time_array, UNREACHABLE).astype(np.int64)
+    time_transit += np.asarray(service_times, dtype=np.int64)[:, None]
+    distance_transit = np.where(np.isfinite(distance_array), distance_array, UNREACHABLE).astype(np.int64)
+    return time_transit, distance_transit
+
+
+def register_transit_matrix(routing, manager, matrix):
+    """
+    Registers a node indexed transit matrix, as a matrix transit if this OR-Tools version supports it.
+    """
+    values = matrix.tolist()
+    if hasattr(routing, "RegisterTransitMatrix"):
+        return routing.RegisterTransitMatrix(values)
+
+    def transit_callback(from_index, to_index):
+        count_metric("transit_callbacks")
+        return values[manager.IndexToNode(from_index)][manager.IndexToNode(to_index)]
+    return routing.RegisterTransitCallback(transit_callback)
+
+
+def register_unary_transit_vector(routing, manager, values):
+    """
+    Registers a node indexed unary transit, as a vector transit if this OR-Tools version supports it.
+    """
+    values = list(values)
+    if hasattr(routing, "RegisterUnaryTransitVector"):
+        return routing.RegisterUnaryTransitVector(values)
+
+    def transit_callback(from_index):
+        count_metric("transit_callbacks")
+        return values[manager.IndexToNode(from_index)]
+    return routing.RegisterUnaryTransitCallback(transit_callback)
+
+
 # Function to determine vehicle compatibility with customer requirements
 def vehicle_service_compatibility(vehicle_services, customer_services):
     return all(service in vehicle_services for service in customer_services)
 
 
+PENALTIES = {
+    'license': 500,      # High penalty for lack of license
+    'smoker': 50,        # Lower penalty for smoker presence
+    'dog': 100,           # Penalty for dogs
+    'cat': 100,           # Penalty for cats
+    '>18': 2500,           # Penalty if employee is not >18
+    'man': 3500,           # High penalty for gender requirement not met
+    'woman': 3500,         # High penalty for gender requirement not met
+    'medication': 4000,    # High penalty for missing medication requirement
+    'insulin': 4000,       # High penalty for missing insulin requirement
+    'stoma': 400,         # High penalty for missing stoma requirement
+    'double_staffing': 450, # High penalty for double staffing not met
+    'shower': 300,        # Penalty for unmet shower requirements
+    'activation': 200,    # Penalty for unmet activation requirements
+    'unknown': 4000       # Constraint names not in data_processing.KRAV, no medarbetare has them
+}
+
+# Penalty of each bit of the constraint masks, in the bit order of data_processing.KRAV followed by OKÄND_KRAV
+PENALTY_PER_BIT = np.array([PENALTIES.get(name, 0) for name in KRAV + ['unknown']], dtype=np.int64)
+
+
 def calculate_penalty(unmet_constraints):
     """
     Calculates the total penalty based on unmet constraints.
     """
-    PENALTIES = {
-        'license': 500,      # High penalty for lack of license
-        'smoker': 50,        # Lower penalty for smoker presence
-        'dog': 100,           # Penalty for dogs
-        'cat': 100,           # Penalty for cats
-        '>18': 2500,           # Penalty if employee is not >18
-        'man': 3500,           # High penalty for gender requirement not met
-        'woman': 3500,         # High penalty for gender requirement not met
-        'medication': 4000,    # High penalty for missing medication requirement
-        'insulin': 4000,       # High penalty for missing insulin requirement
-        'stoma': 400,         # High penalty for missing stoma requirement
-        'double_staffing': 450, # High penalty for double staffing not met
-        'shower': 300,        # Penalty for unmet shower requirements
-        'activation': 200     # Penalty for unmet activation requirements
-    }
     return sum(PENALTIES.get(constraint, 0) for constraint in unmet_constraints)
 
 
+def mask_penalties(masks):
+    """
+    Sums the penalties of the constraint bits set in each of masks.
+    """
+    bits = (np.asarray(masks, dtype=np.int64)[:, None] >> np.arange(len(PENALTY_PER_BIT))) & 1
+    return bits @ PENALTY_PER_BIT
 
-# Main function to perform route optimization
-def optimize_routes(brukare_df, medarbetare_df, G, depot_location, antal_medarbetare, shift_start, shift_end, time_file="time_matrix.npy", distance_file="distance_matrix.npy", nodes_file="nodes.npy"):
+
+def compatibility(constraint_masks, capability_masks):
+    """
+    Returns the customer x vehicle matrix of which vehicles have every constraint of each customer.
+    """
+    constraint_masks = np.asarray(constraint_masks, dtype=np.int64)
+    capability_masks = np.asarray(capability_masks, dtype=np.int64)
+    return (constraint_masks[:, None] & ~capability_masks[None, :]) == 0
+
+
+
+def constraint_masks_of(brukare_df):
+    """
+    Returns the constraint masks of brukare_df, encoding the Constraints strings if there is no ConstraintMask column.
+    """
+    if 'ConstraintMask' in brukare_df.columns:
+        return brukare_df['ConstraintMask'].to_numpy(dtype=np.int64)
+    return krav_mask(brukare_df['Constraints']).to_numpy()
+
+
+def capability_masks_of(medarbetare_df, num_vehicles):
     """
-        if os.path.exists(time_file) and os.path.exists(distance_file) and os.path.exists(nodes_file):
-            # Load the saved matrices and nodes using numpy
-            time_matrix, distance_matrix, nodes = load_matrices(time_file, distance_file, nodes_file)
-            print("Loaded matrices from file.")
+    Returns the capability masks of the first num_vehicles medarbetare.
+    """
+    if 'CapabilityMask' in medarbetare_df.columns:
+        return medarbetare_df['CapabilityMask'].to_numpy(dtype=np.int64)[:num_vehicles]
+    return krav_mask(medarbetare_df['Capabilities']).to_numpy()[:num_vehicles]
 
-            customer_locations = [(G.nodes[node]['y'], G.nodes[node]['x']) for node in nodes[1:]]
 
+def vehicle_assignment(constraint_masks, capability_masks):
+    """
+    Returns for each customer the list of vehicles that have all its constraints and the drop
+    penalty, which is None if some vehicle can serve it. A customer no vehicle can serve gets
+    the allowed list None and the penalty of the constraints the last vehicle misses, which
+    are also returned as masks.
+    """
+    constraint_masks = np.asarray(constraint_masks, dtype=np.int64)
+    capability_masks = np.asarray(capability_masks, dtype=np.int64)
+    allowed_matrix = compatibility(constraint_masks, capability_masks)
+
+    # Constraints a customer nobody can serve misses with the last vehicle
+    unmet_masks = constraint_masks & ~capability_masks[-1] if len(capability_masks) else constraint_masks
+    unmet_penalties = mask_penalties(unmet_masks)
+
+    allowed_vehicles = []
+    drop_penalties = []
+    for customer, allowed in enumerate(allowed_matrix):
+        if not allowed.any():
+            allowed_vehicles.append(None)
+            drop_penalties.append(int(unmet_penalties[customer]))
         else:
-            # Generate customer locations
-            customer_locations = list(zip(brukare_df['Latitude'].astype("float"), brukare_df['Longitude'].astype("float")))
+            allowed_vehicles.append(np.flatnonzero(allowed).tolist())
+            drop_penalties.append(None)
+    return allowed_vehicles, drop_penalties, unmet_masks
 
-            # Generate matrices (this is computationally expensive)
-            time_matrix, distance_matrix, nodes = generate_matrices(G, customer_locations, depot_location)
 
-            # Save the matrices for future runs
-            save_matrices(time_matrix, distance_matrix, nodes, time_file, distance_file, nodes_file)
-            print("Generated and saved matrices.")
+def time_window(tidsfönster, shift_start):
     """
+    Returns the (start, end) in seconds after shift_start of a Tidsfönster such as ("Middag", "15-17").
+    """
+    start, end = tidsfönster[1].split("-")
+    return ((int(start) - shift_start) * 3600, (int(end) - shift_start) * 3600)
+
 
+def prepare_routing_inputs(brukare_df, medarbetare_df, G, depot_location, antal_medarbetare, shift_start, shift_end, cache_dir="matrix_cache", matrix_workers=1, matrix_backend="python", matrices=None):
+    """
+    Builds everything the routing model needs as plain Python/NumPy data (matrices, time windows,
+    service times and vehicle compatibility), so it can be cached, pickled or reused between solves.
+    Travel matrices are read from and saved to cache_dir, pass None to always recompute them.
+    matrix_workers is the number of processes used to compute missing matrix rows and
+    matrix_backend selects the shortest path engine ("python" or "csr", see matrix_rows).
+    matrices can be an already computed (time_matrix, distance_matrix, nodes) for the depot
+    followed by the rows of brukare_df, then G is not used.
+    """
     customer_locations = list(zip(brukare_df['Latitude'].astype("float"), brukare_df['Longitude'].astype("float")))
 
-    # Generate matrices (this is computationally expensive)
-    time_matrix, distance_matrix, nodes = generate_matrices(G, customer_locations, depot_location)
+    # Generate matrices, only node pairs missing from the cache are computed
+    if matrices is None:
+        with span("generate_matrices"):
+            time_matrix, distance_matrix, nodes = generate_matrices(G, customer_locations, depot_location, cache_dir=cache_dir, workers=matrix_workers, backend=matrix_backend)
+    else:
+        time_matrix, distance_matrix, nodes = matrices
 
     num_vehicles = antal_medarbetare
-    depot_index = 0
-
     num_nodes = len(nodes)
 
     # Initialize the time_windows list
-    temp = brukare_df["Tidsfönster"].values
-    time_windows = [ ((int(thing[1].split("-")[0])-shift_start) * 3600, (int(thing[1].split("-")[1])-shift_start) * 3600) for thing in temp]
+    time_windows = [time_window(thing, shift_start) for thing in brukare_df["Tidsfönster"].values]
     time_windows.insert(0, (0, (shift_end - shift_start) * 3600))
 
-
     service_times = [0]
 
     for i in range(1, num_nodes):
         service_times.append(int(brukare_df["Tid"].iloc[i-1]) * 60)
 
+    # Vehicles allowed to serve each customer, or the penalty for dropping it if no vehicle can
+    with span("compatibility"):
+        allowed, penalties, unmet_masks = vehicle_assignment(constraint_masks_of(brukare_df),
+                                                             capability_masks_of(medarbetare_df, num_vehicles))
+    for customer, penalty in enumerate(penalties):
+        if penalty is not None:
+            print(f"{brukare_df['Individ'].iloc[customer]} has unmet constraints {krav_namn(unmet_masks[customer])}")
+
+    allowed_vehicles = [None] + allowed
+    drop_penalties = [None] + penalties
+
+    return {
+        "time_matrix": time_matrix,
+        "distance_matrix": distance_matrix,
+        "nodes": nodes,
+        "time_windows": time_windows,
+        "service_times": service_times,
+        "allowed_vehicles": allowed_vehicles,
+        "drop_penalties": drop_penalties,
+        "individer": ["Depot"] + list(brukare_df['Individ']),
+        "num_vehicles": num_vehicles,
+        "shift_start": shift_start,
+        "shift_end": shift_end,
+    }
+
+
+def build_routing_model(inputs):
+    """
+    Creates the OR-Tools model for inputs from prepare_routing_inputs.
+    Returns a dict with the manager, routing model, time dimension and callback indices.
+    """
+    time_matrix = inputs["time_matrix"]
+    time_windows = inputs["time_windows"]
+    num_vehicles = inputs["num_vehicles"]
+    num_nodes = len(inputs["nodes"])
+    shift_start = inputs["shift_start"]
+    shift_end = inputs["shift_end"]
+    depot_index = 0
+
     # Create the routing index manager
     manager = pywrapcp.RoutingIndexManager(len(time_matrix), num_vehicles, depot_index)
 
@@ -162,32 +519,20 @@ def optimize_routes(brukare_df, medarbetare_df, G, depot_location, antal_medarbe
     for vehicle_id in range(num_vehicles):
         routing.SetFixedCostOfVehicle(vehicle_fixed_cost, vehicle_id)
 
-    # Define the time callback function
-    def time_callback(from_index, to_index):
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        travel_time = int(time_matrix[from_node][to_node])
-        service_time = int(service_times[from_node])
-        return travel_time + service_time
-
-    # Define the distance callback function
-    def distance_callback(from_index, to_index):
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        distance = int(distance_matrix[from_node][to_node])
-        return distance
-
-    # Register the time callback
-    transit_callback_index = routing.RegisterTransitCallback(time_callback)
+    # Precompute the integer transits once, the solver reads them without calling back into Python
+    time_transit, distance_transit = transit_matrices(time_matrix, inputs["distance_matrix"], inputs["service_times"])
+
+    # Register the time transit (travel time + service time at the from node)
+    transit_callback_index = register_transit_matrix(routing, manager, time_transit)
     
-    # Register the distance callback (if you need to optimize based on distance)
-    distance_callback_index = routing.RegisterTransitCallback(distance_callback)
+    # Register the distance transit (if you need to optimize based on distance)
+    distance_callback_index = register_transit_matrix(routing, manager, distance_transit)
 
 
     time = "Time"
     routing.AddDimension(
         transit_callback_index,
-        int(3600),  # allow waiting time 
+        MAX_WAIT,  # allow waiting time
         (shift_end - shift_start) * 3600,  # maximum time per vehicle 
         True,  
         time,
@@ -220,220 +565,377 @@ def optimize_routes(brukare_df, medarbetare_df, G, depot_location, antal_medarbe
         )
         routing.AddVariableMinimizedByFinalizer(time_dimension.CumulVar(routing.End(i)))
 
-    def demand_callback(from_index):
-        return 1  # Each customer represents a "load" of 1.
-
-
-    # Add a demand callback to enforce load balancing
-    demand_callback_index = routing.RegisterUnaryTransitCallback(demand_callback)
+    # Add a demand to enforce load balancing, each customer represents a "load" of 1
+    demand_callback_index = register_unary_transit_vector(routing, manager, [1] * num_nodes)
 
     # Add dimension to keep track of the load (number of nodes visited)
-    stops_per_vehicle = 20
     routing.AddDimensionWithVehicleCapacity(
         demand_callback_index,
         0,  # No slack
-        [stops_per_vehicle] * num_vehicles,  # Maximum capacity for each vehicle (adjust as necessary)
+        [STOPS_PER_VEHICLE] * num_vehicles,  # Maximum capacity for each vehicle (adjust as necessary)
         True,  # Start cumul to zero
         "Load"
     )
 
-
-    for node_index in range(1, len(customer_locations) + 1):
-        customer_id = node_index  # Assuming customer IDs start from 1
-        allowed_vehicles = []
-        unmet_constraints = []
-
-        # Retrieve the specific constraints from brukare (example logic)
-        customer_services = brukare_df.loc[node_index - 1, 'Constraints'].split(',')  # Example: "medication,smoker"
-        
-        # Check compatibility for each vehicle
-        for vehicle_id in range(num_vehicles):
-            vehicle_services = medarbetare_df.loc[vehicle_id, 'Capabilities'].split(',')  # Example: "medication,license"
-            
-            if vehicle_service_compatibility(vehicle_services, customer_services):
-                allowed_vehicles.append(vehicle_id)
-            else:
-                unmet_constraints = [service for service in customer_services if service not in vehicle_services]
-
-        # Apply penalties if no vehicles can fully serve the customer
-        if not allowed_vehicles:
-            penalty = calculate_penalty(unmet_constraints)
-            print(f"{brukare_df['Individ'].iloc[node_index-1]} has unmet constraints {unmet_constraints}")
-            routing.AddDisjunction([manager.NodeToIndex(node_index)], penalty)
-        else:
-            # Set allowed vehicles for this customer node
-            routing.VehicleVar(manager.NodeToIndex(node_index)).SetValues(allowed_vehicles)
+    for node_index in range(1, num_nodes):
+        index = manager.NodeToIndex(node_index)
+        allowed = inputs["allowed_vehicles"][node_index]
+        penalty = inputs["drop_penalties"][node_index]
+        if penalty is not None:
+            routing.AddDisjunction([index], penalty)
+        if allowed is not None:
+            # Set allowed vehicles for this customer node (-1 is the vehicle of a dropped node)
+            routing.VehicleVar(index).SetValues(allowed if penalty is None else [-1] + allowed)
     
     # Set the cost of travel (objective is to minimize total time)
     routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
 
-    # Define search parameters
+    return {
+        "inputs": inputs,
+        "manager": manager,
+        "routing": routing,
+        "time_dimension": time_dimension,
+        "transit_callback_index": transit_callback_index,
+        "distance_callback_index": distance_callback_index,
+        "demand_callback_index": demand_callback_index,
+    }
+
+
+def default_search_parameters(time_limit=120, log_search=True):
+    """
+    Returns the search parameters used by optimize_routes.
+    """
     search_parameters = pywrapcp.DefaultRoutingSearchParameters()
     search_parameters.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.AUTOMATIC
     search_parameters.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.TABU_SEARCH
-    search_parameters.time_limit.seconds = 120
-    search_parameters.log_search = True
+    search_parameters.time_limit.seconds = time_limit
+    search_parameters.log_search = log_search
+    return search_parameters
 
-    # Solve the problem
-    solution = routing.SolveWithParameters(search_parameters)
-
-    def seconds_to_hhmm(seconds, shift=False):
-        """
-        Converts seconds to a string in HH:MM format.
-        If shift is True, adds a 7-hour shift to the time.
-        """
-        if shift:
-            total_seconds = seconds + shift_start * 3600  # Shift by 7 hours
-        else:
-            total_seconds = seconds
-        hours = int(total_seconds // 3600)
-        minutes = int((total_seconds % 3600) // 60)
-        return f"{hours:02d}:{minutes:02d}"
-
-    # Initialize an output string to collect the printouts
-    output_string = ""
-
-    if solution:
-        total_time = 0  # In seconds
-        total_distance = 0  # In meters
-        total_travel_time = 0  # In seconds
-        total_wait_time = 0  # In seconds
-        total_service_time = 0  # In seconds
-        active_vehicles = 0  # Count of vehicles with actual routes
-
-        # Initialize a dictionary to collect timetable entries per vehicle
-        timetable_per_vehicle = {}
-
-        for vehicle_id in range(num_vehicles):
-            index = routing.Start(vehicle_id)
-            if routing.IsEnd(solution.Value(routing.NextVar(index))):
-                continue  # Skip vehicles with no assignments
-            active_vehicles += 1
-            route_distance = 0  # In meters
-            route_travel_time = 0  # In seconds
-            route_wait_time = 0  # In seconds
-            route_service_time = 0  # In seconds
-
-            vehicle_schedule = []
-
-            while not routing.IsEnd(index):
-                node_index = manager.IndexToNode(index)
-                time_var = time_dimension.CumulVar(index)
-                arrival_time = solution.Value(time_var)
-                service_time = service_times[node_index]
-                time_window = time_windows[node_index]
-
-                if node_index == 0:
-                    individ_name = "Depot"
-                else:
-                    individ_name = brukare_df['Individ'].iloc[node_index - 1]
-
-                # Collect schedule information
-                vehicle_schedule.append({
-                    'Vehicle': vehicle_id + 1,
-                    'Location': individ_name,
-                    'Arrival Time': seconds_to_hhmm(arrival_time, shift=True),
-                    'Service Start': seconds_to_hhmm(arrival_time, shift=True),
-                    'Service End': seconds_to_hhmm(arrival_time + service_time, shift=True),
-                    'Departure Time': seconds_to_hhmm(arrival_time + service_time, shift=True),
-                    'Time Window Start': seconds_to_hhmm(time_window[0], shift=True),
-                    'Time Window End': seconds_to_hhmm(time_window[1], shift=True),
-                })
-
-                next_index = solution.Value(routing.NextVar(index))
-
-                if not routing.IsEnd(next_index):
-                    next_node_index = manager.IndexToNode(next_index)
-                    arrival_time_next = solution.Value(time_dimension.CumulVar(next_index))
-                    travel_time_matrix = time_matrix[node_index][next_node_index]
-
-                    # Calculate departure time based on next arrival time minus travel time
-                    departure_time = arrival_time_next - travel_time_matrix
-
-                    # Ensure departure time is not before service completion
-                    earliest_departure = arrival_time + service_time
-                    if departure_time < earliest_departure:
-                        departure_time = earliest_departure
-
-                    # Calculate wait time
-                    wait_time = departure_time - earliest_departure
-
-                    # Travel time to next node
-                    travel_time = arrival_time_next - departure_time
-
-                    # Accumulate times
-                    route_travel_time += travel_time
-                    route_wait_time += wait_time
-                    route_service_time += service_time
-
-                    # Distance between current node and next node
-                    distance = distance_matrix[node_index][next_node_index]
-                    route_distance += distance
-
-                else:
-                    # At the last node (returning to depot), no next node
-                    departure_time = arrival_time + service_time
-                    wait_time = 0
-                    route_service_time += service_time
-
-                index = next_index
-
-            # Sort the vehicle schedule by arrival time
-            vehicle_schedule_sorted = sorted(vehicle_schedule, key=lambda x: x['Arrival Time'])
-            timetable_per_vehicle[vehicle_id + 1] = vehicle_schedule_sorted
-
-            # Compute total route time
-            route_total_time_seconds = route_travel_time + route_wait_time + route_service_time
-
-            # Accumulate totals
-            total_time += route_total_time_seconds
-            total_distance += route_distance
-            total_travel_time += route_travel_time
-            total_wait_time += route_wait_time
-            total_service_time += route_service_time
-
-        # Now, create a timetable overview per vehicle
-        output_string += "=== Timetable Overview ===\n\n"
-
-        for vehicle_id in sorted(timetable_per_vehicle.keys()):
-            vehicle_schedule = timetable_per_vehicle[vehicle_id]
-            output_string += f"--- Vehicle {vehicle_id} Route ---\n"
+
+def add_stopping_policy(model, stagnation_seconds=None, stagnation_solutions=None, target_objective=None, on_solution=None):
+    """
+    Adds early stopping and solution reporting to the search of model.
+    The search stops when the objective has not improved for stagnation_seconds or for
+    stagnation_solutions solutions, or when it reaches target_objective (the time limit of
+    the search parameters still applies). on_solution is called with a dict (cost, active
+    vehicles, dropped visits and their penalties, elapsed seconds) for every improving solution.
+    Returns the list of improving solutions, filled in during the search.
+    """
+    inputs = model["inputs"]
+    manager = model["manager"]
+    routing = model["routing"]
+    state = {"best": None, "improved_at": monotonic(), "solutions_since": 0, "started_at": monotonic()}
+    improvements = []
+
+    def at_solution():
+        count_metric("solutions_found")
+        cost = routing.CostVar().Max()
+        if state["best"] is not None and cost >= state["best"]:
+            state["solutions_since"] += 1
+            return
+        count_metric("improving_solutions")
+        state["best"] = cost
+        state["improved_at"] = monotonic()
+        state["solutions_since"] = 0
+
+        active_vehicles = sum(not routing.IsEnd(routing.NextVar(routing.Start(v)).Value())
+                              for v in range(inputs["num_vehicles"]))
+        dropped = [node for node in range(1, len(inputs["nodes"]))
+                   if inputs["drop_penalties"][node] is not None
+                   and routing.NextVar(manager.NodeToIndex(node)).Value() == manager.NodeToIndex(node)]
+        improvement = {
+            "cost": cost,
+            "active_vehicles": active_vehicles,
+            "dropped": [inputs["individer"][node] for node in dropped],
+            "unmet_penalty": sum(inputs["drop_penalties"][node] for node in dropped),
+            "elapsed": monotonic() - state["started_at"],
+        }
+        improvements.append(improvement)
+        if on_solution is not None:
+            on_solution(improvement)
+
+    def should_stop():
+        if state["best"] is None:
+            return False
+        if target_objective is not None and state["best"] <= target_objective:
+            return True
+        if stagnation_seconds is not None and monotonic() - state["improved_at"] > stagnation_seconds:
+            return True
+        if stagnation_solutions is not None and state["solutions_since"] >= stagnation_solutions:
+            return True
+        return False
+
+    routing.AddAtSolutionCallback(at_solution)
+    if stagnation_seconds is not None or stagnation_solutions is not None or target_objective is not None:
+        routing.AddSearchMonitor(routing.solver().CustomLimit(should_stop))
+    return improvements
+
+
+def solve_routing_model(model, search_parameters=None, initial_routes=None):
+    """
+    Solves a model from build_routing_model.
+    initial_routes is an optional list with one list of customer node indices per vehicle
+    that the search starts from. Returns the OR-Tools assignment or None.
+    """
+    routing = model["routing"]
+    if search_parameters is None:
+        search_parameters = default_search_parameters()
+
+    if initial_routes is not None:
+        initial_solution = routing.ReadAssignmentFromRoutes(initial_routes, True)
+        if initial_solution is not None:
+            return routing.SolveFromAssignmentWithParameters(initial_solution, search_parameters)
+        print("Initial routes are not feasible, solving from scratch.")
+
+    return routing.SolveWithParameters(search_parameters)
+
+
+def solve_inputs(inputs, time_limit=120, initial_routes=None, stagnation_seconds=None, stagnation_solutions=None,
+                 target_objective=None, on_solution=None):
+    """
+    Builds and solves the model for inputs from prepare_routing_inputs and returns the report
+    from extract_routes. Everything in and out is plain data, so it can run in a worker process.
+    The stopping options are described in add_stopping_policy.
+    """
+    if inputs["num_vehicles"] == 0:
+        return None
+    model = build_routing_model(inputs)
+    add_stopping_policy(model, stagnation_seconds, stagnation_solutions, target_objective, on_solution)
+    solution = solve_routing_model(model, default_search_parameters(time_limit, log_search=False), initial_routes)
+    return extract_routes(model, solution)
+
+
+def seconds_to_hhmm(seconds, shift_start=None):
+    """
+    Converts seconds to a string in HH:MM format.
+    If shift_start is given, the seconds are counted from the start of the shift.
+    """
+    if shift_start is not None:
+        total_seconds = seconds + shift_start * 3600  # Shift by the start of the shift
+    else:
+        total_seconds = seconds
+    hours = int(total_seconds // 3600)
+    minutes = int((total_seconds % 3600) // 60)
+    return f"{hours:02d}:{minutes:02d}"
+
+
+def extract_routes(model, solution):
+    """
+    Turns a solution of model into structured data: the node index routes and the
+    schedule per vehicle, the overall totals and the objective value.
+    Returns None if there is no solution.
+    """
+    if not solution:
+        return None
+
+    inputs = model["inputs"]
+    manager = model["manager"]
+    routing = model["routing"]
+    time_dimension = model["time_dimension"]
+    time_matrix = inputs["time_matrix"]
+    distance_matrix = inputs["distance_matrix"]
+    service_times = inputs["service_times"]
+    time_windows = inputs["time_windows"]
+    shift_start = inputs["shift_start"]
+
+    total_time = 0  # In seconds
+    total_distance = 0  # In meters
+    total_travel_time = 0  # In seconds
+    total_wait_time = 0  # In seconds
+    total_service_time = 0  # In seconds
+    active_vehicles = 0  # Count of vehicles with actual routes
+
+    # Initialize dictionaries to collect routes and timetable entries per vehicle
+    routes = {}
+    timetable_per_vehicle = {}
+
+    for vehicle_id in range(inputs["num_vehicles"]):
+        index = routing.Start(vehicle_id)
+        if routing.IsEnd(solution.Value(routing.NextVar(index))):
+            continue  # Skip vehicles with no assignments
+        active_vehicles += 1
+        route_distance = 0  # In meters
+        route_travel_time = 0  # In seconds
+        route_wait_time = 0  # In seconds
+        route_service_time = 0  # In seconds
+
+        route = []
+        vehicle_schedule = []
+
+        while not routing.IsEnd(index):
+            node_index = manager.IndexToNode(index)
+            time_var = time_dimension.CumulVar(index)
+            arrival_time = solution.Value(time_var)
+            service_time = service_times[node_index]
+            time_window = time_windows[node_index]
+
+            if node_index != 0:
+                route.append(node_index)
+
+            # Collect schedule information
+            vehicle_schedule.append({
+                'Vehicle': vehicle_id + 1,
+                'Node': node_index,
+                'Location': inputs["individer"][node_index],
+                'Arrival Time': seconds_to_hhmm(arrival_time, shift_start),
+                'Service Start': seconds_to_hhmm(arrival_time, shift_start),
+                'Service End': seconds_to_hhmm(arrival_time + service_time, shift_start),
+                'Departure Time': seconds_to_hhmm(arrival_time + service_time, shift_start),
+                'Time Window Start': seconds_to_hhmm(time_window[0], shift_start),
+                'Time Window End': seconds_to_hhmm(time_window[1], shift_start),
+            })
+
+            next_index = solution.Value(routing.NextVar(index))
+
+            if not routing.IsEnd(next_index):
+                next_node_index = manager.IndexToNode(next_index)
+                arrival_time_next = solution.Value(time_dimension.CumulVar(next_index))
+                travel_time_matrix = time_matrix[node_index][next_node_index]
+
+                # Calculate departure time based on next arrival time minus travel time
+                departure_time = arrival_time_next - travel_time_matrix
+
+                # Ensure departure time is not before service completion
+                earliest_departure = arrival_time + service_time
+                if departure_time < earliest_departure:
+                    departure_time = earliest_departure
+
+                # Calculate wait time
+                wait_time = departure_time - earliest_departure
+
+                # Travel time to next node
+                travel_time = arrival_time_next - departure_time
+
+                # Accumulate times
+                route_travel_time += travel_time
+                route_wait_time += wait_time
+                route_service_time += service_time
+
+                # Distance between current node and next node
+                distance = distance_matrix[node_index][next_node_index]
+                route_distance += distance
+
+            else:
+                # At the last node (returning to depot), no next node
+                route_service_time += service_time
+
+            index = next_index
+
+        # Sort the vehicle schedule by arrival time
+        routes[vehicle_id] = route
+        timetable_per_vehicle[vehicle_id + 1] = sorted(vehicle_schedule, key=lambda x: x['Arrival Time'])
+
+        # Accumulate totals
+        total_time += route_travel_time + route_wait_time + route_service_time
+        total_distance += route_distance
+        total_travel_time += route_travel_time
+        total_wait_time += route_wait_time
+        total_service_time += route_service_time
+
+    return {
+        "objective": solution.ObjectiveValue(),
+        "routes": routes,
+        "timetable": timetable_per_vehicle,
+        "summary": {
+            "active_vehicles": active_vehicles,
+            "total_time": total_time,
+            "total_distance": total_distance,
+            "total_travel_time": total_travel_time,
+            "total_wait_time": total_wait_time,
+            "total_service_time": total_service_time,
+        },
+    }
+
+
+def format_report(report):
+    """
+    Formats a report from extract_routes as the timetable overview text.
+    """
+    if report is None:
+        return "No solution found!\n"
+
+    # Now, create a timetable overview per vehicle
+    output_string = "=== Timetable Overview ===\n\n"
+
+    for vehicle_id in sorted(report["timetable"].keys()):
+        vehicle_schedule = report["timetable"][vehicle_id]
+        output_string += f"--- Vehicle {vehicle_id} Route ---\n"
+        output_string += "{:<15} {:<12} {:<12} {:<12} {:<12} {:<12} {:<12}\n".format(
+            'Location', 'Arrival', 'Service Start', 'Service End', 'Departure', 'TW Start', 'TW End'
+        )
+        output_string += "-" * 80 + "\n"
+
+        for entry in vehicle_schedule:
             output_string += "{:<15} {:<12} {:<12} {:<12} {:<12} {:<12} {:<12}\n".format(
-                'Location', 'Arrival', 'Service Start', 'Service End', 'Departure', 'TW Start', 'TW End'
+                entry['Location'],
+                entry['Arrival Time'],
+                entry['Service Start'],
+                entry['Service End'],
+                entry['Departure Time'],
+                entry['Time Window Start'],
+                entry['Time Window End'],
             )
-            output_string += "-" * 80 + "\n"
-
-            for entry in vehicle_schedule:
-                output_string += "{:<15} {:<12} {:<12} {:<12} {:<12} {:<12} {:<12}\n".format(
-                    entry['Location'],
-                    entry['Arrival Time'],
-                    entry['Service Start'],
-                    entry['Service End'],
-                    entry['Departure Time'],
-                    entry['Time Window Start'],
-                    entry['Time Window End'],
-                )
-            output_string += "\n"
-
-        # Overall summary
-        overall_summary = f"=== Overall Summary ===\n"
-        overall_summary += f"Total Active Vehicles    : {active_vehicles}\n"
-        overall_summary += f"Total Time of All Routes : {seconds_to_hhmm(total_time)}\n"
-        overall_summary += f"Total Distance of All Routes: {total_distance:.0f} meters\n"
-        overall_summary += f"Total Travel Time        : {seconds_to_hhmm(total_travel_time)}\n"
-        overall_summary += f"Total Wait Time          : {seconds_to_hhmm(total_wait_time)}\n"
-        overall_summary += f"Total Service Time       : {seconds_to_hhmm(total_service_time)}\n"
-        # Calculate average speed
-        if total_travel_time > 0:
-            average_speed = (total_distance / total_travel_time) * 3.6  # m/s to km/h
-            overall_summary += f"Average Speed            : {average_speed:.2f} km/h\n"
-        else:
-            overall_summary += "Average Speed            : N/A (No routes found)\n"
-
-        # Append overall summary to the output string
-        output_string += overall_summary
+        output_string += "\n"
+
+    summary = report["summary"]
+
+    # Overall summary
+    overall_summary = f"=== Overall Summary ===\n"
+    overall_summary += f"Total Active Vehicles    : {summary['active_vehicles']}\n"
+    overall_summary += f"Total Time of All Routes : {seconds_to_hhmm(summary['total_time'])}\n"
+    overall_summary += f"Total Distance of All Routes: {summary['total_distance']:.0f} meters\n"
+    overall_summary += f"Total Travel Time        : {seconds_to_hhmm(summary['total_travel_time'])}\n"
+    overall_summary += f"Total Wait Time          : {seconds_to_hhmm(summary['total_wait_time'])}\n"
+    overall_summary += f"Total Service Time       : {seconds_to_hhmm(summary['total_service_time'])}\n"
+    # Calculate average speed
+    if summary['total_travel_time'] > 0:
+        average_speed = (summary['total_distance'] / summary['total_travel_time']) * 3.6  # m/s to km/h
+        overall_summary += f"Average Speed            : {average_speed:.2f} km/h\n"
     else:
-        output_string += "No solution found!\n"
+        overall_summary += "Average Speed            : N/A (No routes found)\n"
+
+    # Append overall summary to the output string
+    output_string += overall_summary
+    return output_string
+
+
+# Main function to perform route optimization
+def optimize_routes(brukare_df, medarbetare_df, G, depot_location, antal_medarbetare, shift_start, shift_end, cache_dir="matrix_cache", matrix_workers=1, matrix_backend="python", warm_start_file=None, warm_start_key="default",
+                    time_limit=120, stagnation_seconds=None, stagnation_solutions=None, target_objective=None, on_solution=None):
+    """
+    Plans the routes for one shift, prints the timetable and writes it to route_output.txt.
+    See prepare_routing_inputs for the matrix options. Returns the report from extract_routes.
+    If warm_start_file is given, the search starts from the routes last saved there under
+    warm_start_key and the new routes are saved back.
+    The search runs for at most time_limit seconds, see add_stopping_policy for the other options.
+    """
+    from warm_start import load_routes, save_routes, initial_routes_from_saved
+
+    with span("prepare_routing_inputs"):
+        inputs = prepare_routing_inputs(brukare_df, medarbetare_df, G, depot_location, antal_medarbetare, shift_start, shift_end,
+                                        cache_dir, matrix_workers, matrix_backend)
+    with span("build_routing_model"):
+        model = build_routing_model(inputs)
+
+    # Start from the previous routes if there are any
+    initial_routes = None
+    if warm_start_file is not None:
+        with span("warm_start"):
+            saved_routes = load_routes(warm_start_file, warm_start_key)
+            if saved_routes is not None:
+                initial_routes = initial_routes_from_saved(saved_routes, inputs)
+
+    # Solve the problem
+    add_stopping_policy(model, stagnation_seconds, stagnation_solutions, target_objective, on_solution)
+    with span("search"):
+        solution = solve_routing_model(model, default_search_parameters(time_limit), initial_routes)
+
+    with span("extract_routes"):
+        report = extract_routes(model, solution)
+    if report is not None and warm_start_file is not None:
+        save_routes(warm_start_file, warm_start_key, report, inputs)
+    output_string = format_report(report)
 
     # Print the output_string to the console (optional)
     print(output_string)
@@ -442,3 +944,4 @@ def optimize_routes(brukare_df, medarbetare_df, G, depot_location, antal_medarbe
     with open('route_output.txt', 'w') as f:
         f.write(output_string)
 
+    return report
@@ -0,0 +1,387 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from itertools import count
+from multiprocessing import Manager
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from data_processing import ladda_data, ladda_koordinater, rensa_medarb_data
+from dataframe_creation import skapa_veckomodell, dag_df, skift_df, veckodag, DATA_FIL, ADRESS_FIL
+from graph_snapshot import load_graph
+from snapping import snap_to_nodes
+from route_optimization import matrix_rows, prepare_routing_inputs, solve_inputs, format_report
+from replanning import replanning_graph, plan_from_report, add_visit, remove_visit, change_visit
+from warm_start import saved_visits, initial_routes_from_saved
+from week import DEPOT_LOCATION, SKIFT_TIDER
+from metrics import count as count_metric
+
+HOST = "127.0.0.1"
+PORT = 8765
+MAX_STORED_NODES = 5000  # The in-memory matrices start over when they would grow past this many nodes
+MAX_FINISHED_JOBS = 200  # The oldest finished jobs are forgotten beyond this many
+SKIFT = {"fm": True, "em": False}
+REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 409: "Conflict"}
+
+
+def matrix_store():
+    """
+    Returns an empty in-memory travel matrix store for store_matrices.
+    """
+    return {"nodes": [], "index": {}, "time": np.zeros((0, 0)), "distance": np.zeros((0, 0)),
+            "lock": threading.Lock()}
+
+
+def store_matrices(store, graph, nodes, workers=1):
+    """
+    Returns the time and distance matrices between nodes from store. For nodes the store does not
+    have yet one search is run forward (their rows) and one on the reversed graph (their columns),
+    graph comes from replanning.replanning_graph.
+    """
+    with store["lock"]:
+        new = [node for node in dict.fromkeys(nodes) if node not in store["index"]]
+        count_metric("matrix_cache_hits", len(set(nodes)) - len(new))
+        count_metric("matrix_cache_misses", len(new))
+        if new and len(store["nodes"]) + len(new) > MAX_STORED_NODES:
+            store.update(matrix_store(), lock=store["lock"])
+            new = list(dict.fromkeys(nodes))
+
+        if new:
+            old = store["nodes"]
+            all_nodes = old + new
+            time_rows, distance_rows = matrix_rows(graph["adjacency"], new, all_nodes, workers)
+            time_cols, distance_cols = matrix_rows(graph["reverse"], new, old, workers)
+
+            n = len(old)
+            time_matrix = np.empty((len(all_nodes), len(all_nodes)))
+            distance_matrix = np.empty((len(all_nodes), len(all_nodes)))
+            time_matrix[:n, :n], time_matrix[n:], time_matrix[:n, n:] = store["time"], time_rows, time_cols.T
+            distance_matrix[:n, :n], distance_matrix[n:], distance_matrix[:n, n:] = (store["distance"], distance_rows,
+                                                                                     distance_cols.T)
+            store.update(nodes=all_nodes, index={node: i for i, node in enumerate(all_nodes)},
+                         time=time_matrix, distance=distance_matrix)
+
+        index = [store["index"][node] for node in nodes]
+        return store["time"][np.ix_(index, index)].tolist(), store["distance"][np.ix_(index, index)].tolist()
+
+
+def service_state(file_path=DATA_FIL, adress_fil=ADRESS_FIL, depot_location=DEPOT_LOCATION, matrix_workers=1):
+    """
+    Loads everything the jobs share once: the workbook, the visits of the week, the road graph with
+    its snapping index and adjacency, and an empty matrix store.
+    """
+    state = {
+        "file_path": file_path,
+        "adress_fil": adress_fil,
+        "depot_location": depot_location,
+        "matrix_workers": matrix_workers,
+        "lock": threading.Lock(),  # Guards the workbook data below
+        "data_mtimes": None,
+        "store": matrix_store(),
+        "jobs": {},
+        "job_ids": count(1),
+        "last_solves": {},  # (dag, skift) -> inputs, routes and visits of the last solve, the warm start of the next one
+        "tasks": set(),
+        "started": time.time(),
+    }
+    refresh_data(state)
+    G = load_graph(ladda_koordinater(file_path), network_type='drive')
+    snap_to_nodes(G, [depot_location[0]], [depot_location[1]])  # Builds the snapping index
+    state["graph"] = replanning_graph(G)
+    return state
+
+
+def refresh_data(state):
+    """
+    Reads the workbook and address file again if either has changed since they were loaded.
+    """
+    with state["lock"]:
+        mtimes = (os.stat(state["file_path"]).st_mtime_ns, os.stat(state["adress_fil"]).st_mtime_ns)
+        if mtimes == state["data_mtimes"]:
+            return
+        data = ladda_data(state["file_path"])
+        state.update(medarbetare_df=rensa_medarb_data(data["medarbetare"]),
+                     veckomodell=skapa_veckomodell(data, state["adress_fil"]),
+                     dag_dfs={}, data_mtimes=mtimes)
+
+
+def shift_inputs(state, dag, skift):
+    """
+    Returns the routing inputs of one shift, with the travel matrices from the matrix store.
+    """
+    refresh_data(state)
+    with state["lock"]:
+        if dag not in state["dag_dfs"]:
+            state["dag_dfs"][dag] = dag_df(state["veckomodell"], dag)
+        brukare_df = skift_df(state["dag_dfs"][dag], SKIFT[skift])
+        medarbetare_df = state["medarbetare_df"]
+
+    G = state["graph"]["G"]
+    depot_location = state["depot_location"]
+    nodes = snap_to_nodes(G, [depot_location[0]] + list(brukare_df['Latitude'].astype("float")),
+                          [depot_location[1]] + list(brukare_df['Longitude'].astype("float")))[0].tolist()
+    time_matrix, distance_matrix = store_matrices(state["store"], state["graph"], nodes, state["matrix_workers"])
+    return prepare_routing_inputs(brukare_df, medarbetare_df, G, depot_location, len(medarbetare_df),
+                                  *SKIFT_TIDER[SKIFT[skift]], matrices=(time_matrix, distance_matrix, nodes))
+
+
+def solve_job(args):
+    """
+    Solves one job in a worker process and sends its progress to the service through queue.
+    """
+    job_id, inputs, time_limit, initial_routes, stagnation_seconds, queue = args
+    queue.put((job_id, "running", None))
+    return solve_inputs(inputs, time_limit, initial_routes, stagnation_seconds,
+                        on_solution=lambda improvement: queue.put((job_id, "solution", improvement)))
+
+
+def read_progress(state, loop):
+    """
+    Hands the messages from the worker processes to the event loop until None is read.
+    """
+    while (message := state["progress"].get()) is not None:
+        loop.call_soon_threadsafe(apply_progress, state, *message)
+
+
+def apply_progress(state, job_id, kind, value):
+    job = state["jobs"].get(job_id)
+    if job is None:
+        return  # Forgotten already, see forget_old_jobs
+    if kind == "running":
+        if job["status"] == "queued":
+            job.update(status="running", started=time.time())
+    else:
+        job["progress"].append(value)
+
+
+def forget_old_jobs(state):
+    """
+    Removes the oldest finished jobs (and their plans) beyond MAX_FINISHED_JOBS, queued and running jobs are kept.
+    """
+    finished = [job_id for job_id, job in state["jobs"].items() if job["status"] in ("done", "failed")]
+    for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+        del state["jobs"][job_id]
+
+
+def new_job(state, kind, params):
+    forget_old_jobs(state)
+    job_id = next(state["job_ids"])
+    job = {"id": job_id, "type": kind, "status": "queued", "params": params, "submitted": time.time(),
+           "started": None, "finished": None, "progress": [], "error": None, "report": None, "plan": None}
+    state["jobs"][job_id] = job
+    return job
+
+
+def start_task(state, coroutine):
+    # The event loop only keeps weak references to tasks
+    task = asyncio.create_task(coroutine)
+    state["tasks"].add(task)
+    task.add_done_callback(state["tasks"].discard)
+
+
+def finish_job(job, plan):
+    job.update(status="done" if plan["report"] is not None else "failed", finished=time.time(), plan=plan,
+               report=plan["report"], error=None if plan["report"] is not None else "No solution found")
+
+
+def warm_start_routes(last, inputs):
+    """
+    Returns the initial routes for inputs from the last solve of the same shift: its routes as they are
+    if the inputs are all the same (visits, time windows, service times, staff and matrices), otherwise
+    its visits mapped onto inputs by initial_routes_from_saved, which checks that every route still fits.
+    """
+    if last["inputs"] == inputs:
+        return last["routes"]
+    return initial_routes_from_saved(last["visits"], inputs)
+
+
+async def run_solve(state, job):
+    """
+    Prepares the inputs in a thread (reusing the stored matrices) and solves them in the worker pool.
+    """
+    params = job["params"]
+    key = (params["dag"], params["skift"])
+    try:
+        inputs = await asyncio.to_thread(shift_inputs, state, *key)
+        initial_routes = None
+        last = state["last_solves"].get(key)
+        if params["warm_start"] and last is not None:
+            initial_routes = warm_start_routes(last, inputs)
+
+        report = await asyncio.get_running_loop().run_in_executor(
+            state["pool"], solve_job, (job["id"], inputs, params["time_limit"], initial_routes,
+                                       params["stagnation_seconds"], state["progress"]))
+    except Exception as error:
+        job.update(status="failed", finished=time.time(), error=repr(error))
+        return
+
+    plan = plan_from_report(inputs, report)
+    finish_job(job, plan)
+    if report is not None:
+        state["last_solves"][key] = {"inputs": inputs, "routes": plan["routes"],
+                                     "visits": saved_visits(dict(enumerate(plan["routes"])), inputs)}
+
+
+def replan(state, plan, params):
+    """
+    Applies one add, remove or change from params to plan, see replanning.
+    """
+    if "add" in params:
+        visit = dict(params["add"])
+        visit["Tidsfönster"] = tuple(visit["Tidsfönster"])
+        visit.setdefault("Constraints", "")
+        if "Latitude" not in visit:
+            # A brukare with an address in the address file
+            adresser = state["veckomodell"]["adresser"]
+            visit["Latitude"], visit["Longitude"] = adresser.loc[visit["Individ"], ["Latitude", "Longitude"]]
+        return add_visit(plan, visit, state["medarbetare_df"], state["graph"])
+    if "remove" in params:
+        return remove_visit(plan, params["remove"])
+    change = params["change"]
+    tidsfönster = change.get("Tidsfönster")
+    return change_visit(plan, change["Individ"], change.get("Tid"), None if tidsfönster is None else tuple(tidsfönster))
+
+
+async def run_replan(state, job, parent):
+    job.update(status="running", started=time.time())
+    try:
+        plan = await asyncio.to_thread(replan, state, parent["plan"], job["params"])
+    except Exception as error:
+        job.update(status="failed", finished=time.time(), error=repr(error))
+        return
+    finish_job(job, plan)
+
+
+def submit_solve(state, body):
+    params = {
+        "dag": veckodag(str(body["dag"])),
+        "skift": body["skift"] if body["skift"] in SKIFT else None,
+        "time_limit": int(body.get("time_limit", 30)),
+        "stagnation_seconds": body.get("stagnation_seconds"),
+        "warm_start": bool(body.get("warm_start", True)),
+    }
+    if params["skift"] is None:
+        raise ValueError(f"skift must be one of {list(SKIFT)}")
+    job = new_job(state, "solve", params)
+    start_task(state, run_solve(state, job))
+    return job
+
+
+def submit_replan(state, body):
+    if "job" not in body:
+        raise ValueError("Give the job whose plan is changed")
+    parent = state["jobs"].get(int(body["job"]))
+    if parent is None or parent["report"] is None:
+        raise LookupError(f"Job {body['job']} has no finished plan")
+    if sum(action in body for action in ("add", "remove", "change")) != 1:
+        raise ValueError("Give exactly one of add, remove and change")
+    params = {"job": parent["id"], **{action: body[action] for action in ("add", "remove", "change") if action in body}}
+    job = new_job(state, "replan", params)
+    start_task(state, run_replan(state, job, parent))
+    return job
+
+
+def job_summary(job):
+    summary = {name: job[name] for name in ("id", "type", "status", "params", "submitted", "started", "finished", "error")}
+    summary["solutions"] = len(job["progress"])
+    summary["best_cost"] = job["progress"][-1]["cost"] if job["progress"] else None
+    summary["objective"] = None if job["report"] is None else job["report"]["objective"]
+    summary["unplaced"] = None if job["plan"] is None else job["plan"]["unplaced"]
+    return summary
+
+
+def handle_request(state, method, path, body):
+    """
+    Returns the status code and JSON payload for one request:
+
+    GET  /status                 what is loaded and how many jobs there are
+    GET  /jobs                   all jobs
+    GET  /jobs/<id>              status, progress and (when done) the report and timetable text
+    POST /solve                  {"dag": "mån", "skift": "fm", "time_limit": 30}
+    POST /replan                 {"job": <id>, "add": {visit} | "remove": "Individ 3" | "change": {...}}
+
+    Only the last MAX_FINISHED_JOBS finished jobs are kept.
+    """
+    parts = [part for part in path.split("?")[0].split("/") if part]
+    if method == "GET" and parts == ["status"]:
+        statuses = [job["status"] for job in state["jobs"].values()]
+        return 200, {
+            "uptime": round(time.time() - state["started"], 1),
+            "graph_nodes": state["graph"]["G"].number_of_nodes(),
+            "stored_matrix_nodes": len(state["store"]["nodes"]),
+            "jobs": {status: statuses.count(status) for status in dict.fromkeys(statuses)},
+        }
+    if method == "GET" and parts == ["jobs"]:
+        return 200, [job_summary(job) for job in state["jobs"].values()]
+    if method == "GET" and len(parts) == 2 and parts[0] == "jobs" and parts[1].isdigit():
+        job = state["jobs"].get(int(parts[1]))
+        if job is None:
+            return 404, {"error": f"No job {parts[1]}"}
+        return 200, dict(job_summary(job), progress=job["progress"], report=job["report"],
+                         timetable=None if job["report"] is None else format_report(job["report"]))
+    if method == "POST" and parts == ["solve"]:
+        return 202, job_summary(submit_solve(state, json.loads(body or b"{}")))
+    if method == "POST" and parts == ["replan"]:
+        try:
+            return 202, job_summary(submit_replan(state, json.loads(body or b"{}")))
+        except LookupError as error:
+            return 409, {"error": str(error)}
+    return 404, {"error": f"No endpoint {method} {path}"}
+
+
+async def handle_connection(state, reader, writer):
+    """
+    Serves one HTTP/1.1 request with a JSON body and closes the connection.
+    """
+    try:
+        try:
+            method, path, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            status, payload = handle_request(state, method, path, body)
+        except asyncio.IncompleteReadError:
+            return  # The client closed the connection before the whole body was sent
+        except (ValueError, KeyError, TypeError) as error:
+            status, payload = 400, {"error": repr(error)}
+
+        data = json.dumps(payload, ensure_ascii=False, default=int).encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json; charset=utf-8\r\n"
+                     f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1") + data)
+        await writer.drain()
+    except ConnectionError:
+        pass  # The client is gone, there is no one to answer
+    finally:
+        writer.close()
+
+
+async def serve(state, host, port):
+    loop = asyncio.get_running_loop()
+    reader_thread = threading.Thread(target=read_progress, args=(state, loop), daemon=True)
+    reader_thread.start()
+    server = await asyncio.start_server(lambda reader, writer: handle_connection(state, reader, writer), host, port)
+    print(f"Serving on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        state["progress"].put(None)
+
+
+def run_service(host=HOST, port=PORT, file_path=DATA_FIL, adress_fil=ADRESS_FIL, workers=None, matrix_workers=1):
+    """
+    Runs the scheduling service until it is interrupted. The workbook, road graph and travel matrices
+    stay loaded between jobs, solves run in a pool of worker processes and re-plans in threads.
+    """
+    with Manager() as manager, ProcessPoolExecutor(max_workers=workers) as pool:
+        state = service_state(file_path, adress_fil, matrix_workers=matrix_workers)
+        state.update(pool=pool, progress=manager.Queue())
+        try:
+            asyncio.run(serve(state, host, port))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,65 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+from graph_preprocessing import EARTH_RADIUS
+MAX_SNAP_DISTANCE = 250  # meters, addresses further away than this from a road node are flagged
+
+
+def project(latitudes, longitudes, reference_latitude):
+    """
+    Projects coordinates to meters with an equirectangular projection around reference_latitude.
+    Accurate enough for nearest node queries inside a municipality.
+    """
+    latitudes = np.radians(np.asarray(latitudes, dtype=np.float64))
+    longitudes = np.radians(np.asarray(longitudes, dtype=np.float64))
+    x = EARTH_RADIUS * longitudes * np.cos(np.radians(reference_latitude))
+    y = EARTH_RADIUS * latitudes
+    return np.column_stack([x, y])
+
+
+def snap_index(G):
+    """
+    Returns the KD-tree over the nodes of G, built once and cached in G.graph.
+    """
+    index = G.graph.get("snap_index")
+    if index is None or index["node_count"] != G.number_of_nodes():
+        if "arrays" in G.graph:
+            # Loaded from a graph snapshot, the coordinates are already arrays
+            arrays = G.graph["arrays"]
+            node_ids, ys, xs = np.asarray(arrays["node_ids"]), np.asarray(arrays["y"]), np.asarray(arrays["x"])
+        else:
+            node_ids = np.array(list(G.nodes), dtype=np.int64)
+            ys = np.array([G.nodes[node]['y'] for node in node_ids.tolist()])
+            xs = np.array([G.nodes[node]['x'] for node in node_ids.tolist()])
+        reference_latitude = float(ys.mean())
+        index = {
+            "node_count": len(node_ids),
+            "node_ids": node_ids,
+            "reference_latitude": reference_latitude,
+            "tree": cKDTree(project(ys, xs, reference_latitude)),
+        }
+        G.graph["snap_index"] = index
+    return index
+
+
+def snap_to_nodes(G, latitudes, longitudes):
+    """
+    Snaps all coordinates to their nearest graph node in one query.
+    Returns the node ids and the snap distances in meters.
+    """
+    index = snap_index(G)
+    if len(latitudes) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    distances, positions = index["tree"].query(project(latitudes, longitudes, index["reference_latitude"]))
+    return index["node_ids"][positions], distances
+
+
+def far_from_network(G, brukare_df, max_distance=MAX_SNAP_DISTANCE):
+    """
+    Returns the brukare rows whose address lands more than max_distance meters from the road network,
+    with the snap distance in the column 'Snap Distance'.
+    """
+    nodes, distances = snap_to_nodes(G, brukare_df['Latitude'].astype("float"), brukare_df['Longitude'].astype("float"))
+    far = brukare_df[distances > max_distance].copy()
+    far['Snap Distance'] = distances[distances > max_distance]
+    return far
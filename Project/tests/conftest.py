@@ -0,0 +1,64 @@
+import os
+import sys
+
+import pytest
+
+# The Project modules are imported as top level modules, as when running main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import synthetic_grid, synthetic_workbook
+
+
+@pytest.fixture(scope="session")
+def grid():
+    """
+    A 12 x 12 synthetic road grid over the area of the synthetic workbooks.
+    """
+    return synthetic_grid(12, seed=1)
+
+
+@pytest.fixture(scope="session")
+def workbook(tmp_path_factory):
+    """
+    Paths of a synthetic workbook with 40 brukare and 12 medarbetare and its address file.
+    """
+    directory = tmp_path_factory.mktemp("workbook")
+    workbook_path, address_path = str(directory / "planering.xlsx"), str(directory / "adresser.txt")
+    synthetic_workbook(workbook_path, address_path, 40, 12, seed=1)
+    return workbook_path, address_path
+
+
+@pytest.fixture(scope="session")
+def shift(workbook):
+    """
+    The medarbetare and the visits of the Måndag eftermiddag shift of the synthetic workbook.
+    """
+    from data_processing import ladda_data, rensa_medarb_data
+    from dataframe_creation import dataframe_creation, skift_df
+
+    workbook_path, address_path = workbook
+    data = ladda_data(workbook_path, cache_dir=None)
+    return rensa_medarb_data(data["medarbetare"]), skift_df(dataframe_creation("Måndag", data, address_path), False)
+
+
+@pytest.fixture(scope="session")
+def shift_inputs(shift, grid):
+    """
+    The routing inputs of the shift on the grid, tests that change them work on a copy.
+    """
+    from route_optimization import prepare_routing_inputs
+    from week import DEPOT_LOCATION, SKIFT_TIDER
+
+    medarbetare_df, besök = shift
+    return prepare_routing_inputs(besök, medarbetare_df, grid, DEPOT_LOCATION, len(medarbetare_df),
+                                  *SKIFT_TIDER[False], cache_dir=None)
+
+
+@pytest.fixture(scope="session")
+def shift_report(shift_inputs):
+    """
+    The report of a short solve of shift_inputs.
+    """
+    from route_optimization import solve_inputs
+
+    return solve_inputs(shift_inputs, time_limit=2)
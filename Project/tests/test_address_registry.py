@@ -0,0 +1,57 @@
+import pandas as pd
+import pytest
+
+from address_registry import parse_address_text, attach_addresses
+
+
+def test_parse_address_text():
+    registry = parse_address_text("1. Rudagatan 51, (64.7307, 21.0628)\n"
+                                  "  12.Storgatan 3, Skellefteå , ( -64.5 ,+21 )\r\n"
+                                  "\n"
+                                  "3. Kanalgatan 1, (6.47e1, 2.1e1)\n")
+    assert list(registry.index) == ["Individ 1", "Individ 12", "Individ 3"]
+    assert registry.loc["Individ 12", "Adress"] == "Storgatan 3, Skellefteå"
+    assert registry.loc["Individ 12", ["Latitude", "Longitude"]].tolist() == [-64.5, 21.0]
+    assert registry.loc["Individ 3", "Latitude"] == 64.7
+
+
+def test_empty_address_text():
+    registry = parse_address_text("\n")
+    assert registry.empty
+    assert list(registry.columns) == ["Adress", "Latitude", "Longitude"]
+
+
+@pytest.mark.parametrize("line", [
+    "Rudagatan 51, (64.7307, 21.0628)",      # No number
+    "2. Rudagatan 51, 64.7307, 21.0628",     # No parentheses
+    "2. Rudagatan 51, (64.7307)",            # One coordinate
+    "2. Rudagatan 51, (59.1.2, 21.0628)",    # Two decimal points
+    "2. Rudagatan 51, (64.7307, 21.06.28)",
+    "2. Rudagatan 51, (., 21.0628)",
+])
+def test_malformed_lines_are_reported(line):
+    with pytest.raises(ValueError, match="could not be parsed") as error:
+        parse_address_text("1. Rudagatan 1, (64.7, 21.1)\n" + line + "\n")
+    assert repr(line) in str(error.value)
+
+
+def test_duplicate_numbers_are_rejected():
+    with pytest.raises(ValueError, match="Duplicate address numbers: Individ 1"):
+        parse_address_text("1. Rudagatan 1, (64.7, 21.1)\n1. Storgatan 2, (64.8, 21.2)\n")
+
+
+@pytest.mark.parametrize("coordinates", ["(91, 21.1)", "(-90.5, 21.1)", "(64.7, 180.01)", "(64.7, -200)"])
+def test_coordinates_out_of_range_are_rejected(coordinates):
+    with pytest.raises(ValueError, match="Coordinates out of range for Individ 2"):
+        parse_address_text(f"1. Rudagatan 1, (64.7, 21.1)\n2. Storgatan 2, {coordinates}\n")
+
+
+def test_attach_addresses():
+    registry = parse_address_text("1. Rudagatan 1, (64.7, 21.1)\n2. Storgatan 2, (64.8, 21.2)\n")
+    visits = pd.DataFrame({"Individ": ["Individ 2 ", "Individ 1", "Individ 2"]})
+    attached = attach_addresses(visits, registry)
+    assert attached["Latitude"].tolist() == [64.8, 64.7, 64.8]
+    assert attached["Individ"].tolist() == ["Individ 2", "Individ 1", "Individ 2"]
+
+    with pytest.raises(ValueError, match="No address for Individ 3"):
+        attach_addresses(pd.DataFrame({"Individ": ["Individ 3"]}), registry)
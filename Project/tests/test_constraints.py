@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from data_processing import krav_mask, krav_namn, KRAV_BIT, OKÄND_KRAV
+from route_optimization import (mask_penalties, compatibility, vehicle_assignment, constraint_masks_of,
+                                capability_masks_of, PENALTIES)
+
+
+def test_krav_mask_encodes_every_name():
+    masks = krav_mask(pd.Series(["license,dog", " smoker ", "", None, "insulin,insulin", "flying"]))
+    assert masks.tolist() == [KRAV_BIT["license"] | KRAV_BIT["dog"], KRAV_BIT["smoker"], 0, 0, KRAV_BIT["insulin"],
+                              OKÄND_KRAV]
+    assert krav_mask(pd.Series(["", None])).tolist() == [0, 0]
+
+
+def test_krav_namn_decodes_the_mask():
+    assert krav_namn(KRAV_BIT["license"] | KRAV_BIT["dog"]) == ["license", "dog"]
+    assert krav_namn(KRAV_BIT[">18"] | OKÄND_KRAV) == [">18", "unknown"]
+    assert krav_namn(0) == []
+    for names in (["license", "dog"], ["stoma", "cat_friendly", "woman"]):
+        assert sorted(krav_namn(krav_mask(pd.Series([",".join(names)]))[0])) == sorted(names)
+
+
+def test_mask_penalties():
+    masks = krav_mask(pd.Series(["license,dog", "", "dog_friendly", "flying", "medication,flying"]))
+    assert mask_penalties(masks).tolist() == [
+        PENALTIES["license"] + PENALTIES["dog"], 0, 0, PENALTIES["unknown"], PENALTIES["medication"] + PENALTIES["unknown"]]
+    # An unknown constraint is never free to drop
+    assert PENALTIES["unknown"] > 0
+
+
+def test_compatibility_needs_every_constraint():
+    constraints = krav_mask(pd.Series(["license,dog", "", "flying", "woman"]))
+    capabilities = krav_mask(pd.Series(["license,dog,woman", "license", ""]))
+    assert compatibility(constraints, capabilities).tolist() == [
+        [True, False, False],
+        [True, True, True],
+        [False, False, False],  # No medarbetare has an unknown constraint
+        [True, False, False],
+    ]
+
+
+def test_vehicle_assignment_drops_only_visits_nobody_can_serve():
+    constraints = krav_mask(pd.Series(["license", "", "medication,dog", "flying"]))
+    capabilities = krav_mask(pd.Series(["license,dog", "license,medication"]))
+    allowed, penalties, unmet_masks = vehicle_assignment(constraints, capabilities)
+
+    assert allowed == [[0, 1], [0, 1], None, None]
+    # The penalty is for what the last vehicle misses
+    assert penalties == [None, None, PENALTIES["dog"], PENALTIES["unknown"]]
+    assert krav_namn(unmet_masks[2]) == ["dog"]
+    assert krav_namn(unmet_masks[3]) == ["unknown"]
+
+
+def test_masks_come_from_the_columns_or_the_strings():
+    brukare_df = pd.DataFrame({"Constraints": ["license", "dog"]})
+    np.testing.assert_array_equal(constraint_masks_of(brukare_df), [KRAV_BIT["license"], KRAV_BIT["dog"]])
+    np.testing.assert_array_equal(constraint_masks_of(brukare_df.assign(ConstraintMask=[5, 6])), [5, 6])
+
+    medarbetare_df = pd.DataFrame({"Capabilities": ["license", "dog", "cat"]})
+    np.testing.assert_array_equal(capability_masks_of(medarbetare_df, 2), [KRAV_BIT["license"], KRAV_BIT["dog"]])
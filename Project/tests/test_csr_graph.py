@@ -0,0 +1,63 @@
+import numpy as np
+
+from csr_graph import csr_matrix_rows, networkx_matrix_rows
+from route_optimization import build_adjacency, matrix_rows, node_matrices, graph_csr
+
+
+def with_one_way_spur(grid):
+    """
+    The grid with two nodes outside its strongly connected component: one that can only be
+    reached from the grid and one that can only reach it.
+    """
+    G = grid.copy()
+    G.graph.clear()  # No travel times or CSR arrays of the grid without the spur
+    G.add_node(-1, x=21.2, y=64.7)
+    G.add_node(-2, x=21.2, y=64.71)
+    G.add_edge(0, -1, length=80.0, maxspeed='30')
+    G.add_edge(-2, 5, length=60.0)
+    return G
+
+
+def test_csr_backend_matches_python_backend(grid):
+    G = with_one_way_spur(grid)
+    nodes = [-1, -2] + list(grid.nodes)[::9]
+    adjacency = build_adjacency(G)
+
+    expected = matrix_rows(adjacency, nodes, nodes)
+    actual = matrix_rows(adjacency, nodes, nodes, backend="csr", csr=graph_csr(G))
+    for actual_rows, expected_rows in zip(actual, expected):
+        np.testing.assert_array_equal(np.isfinite(actual_rows), np.isfinite(expected_rows))
+        np.testing.assert_allclose(actual_rows, expected_rows)
+
+    # The spur nodes are reachable one way, not missing from the matrices
+    assert np.isfinite(expected[0][2, 0]) and np.isinf(expected[0][0, 2])
+    assert np.isfinite(expected[0][1, 2]) and np.isinf(expected[0][2, 1])
+
+
+def test_reversed_csr_gives_the_columns(grid):
+    nodes = list(grid.nodes)[::11]
+    forward = node_matrices(build_adjacency(grid), nodes)
+    columns = csr_matrix_rows(graph_csr(grid, reverse=True), nodes, nodes)
+    np.testing.assert_allclose(np.asarray(columns[0]).T, forward[0])
+
+
+def test_graph_csr_is_built_once_per_graph(grid):
+    G = grid.copy()
+    G.graph.clear()
+    csr = graph_csr(G)
+    assert graph_csr(G) is csr
+    assert graph_csr(G, 30) is not csr
+    assert graph_csr(G, backend="python") is None
+
+    G.add_edge(0, 13, length=10.0)
+    assert graph_csr(G) is not csr
+
+
+def test_backends_match_the_networkx_baseline(grid):
+    nodes = list(grid.nodes)[::13]
+    baseline = networkx_matrix_rows(grid.copy(), nodes, nodes)
+    adjacency = build_adjacency(grid)
+    for backend in ("python", "csr"):
+        times, distances = matrix_rows(adjacency, nodes, nodes, backend=backend)
+        np.testing.assert_allclose(times, baseline[0])
+        np.testing.assert_allclose(distances, baseline[1])
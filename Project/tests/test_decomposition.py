@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from decomposition import (optimize_routes_decomposed, subset_inputs, split_medarbetare, rebalance_clusters,
+                           repair_boundaries, solve_sub_problems, sub_problem, dropped_visits, UNCOVERED_PENALTY)
+from route_optimization import build_adjacency, node_matrices
+from week import DEPOT_LOCATION, SKIFT_TIDER
+
+
+def test_cluster_matrices_match_the_full_matrix(shift_inputs, grid):
+    customer_nodes = list(range(1, len(shift_inputs["nodes"]), 3))
+    nodes = [shift_inputs["nodes"][node] for node in [0] + customer_nodes]
+    matrices = node_matrices(build_adjacency(grid), nodes)
+    vehicle_ids = [0, 1, 2]
+
+    sliced = subset_inputs(shift_inputs, customer_nodes, vehicle_ids)
+    computed = subset_inputs(shift_inputs, customer_nodes, vehicle_ids, matrices)
+    np.testing.assert_allclose(computed["time_matrix"], sliced["time_matrix"])
+    np.testing.assert_allclose(computed["distance_matrix"], sliced["distance_matrix"])
+    # Every visit of a cluster can be dropped, so a cluster always has a solution
+    for local, node in enumerate(customer_nodes, 1):
+        if shift_inputs["allowed_vehicles"][node] is not None:
+            assert computed["drop_penalties"][local] == UNCOVERED_PENALTY
+            assert computed["allowed_vehicles"][local] == [vehicle_ids.index(v) for v in shift_inputs["allowed_vehicles"][node]
+                                                           if v in vehicle_ids]
+
+
+def test_every_cluster_gets_a_vehicle(shift_inputs):
+    labels = np.zeros(len(shift_inputs["nodes"]) - 1, dtype=int)
+    labels[:3] = [1, 2, 3]
+    vehicles = split_medarbetare(shift_inputs, labels, 4)
+    assert all(vehicles)
+    assert sorted(sum(vehicles, [])) == list(range(shift_inputs["num_vehicles"]))
+
+
+def test_rebalance_moves_idle_vehicles_to_dropped_visits(shift_inputs):
+    customer_nodes = list(range(1, len(shift_inputs["nodes"])))
+    # One vehicle cannot serve the whole shift, the other cluster has no visits and only idle vehicles
+    clusters = [(customer_nodes, [0]), ([], list(range(1, shift_inputs["num_vehicles"])))]
+    reports = [None, None]
+    rebalance_clusters(shift_inputs, clusters, reports, np.array([[0.0, 0.0], [1000.0, 0.0]]), time_limit=1)
+
+    assert reports[0] is not None
+    assert len(clusters[0][1]) > 1
+    assert len(dropped_visits(shift_inputs, customer_nodes, reports[0])) < len(customer_nodes) - 19
+
+
+class RecordingPool:
+    """
+    Runs map in the test process and records how many sub-problems every call solves.
+    """
+    def __init__(self):
+        self.batches = []
+
+    def map(self, function, problems):
+        problems = list(problems)
+        self.batches.append(len(problems))
+        return map(function, problems)
+
+
+def test_repair_solves_disjoint_pairs_in_one_batch(shift_inputs):
+    customer_nodes = list(range(1, len(shift_inputs["nodes"])))
+    clusters = [(customer_nodes[i::3], list(range(i, shift_inputs["num_vehicles"], 3))) for i in range(3)]
+    reports = solve_sub_problems(None, [sub_problem(shift_inputs, nodes, vehicles, {}, 1) for nodes, vehicles in clusters],
+                                 clusters)
+    before = [list(nodes) for nodes, _ in clusters]
+
+    # 1 is the nearest cluster of both 0 and 2, only one of the pairs is solved
+    pool = RecordingPool()
+    repair_boundaries(shift_inputs, clusters, reports, np.array([[0.0, 0.0], [1.0, 0.0], [2.5, 0.0]]), 1, pool=pool)
+    assert pool.batches == [1]
+    assert clusters[2][0] == before[2]
+
+
+@pytest.mark.parametrize("n_clusters, cache, repair", [(3, True, True), (4, False, False)])
+def test_decomposed_solve_serves_or_reports_every_visit(n_clusters, cache, repair, shift, shift_inputs, grid, tmp_path,
+                                                        monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    medarbetare_df, besök = shift
+    report = optimize_routes_decomposed(besök, medarbetare_df, grid, DEPOT_LOCATION, len(medarbetare_df),
+                                        *SKIFT_TIDER[False], n_clusters=n_clusters, workers=2, time_limit=1,
+                                        repair=repair, cache_dir="matrix_cache" if cache else None,
+                                        matrix_backend="csr")
+    assert (tmp_path / "matrix_cache").exists() == cache
+
+    assert report is not None
+    served = [node for route in report["routes"].values() for node in route]
+    assert len(served) == len(set(served))
+    assert len(served) + len(report["unserved"]) == len(besök)
+    # Only visits no medarbetare can serve are left out
+    assert set(report["unserved"]) <= {shift_inputs["individer"][node] for node in range(1, len(shift_inputs["nodes"]))
+                                       if shift_inputs["allowed_vehicles"][node] is None}
+    assert (tmp_path / "route_output.txt").exists()
@@ -0,0 +1,68 @@
+import math
+
+import networkx as nx
+import pytest
+
+from route_optimization import build_adjacency
+from graph_preprocessing import parse_speed_kph, add_travel_times, great_circle_length
+
+
+@pytest.mark.parametrize("maxspeed, expected", [
+    ("50", 50.0),
+    (70, 70.0),
+    (30.5, 30.5),
+    (["30", "50"], 30.0),
+    (None, 40),
+    ("", 40),
+    ("walk", 40),
+    ("50 mph", 40),
+])
+def test_parse_speed_kph(maxspeed, expected):
+    assert parse_speed_kph(maxspeed, 40) == expected
+
+
+def two_node_graph(**edge_data):
+    G = nx.MultiDiGraph()
+    G.add_node(1, x=21.10, y=64.70)
+    G.add_node(2, x=21.11, y=64.70)
+    G.add_edge(1, 2, **edge_data)
+    return G
+
+
+def test_add_travel_times_uses_the_speed_limit():
+    G = add_travel_times(two_node_graph(length="1000", maxspeed="60"))
+    data = G.edges[1, 2, 0]
+    assert data['length'] == 1000.0
+    assert data['travel_time_s'] == pytest.approx(60.0)
+
+
+def test_add_travel_times_falls_back_to_the_default_speed():
+    G = add_travel_times(two_node_graph(length=1000.0, maxspeed="none"), 36)
+    assert G.edges[1, 2, 0]['travel_time_s'] == pytest.approx(100.0)
+    assert G.graph["travel_time_default_kph"] == 36
+
+    # Another default speed recomputes the travel times
+    add_travel_times(G, 72)
+    assert G.edges[1, 2, 0]['travel_time_s'] == pytest.approx(50.0)
+
+
+@pytest.mark.parametrize("length", [None, "n/a", float("nan"), -5.0])
+def test_add_travel_times_measures_invalid_lengths(length):
+    G = add_travel_times(two_node_graph(length=length))
+    expected = great_circle_length(G, 1, 2)
+    assert G.edges[1, 2, 0]['length'] == pytest.approx(expected)
+    assert math.isclose(expected, 477, rel_tol=0.01)
+
+
+def test_edges_added_after_preprocessing_get_travel_times(grid):
+    G = add_travel_times(grid.copy())
+    unconnected = next(v for v in G.nodes if v != 0 and not G.has_edge(0, v))
+    G.add_edge(0, unconnected, length=10.0, maxspeed="36")
+
+    add_travel_times(G)
+    assert G.edges[0, unconnected, 0]['travel_time_s'] == pytest.approx(1.0)
+    # build_adjacency adds the travel times itself and reads them from every edge
+    H = grid.copy()
+    add_travel_times(H)
+    H.add_edge(0, unconnected, length=10.0)
+    assert any(v == unconnected and length == 10.0 for v, _, length, _ in build_adjacency(H)[0])
@@ -0,0 +1,101 @@
+import json
+import os
+
+import numpy as np
+import osmnx as ox
+
+from benchmarks.synthetic import BBOX
+from graph_snapshot import (build_graph, save_graph_snapshot, load_graph, networkx_graph, snapshot_key,
+                            SnapshotGraph)
+from matrix_cache import graph_fingerprint
+from route_optimization import build_adjacency, node_matrices
+from snapping import snap_to_nodes
+
+
+def sorted_adjacency(adjacency):
+    return {u: sorted(edges) for u, edges in adjacency.items()}
+
+
+def snapshot_of(G, snapshot_dir):
+    save_graph_snapshot(G.copy(), BBOX, 'drive', str(snapshot_dir))
+    return load_graph(BBOX, 'drive', snapshot_dir=str(snapshot_dir))
+
+
+def test_snapshot_gives_the_same_adjacency_and_matrices(grid, tmp_path):
+    G = grid.copy()
+    # A parallel edge, the search weight is the shorter one and the costs come from key 0
+    G.add_edge(0, 1, length=10.0, maxspeed='30')
+    loaded = snapshot_of(G, tmp_path)
+
+    assert isinstance(loaded, SnapshotGraph)
+    assert loaded.number_of_nodes() == G.number_of_nodes()
+    expected = build_adjacency(G.copy())
+    actual = build_adjacency(loaded)
+    assert actual.keys() == expected.keys()
+    for u in expected:
+        np.testing.assert_allclose(sorted(actual[u]), sorted(expected[u]))
+
+    nodes = list(G.nodes)[::7]
+    for actual_matrix, expected_matrix in zip(node_matrices(actual, nodes), node_matrices(expected, nodes)):
+        np.testing.assert_allclose(actual_matrix, expected_matrix)
+
+
+def test_snapshot_adjacency_follows_the_default_speed(grid, tmp_path):
+    loaded = snapshot_of(grid, tmp_path)
+    expected = sorted_adjacency(build_adjacency(grid.copy(), 30))
+    actual = sorted_adjacency(build_adjacency(loaded, 30))
+    for u in expected:
+        np.testing.assert_allclose(actual[u], expected[u])
+
+
+def test_snapshot_snapping_and_fingerprint(grid, tmp_path):
+    loaded = snapshot_of(grid, tmp_path)
+    latitudes, longitudes = [64.70, 64.735], [21.10, 21.2]
+    np.testing.assert_array_equal(snap_to_nodes(loaded, latitudes, longitudes)[0],
+                                  snap_to_nodes(grid.copy(), latitudes, longitudes)[0])
+
+    parameters = (50, 1.2, 300)
+    reloaded = load_graph(BBOX, 'drive', snapshot_dir=str(tmp_path))
+    assert graph_fingerprint(loaded, parameters) == graph_fingerprint(reloaded, parameters)
+    assert graph_fingerprint(loaded, parameters) != graph_fingerprint(loaded, (40, 1.2, 300))
+
+
+def test_networkx_graph_round_trip(grid, tmp_path):
+    H = networkx_graph(snapshot_of(grid, tmp_path))
+    assert sorted(H.edges(keys=True)) == sorted(grid.edges(keys=True))
+    assert H.nodes[5] == {'x': grid.nodes[5]['x'], 'y': grid.nodes[5]['y']}
+
+
+def test_build_graph_keeps_the_largest_strongly_connected_component(grid, monkeypatch):
+    G = grid.copy()
+    G.add_node(-1, x=21.2, y=64.7)
+    G.add_edge(0, -1, length=50.0)  # One way only, not strongly connected
+    monkeypatch.setattr(ox, "graph_from_bbox", lambda bbox, network_type: G)
+
+    assert set(build_graph(BBOX).nodes) == set(grid.nodes)
+
+
+def test_load_graph_downloads_only_without_snapshot(grid, tmp_path, monkeypatch):
+    import graph_snapshot
+
+    downloads = []
+    monkeypatch.setattr(graph_snapshot, "build_graph", lambda bbox, network_type: downloads.append(bbox) or grid.copy())
+    load_graph(BBOX, 'drive', snapshot_dir=str(tmp_path))
+    load_graph(BBOX, 'drive', snapshot_dir=str(tmp_path))
+    assert len(downloads) == 1
+    assert os.path.exists(os.path.join(str(tmp_path), snapshot_key(BBOX, 'drive'), "meta.json"))
+    with open(os.path.join(str(tmp_path), snapshot_key(BBOX, 'drive'), "meta.json")) as f:
+        assert json.load(f)["network_type"] == 'drive'
+
+
+def test_snapshot_saves_the_default_speed(grid, tmp_path):
+    save_graph_snapshot(grid.copy(), BBOX, 'drive', str(tmp_path), default_speed_kph=40)
+    with open(os.path.join(str(tmp_path), snapshot_key(BBOX, 'drive'), "meta.json")) as f:
+        assert json.load(f)["default_speed_kph"] == 40
+
+    loaded = load_graph(BBOX, 'drive', snapshot_dir=str(tmp_path))
+    for speed in (40, 50):
+        expected = sorted_adjacency(build_adjacency(grid.copy(), speed))
+        actual = sorted_adjacency(build_adjacency(loaded, speed))
+        for u in expected:
+            np.testing.assert_allclose(actual[u], expected[u])
@@ -0,0 +1,73 @@
+import os
+import sys
+import subprocess
+
+import graph_snapshot
+import week
+from benchmarks.synthetic import BBOX
+from main import main
+
+PROJECT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["networkx", "osmnx", "scipy", "ortools"]
+
+
+def loaded_modules(tmp_path, arguments):
+    """
+    Runs main.py with arguments in a new process and returns the heavy modules it loaded.
+    """
+    script = ("import sys, main; main.main(sys.argv[1:]); "
+              f"print([name for name in {HEAVY_MODULES!r} if name in sys.modules])")
+    result = subprocess.run([sys.executable, "-c", script] + arguments, cwd=str(tmp_path), check=True,
+                            capture_output=True, text=True, env=dict(os.environ, PYTHONPATH=PROJECT))
+    return result.stdout.strip().splitlines()[-1]
+
+
+def test_validate_loads_the_network_only_with_the_flag(workbook, grid, tmp_path):
+    workbook_path, address_path = workbook
+    graph_snapshot.save_graph_snapshot(grid.copy(), BBOX, 'drive', str(tmp_path / graph_snapshot.SNAPSHOT_DIR))
+    arguments = ["--data", workbook_path, "--addresses", address_path, "validate"]
+
+    assert loaded_modules(tmp_path, arguments) == "[]"
+    assert loaded_modules(tmp_path, arguments + ["--network"]) == "['scipy']"
+
+
+def test_solve_with_decompose(workbook, grid, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(graph_snapshot, "load_graph", lambda bbox, network_type: grid)
+    workbook_path, address_path = workbook
+
+    assert main(["--data", workbook_path, "--addresses", address_path, "solve", "mån", "em",
+                 "--decompose", "2", "--time-limit", "1", "--backend", "csr"]) == 0
+    assert "Overall Summary" in (tmp_path / "route_output.txt").read_text()
+    assert (tmp_path / "matrix_cache").exists()
+
+
+def test_week_with_decompose(workbook, grid, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(week, "load_graph", lambda bbox, network_type: grid)
+    workbook_path, address_path = workbook
+
+    schedule = week.solve_week(jobs=[("Måndag", False)], file_path=workbook_path, adress_fil=address_path,
+                               workers=2, time_limit=1, decompose=0)
+    assert schedule["Måndag"]["EM"]["routes"]
+
+
+def test_solve_with_portfolio(workbook, grid, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(graph_snapshot, "load_graph", lambda bbox, network_type: grid)
+    workbook_path, address_path = workbook
+
+    assert main(["--data", workbook_path, "--addresses", address_path, "solve", "mån", "em",
+                 "--portfolio", "--time-limit", "2"]) == 0
+    assert "Overall Summary" in (tmp_path / "route_output.txt").read_text()
+    assert (tmp_path / "portfolio_log.jsonl").exists()
+
+
+def test_week_with_portfolio(workbook, grid, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(week, "load_graph", lambda bbox, network_type: grid)
+    workbook_path, address_path = workbook
+
+    schedule = week.solve_week(jobs=[("Måndag", False)], file_path=workbook_path, adress_fil=address_path,
+                               workers=2, time_limit=2, portfolio=True)
+    assert schedule["Måndag"]["EM"]["config"]
@@ -0,0 +1,73 @@
+import os
+import threading
+
+import numpy as np
+
+from matrix_cache import graph_fingerprint, load_matrix_cache, save_matrix_cache, empty_matrix_cache
+from metrics import enable_metrics, disable_metrics, metrics
+from route_optimization import (build_adjacency, node_matrices, cached_node_matrices, DRIVE_TIME_FACTOR,
+                                STOP_TIME)
+
+
+def cached_counts(G, nodes, cache_dir):
+    enable_metrics()
+    try:
+        matrices = cached_node_matrices(G, nodes, cache_dir)
+        return matrices, metrics()["counters"]
+    finally:
+        disable_metrics()
+
+
+def test_cached_matrices_match_direct_search(grid, tmp_path):
+    nodes = list(grid.nodes)[:30]
+    expected = node_matrices(build_adjacency(grid), nodes)
+
+    first, counters = cached_counts(grid, nodes, str(tmp_path))
+    assert counters["matrix_cache_misses"] == 30
+    np.testing.assert_allclose(first[0], expected[0])
+    np.testing.assert_allclose(first[1], expected[1])
+
+    # A rerun with a few new nodes only computes those
+    more_nodes = nodes[5:] + list(grid.nodes)[30:35]
+    second, counters = cached_counts(grid, more_nodes, str(tmp_path))
+    assert counters["matrix_cache_hits"] == 25
+    assert counters["matrix_cache_misses"] == 5
+    expected = node_matrices(build_adjacency(grid), more_nodes)
+    np.testing.assert_allclose(second[0], expected[0])
+    np.testing.assert_allclose(second[1], expected[1])
+
+
+def test_fingerprint_depends_on_cost_parameters(grid):
+    parameters = (50, DRIVE_TIME_FACTOR, STOP_TIME)
+    assert graph_fingerprint(grid, parameters) == graph_fingerprint(grid, parameters)
+    assert graph_fingerprint(grid, parameters) != graph_fingerprint(grid, (40, DRIVE_TIME_FACTOR, STOP_TIME))
+    assert graph_fingerprint(grid, parameters) != graph_fingerprint(grid, (50, DRIVE_TIME_FACTOR, STOP_TIME + 60))
+
+
+def test_new_default_speed_is_not_served_from_cache(grid, tmp_path):
+    nodes = list(grid.nodes)[:10]
+    cached_node_matrices(grid, nodes, str(tmp_path), default_speed_kph=50)
+    slow = cached_node_matrices(grid.copy(), nodes, str(tmp_path), default_speed_kph=20)
+    expected = node_matrices(build_adjacency(grid.copy(), 20), nodes)
+    np.testing.assert_allclose(slow[0], expected[0])
+
+
+def test_concurrent_saves_leave_a_complete_cache(tmp_path):
+    cache_dir = str(tmp_path)
+    caches = []
+    for n in range(1, 9):
+        cache = empty_matrix_cache()
+        cache.update(nodes=np.arange(n), time=np.full((n, n), float(n)), distance=np.full((n, n), float(n)),
+                     last_used=np.zeros(n))
+        caches.append(cache)
+
+    threads = [threading.Thread(target=save_matrix_cache, args=(cache_dir, "same", cache)) for cache in caches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    loaded = load_matrix_cache(cache_dir, "same")
+    n = len(loaded["nodes"])
+    assert loaded["time"].shape == (n, n) and (loaded["time"] == n).all()
+    assert not [f for f in os.listdir(cache_dir) if f.startswith("tmp_")]
@@ -0,0 +1,46 @@
+import asyncio
+import threading
+
+import pytest
+
+from metrics import enable_metrics, disable_metrics, metrics, span, count
+
+
+@pytest.fixture
+def recorded():
+    enable_metrics()
+    try:
+        yield metrics
+    finally:
+        disable_metrics()
+
+
+def test_counts_from_threads_are_not_lost(recorded):
+    def work():
+        for _ in range(10000):
+            count("visits")
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert recorded()["counters"]["visits"] == 80000
+
+
+def test_spans_in_threads_nest_under_their_own_parent(recorded):
+    barrier = threading.Barrier(2)
+
+    def work(name):
+        with span(name):
+            barrier.wait()  # Both spans are open at the same time
+            with span("inner"):
+                pass
+
+    async def main():
+        with span("request"):
+            await asyncio.gather(asyncio.to_thread(work, "a"), asyncio.to_thread(work, "b"))
+
+    asyncio.run(main())
+    paths = sorted(recorded_span["path"] for recorded_span in recorded()["spans"])
+    assert paths == ["request", "request/a", "request/a/inner", "request/b", "request/b/inner"]
@@ -0,0 +1,28 @@
+import json
+import threading
+import time
+
+from portfolio import solve_portfolio, solve_config, DEFAULT_PORTFOLIO
+
+
+def test_queued_configurations_share_the_time_limit(shift_inputs, tmp_path):
+    log_file = str(tmp_path / "portfolio_log.jsonl")
+    started = time.monotonic()
+    report = solve_portfolio(shift_inputs, time_limit=4, portfolio=DEFAULT_PORTFOLIO, workers=2, log_file=log_file)
+    elapsed = time.monotonic() - started
+
+    assert report is not None
+    # Two rounds of configurations with the full time limit each would take more than 8 seconds
+    assert elapsed < 4 + 3
+    with open(log_file) as f:
+        results = json.loads(f.readline())["results"]
+    assert len(results) == len(DEFAULT_PORTFOLIO)
+    assert sum(result["seconds"] for result in results) < 2 * 4 + 2
+
+
+def test_configuration_after_the_deadline_is_skipped(shift_inputs):
+    started = time.monotonic()
+    report, seconds = solve_config((shift_inputs, DEFAULT_PORTFOLIO[0], time.time() + 0.5, threading.Event(), None))
+    assert report is None
+    assert seconds == 0.0
+    assert time.monotonic() - started < 0.5
@@ -0,0 +1,103 @@
+import random
+
+import pytest
+
+from benchmarks.synthetic import BBOX
+from replanning import replanning_graph, plan_from_report, add_visit, remove_visit, change_visit
+from route_optimization import build_routing_model, transit_matrices, time_window
+from warm_start import route_is_feasible
+
+
+@pytest.fixture(scope="module")
+def plan(shift_inputs, shift_report):
+    return plan_from_report(shift_inputs, shift_report)
+
+
+@pytest.fixture(scope="module")
+def graph(grid):
+    return replanning_graph(grid)
+
+
+def check_plan(plan):
+    """
+    Every route is feasible, the model accepts the routes and every visit that cannot be dropped is served.
+    """
+    inputs = plan["inputs"]
+    assert plan["report"] is not None
+    time_transit = transit_matrices(inputs["time_matrix"], inputs["distance_matrix"], inputs["service_times"])[0].tolist()
+    assert all(route_is_feasible(route, time_transit, inputs["time_windows"]) for route in plan["routes"])
+    assert build_routing_model(inputs)["routing"].ReadAssignmentFromRoutes(plan["routes"], True) is not None
+    served = {node for route in plan["routes"] for node in route}
+    assert all(node in served for node in range(1, len(inputs["nodes"])) if inputs["drop_penalties"][node] is None)
+
+
+def visits_of(plan, vehicle_id):
+    inputs = plan["inputs"]
+    return [(inputs["individer"][node], inputs["time_windows"][node]) for node in plan["routes"][vehicle_id]]
+
+
+def test_added_visits_keep_the_plan(plan, shift, graph, capsys):
+    medarbetare_df, _ = shift
+    north, south, east, west = BBOX
+    rnd = random.Random(0)
+    for i in range(10):
+        visit = {"Individ": f"Individ ny {i}", "Tid": rnd.choice([10, 15, 20]), "Tidsfönster": ("Sen kväll", "19-21"),
+                 "Constraints": "", "Latitude": rnd.uniform(south, north), "Longitude": rnd.uniform(west, east)}
+        new_plan = add_visit(plan, visit, medarbetare_df, graph)
+
+        check_plan(new_plan)
+        assert new_plan["unplaced"] == []
+        assert len(new_plan["inputs"]["nodes"]) == len(plan["inputs"]["nodes"]) + 1
+        unchanged = sum(visits_of(plan, v) == visits_of(new_plan, v) for v in range(len(plan["routes"])))
+        assert unchanged >= len(plan["routes"]) - 2
+        assert new_plan["report"]["objective"] - plan["report"]["objective"] < 5000
+    assert "from scratch" not in capsys.readouterr().out
+
+
+def test_visit_that_fits_nowhere_is_unplaced(plan, shift, graph):
+    medarbetare_df, _ = shift
+    visit = {"Individ": "Individ lång", "Tid": 600, "Tidsfönster": ("Middag", "15-17"), "Constraints": "",
+             "Latitude": 64.71, "Longitude": 21.17}
+    new_plan = add_visit(plan, visit, medarbetare_df, graph)
+
+    check_plan(new_plan)
+    assert new_plan["unplaced"] == ["Individ lång"]
+    assert new_plan["routes"] == plan["routes"]
+
+    # A shorter visit fits again
+    fixed = change_visit(new_plan, "Individ lång", tid=10)
+    check_plan(fixed)
+    assert fixed["unplaced"] == []
+
+
+def test_removed_visit_leaves_feasible_routes(plan):
+    inputs = plan["inputs"]
+    for individ in list(dict.fromkeys(inputs["individer"][1:]))[:8]:
+        new_plan = remove_visit(plan, individ)
+
+        check_plan(new_plan)
+        assert individ not in new_plan["inputs"]["individer"]
+        assert len(new_plan["inputs"]["nodes"]) == len(inputs["nodes"]) - inputs["individer"].count(individ)
+        # A removal can leave a longer wait than the model allows before a later visit, that visit is
+        # moved or, if it fits nowhere else, unplaced
+        if not new_plan["unplaced"]:
+            assert new_plan["report"]["objective"] <= plan["report"]["objective"] + 1000
+
+    with pytest.raises(ValueError):
+        remove_visit(plan, "Individ som inte finns")
+
+
+def test_changed_visit_moves_to_its_new_window(plan):
+    inputs = plan["inputs"]
+    individ = next(name for node, name in enumerate(inputs["individer"])
+                   if node and inputs["time_windows"][node] == time_window(("Middag", "15-17"), inputs["shift_start"])
+                   and inputs["individer"].count(name) == 1)
+    new_plan = change_visit(plan, individ, tid=25, tidsfönster=("Sen kväll", "19-21"))
+
+    check_plan(new_plan)
+    node = new_plan["inputs"]["individer"].index(individ)
+    assert new_plan["inputs"]["time_windows"][node] == time_window(("Sen kväll", "19-21"), inputs["shift_start"])
+    assert new_plan["inputs"]["service_times"][node] == 25 * 60
+    assert any(node in route for route in new_plan["routes"])
+    # The plan it came from is not changed
+    assert plan["inputs"]["time_windows"][node] != new_plan["inputs"]["time_windows"][node]
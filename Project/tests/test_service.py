@@ -0,0 +1,125 @@
+import json
+import queue
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import service
+from service import (service_state, handle_connection, read_progress, new_job, warm_start_routes, HOST,
+                     MAX_FINISHED_JOBS)
+from route_optimization import transit_matrices
+from warm_start import route_is_feasible
+
+
+@pytest.fixture
+def state(workbook, grid, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # The workbook cache
+    monkeypatch.setattr(service, "load_graph", lambda bbox, network_type: grid)
+    state = service_state(*workbook)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        state.update(pool=pool, progress=queue.Queue())
+        yield state
+
+
+def run_client(state, client):
+    """
+    Serves state on a free port while the coroutine client(port) runs, returns what it returns.
+    """
+    async def main():
+        threading.Thread(target=read_progress, args=(state, asyncio.get_running_loop()), daemon=True).start()
+        server = await asyncio.start_server(lambda reader, writer: handle_connection(state, reader, writer), HOST, 0)
+        try:
+            async with server:
+                return await client(server.sockets[0].getsockname()[1])
+        finally:
+            state["progress"].put(None)
+
+    return asyncio.run(main())
+
+
+async def send(port, data):
+    reader, writer = await asyncio.open_connection(HOST, port)
+    writer.write(data)
+    writer.write_eof()
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+async def call(port, method, path, payload=None):
+    body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+    response = await send(port, f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split(b" ")[1]), json.loads(body)
+
+
+async def finished(port, job_id):
+    while True:
+        status, job = await call(port, "GET", f"/jobs/{job_id}")
+        if job["status"] in ("done", "failed"):
+            return job
+        await asyncio.sleep(0.1)
+
+
+def test_replan_needs_a_job(state):
+    async def client(port):
+        return [await call(port, "POST", "/replan", {"remove": "Individ 3"}),
+                await call(port, "POST", "/replan", {"job": 99, "remove": "Individ 3"})]
+
+    (missing, _), (unknown, _) = run_client(state, client)
+    assert missing == 400
+    assert unknown == 409
+
+
+def test_incomplete_request_closes_the_connection(state):
+    async def client(port):
+        cut = await send(port, b"POST /solve HTTP/1.1\r\nContent-Length: 100\r\n\r\n{\"dag\": ")
+        return cut, await call(port, "GET", "/status")
+
+    cut, (status, _) = run_client(state, client)
+    assert cut == b""
+    assert status == 200
+
+
+def test_solve_twice_warm_starts_from_the_last_routes(state):
+    async def client(port):
+        jobs = []
+        for _ in range(2):
+            status, job = await call(port, "POST", "/solve", {"dag": "mån", "skift": "em", "time_limit": 1})
+            assert status == 202
+            jobs.append(await finished(port, job["id"]))
+        return jobs
+
+    first, second = run_client(state, client)
+    assert first["status"] == second["status"] == "done"
+    assert second["objective"] <= first["objective"]
+
+    last = state["last_solves"][("Måndag", "em")]
+    assert warm_start_routes(last, last["inputs"]) is last["routes"]
+
+
+def test_changed_inputs_are_checked_before_the_warm_start(state):
+    async def client(port):
+        status, job = await call(port, "POST", "/solve", {"dag": "mån", "skift": "em", "time_limit": 1})
+        return await finished(port, job["id"])
+
+    run_client(state, client)
+    last = state["last_solves"][("Måndag", "em")]
+
+    # Same visits, but the workbook was reloaded with longer visits
+    inputs = dict(last["inputs"], service_times=[time * 3 for time in last["inputs"]["service_times"]])
+    routes = warm_start_routes(last, inputs)
+    assert routes != last["routes"]
+    time_transit = transit_matrices(inputs["time_matrix"], inputs["distance_matrix"], inputs["service_times"])[0].tolist()
+    assert all(route_is_feasible(route, time_transit, inputs["time_windows"]) for route in routes)
+
+
+def test_old_finished_jobs_are_forgotten(state):
+    for _ in range(MAX_FINISHED_JOBS + 10):
+        new_job(state, "solve", {})["status"] = "done"
+    running = new_job(state, "solve", {})
+    assert len(state["jobs"]) == MAX_FINISHED_JOBS + 1
+    assert running["id"] in state["jobs"]
+    assert max(state["jobs"]) == running["id"]
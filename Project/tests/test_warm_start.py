@@ -0,0 +1,111 @@
+import json
+import random
+
+from route_optimization import build_routing_model, prepare_routing_inputs, transit_matrices, MAX_WAIT
+from warm_start import (route_is_feasible, save_routes, load_routes, initial_routes_from_saved,
+                        MAX_VISITS_PER_ROUTE)
+from week import DEPOT_LOCATION, SKIFT_TIDER
+
+
+def relaxed(inputs, **changes):
+    """
+    A copy of inputs where any vehicle may serve any visit and every visit can be dropped,
+    so the model only judges the time windows, waiting and stops of the routes it is given.
+    """
+    inputs = dict(inputs, **changes)
+    inputs["allowed_vehicles"] = [None] * len(inputs["nodes"])
+    inputs["drop_penalties"] = [None] + [100000] * (len(inputs["nodes"]) - 1)
+    return inputs
+
+
+def model_accepts(model, routes):
+    return model["routing"].ReadAssignmentFromRoutes(routes, True) is not None
+
+
+def time_transit_of(inputs):
+    return transit_matrices(inputs["time_matrix"], inputs["distance_matrix"], inputs["service_times"])[0].tolist()
+
+
+def test_route_is_feasible_agrees_with_the_model(shift_inputs):
+    inputs = relaxed(shift_inputs)
+    model = build_routing_model(inputs)
+    time_transit = time_transit_of(inputs)
+    rnd = random.Random(0)
+
+    results = []
+    for _ in range(300):
+        route = rnd.sample(range(1, len(inputs["nodes"])), rnd.randint(1, 12))
+        if rnd.random() < 0.7:
+            route.sort(key=lambda node: inputs["time_windows"][node])
+        expected = model_accepts(model, [route] + [[]] * (inputs["num_vehicles"] - 1))
+        assert route_is_feasible(route, time_transit, inputs["time_windows"]) == expected, route
+        results.append(expected)
+    assert 30 < sum(results) < 270
+
+
+def test_route_stop_limit_matches_the_load_dimension(shift_inputs):
+    shift_length = shift_inputs["time_windows"][0][1]
+    inputs = relaxed(shift_inputs, time_windows=[(0, shift_length)] * len(shift_inputs["nodes"]),
+                     service_times=[0] + [60] * (len(shift_inputs["nodes"]) - 1))
+    model = build_routing_model(inputs)
+    time_transit = time_transit_of(inputs)
+    empty = [[]] * (inputs["num_vehicles"] - 1)
+
+    route = list(range(1, MAX_VISITS_PER_ROUTE + 1))
+    assert route_is_feasible(route, time_transit, inputs["time_windows"])
+    assert model_accepts(model, [route] + empty)
+    longer = route + [MAX_VISITS_PER_ROUTE + 1]
+    assert not route_is_feasible(longer, time_transit, inputs["time_windows"])
+    assert not model_accepts(model, [longer] + empty)
+
+
+def test_waiting_before_the_first_stop_is_limited(shift_inputs):
+    time_transit = time_transit_of(shift_inputs)
+    arrival = int(time_transit[0][1])
+    for wait, feasible in ((MAX_WAIT, True), (MAX_WAIT + 60, False)):
+        time_windows = list(shift_inputs["time_windows"])
+        time_windows[1] = (arrival + wait, arrival + wait + 3600)
+        inputs = relaxed(shift_inputs, time_windows=time_windows)
+        assert route_is_feasible([1], time_transit, time_windows) == feasible
+        assert model_accepts(build_routing_model(inputs), [[1]] + [[]] * (inputs["num_vehicles"] - 1)) == feasible
+
+
+def test_saved_routes_round_trip(shift_inputs, shift_report, tmp_path):
+    path = str(tmp_path / "warm_start.json")
+    save_routes(path, "EM", shift_report, shift_inputs)
+    routes = initial_routes_from_saved(load_routes(path, "EM"), shift_inputs)
+
+    # Double staffing gives a visit two nodes, either may come back first
+    def visits(route):
+        return [(shift_inputs["individer"][node], shift_inputs["time_windows"][node]) for node in route]
+
+    assert [visits(route) for route in routes] == [visits(shift_report["routes"].get(vehicle_id, []))
+                                                   for vehicle_id in range(shift_inputs["num_vehicles"])]
+    assert model_accepts(build_routing_model(shift_inputs), routes)
+
+
+def test_changed_visits_give_routes_the_model_accepts(shift, shift_inputs, shift_report, grid, tmp_path):
+    path = str(tmp_path / "warm_start.json")
+    save_routes(path, "EM", shift_report, shift_inputs)
+
+    # Some visits are gone and one moves to another time window
+    medarbetare_df, besök = shift
+    besök = besök.drop(index=besök.index[[2, 9, 17]]).reset_index(drop=True)
+    besök.at[0, "Tidsfönster"] = ("Sen kväll", "19-21") if besök.at[0, "Tidsfönster"][0] != "Sen kväll" \
+        else ("Middag", "15-17")
+    inputs = prepare_routing_inputs(besök, medarbetare_df, grid, DEPOT_LOCATION, len(medarbetare_df),
+                                    *SKIFT_TIDER[False], cache_dir=None)
+
+    routes = initial_routes_from_saved(load_routes(path, "EM"), inputs)
+    time_transit = time_transit_of(inputs)
+    assert all(route_is_feasible(route, time_transit, inputs["time_windows"]) for route in routes)
+    assert model_accepts(build_routing_model(inputs), routes)
+    assert sum(map(len, routes)) >= sum(map(len, shift_report["routes"].values())) - 4
+
+
+def test_routes_saved_as_names_still_load(shift_inputs, shift_report, tmp_path):
+    path = tmp_path / "warm_start.json"
+    path.write_text(json.dumps({"EM": {str(vehicle_id): [shift_inputs["individer"][node] for node in route]
+                                       for vehicle_id, route in shift_report["routes"].items()}}))
+    routes = initial_routes_from_saved(load_routes(str(path), "EM"), shift_inputs)
+    assert model_accepts(build_routing_model(shift_inputs), routes)
@@ -0,0 +1,73 @@
+import os
+import shutil
+
+import pytest
+
+import workbook_cache
+from benchmarks.synthetic import synthetic_workbook
+from workbook_cache import load_workbook, workbook_cache_path
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """
+    Counts how often the workbook is parsed.
+    """
+    calls = []
+    parse_workbook = workbook_cache.parse_workbook
+    monkeypatch.setattr(workbook_cache, "parse_workbook", lambda file_path: calls.append(file_path) or parse_workbook(file_path))
+    return calls
+
+
+@pytest.fixture
+def workbook_copy(workbook, tmp_path):
+    path = str(tmp_path / "planering.xlsx")
+    shutil.copy(workbook[0], path)
+    return path
+
+
+def set_mtime(path, seconds):
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + seconds * 10 ** 9))
+
+
+def test_unchanged_workbook_is_read_from_the_cache(workbook_copy, tmp_path, parses):
+    cache_dir = str(tmp_path / "cache")
+    sheets = load_workbook(workbook_copy, cache_dir)
+    cached = load_workbook(workbook_copy, cache_dir)
+    assert len(parses) == 1
+    assert cached.keys() == sheets.keys()
+    assert cached["brukare"].equals(sheets["brukare"])
+
+    # refresh and cache_dir=None parse again
+    load_workbook(workbook_copy, cache_dir, refresh=True)
+    load_workbook(workbook_copy, None)
+    assert len(parses) == 3
+
+
+def test_touched_workbook_with_the_same_contents_is_not_parsed(workbook_copy, tmp_path, parses):
+    cache_dir = str(tmp_path / "cache")
+    load_workbook(workbook_copy, cache_dir)
+    set_mtime(workbook_copy, 10)
+    load_workbook(workbook_copy, cache_dir)
+    load_workbook(workbook_copy, cache_dir)
+    assert len(parses) == 1
+
+
+def test_changed_workbook_is_parsed_again(workbook_copy, tmp_path, parses):
+    cache_dir = str(tmp_path / "cache")
+    before = load_workbook(workbook_copy, cache_dir)
+    synthetic_workbook(workbook_copy, str(tmp_path / "adresser.txt"), 25, 7, seed=2)
+    set_mtime(workbook_copy, 10)
+
+    after = load_workbook(workbook_copy, cache_dir)
+    assert len(parses) == 2
+    assert len(after["medarbetare"]) != len(before["medarbetare"])
+
+
+def test_broken_cache_file_is_parsed_again(workbook_copy, tmp_path, parses):
+    cache_dir = str(tmp_path / "cache")
+    load_workbook(workbook_copy, cache_dir)
+    with open(workbook_cache_path(cache_dir, workbook_copy), "wb") as f:
+        f.write(b"not a pickle")
+    assert "brukare" in load_workbook(workbook_copy, cache_dir)
+    assert len(parses) == 2
@@ -0,0 +1,143 @@
+import os
+import json
+from collections import defaultdict
+
+from route_optimization import transit_matrices, MAX_WAIT, STOPS_PER_VEHICLE
+
+# The depot start uses one stop of the load dimension
+MAX_VISITS_PER_ROUTE = STOPS_PER_VEHICLE - 1
+
+
+def saved_visits(routes, inputs):
+    """
+    Returns the routes (one list of node indices per vehicle id) as [Individ, window start, window end]
+    per visit, so the visits can be found again when the node indices have changed.
+    """
+    return {vehicle_id: [[inputs["individer"][node], *inputs["time_windows"][node]] for node in route]
+            for vehicle_id, route in routes.items()}
+
+
+def save_routes(path, key, report, inputs):
+    """
+    Saves the per-vehicle visit sequences of a report under key (e.g. the shift),
+    replacing what was saved for key before.
+    """
+    saved = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            saved = json.load(f)
+
+    saved[key] = {str(vehicle_id): visits for vehicle_id, visits in saved_visits(report["routes"], inputs).items()}
+
+    with open(path, "w") as f:
+        json.dump(saved, f, ensure_ascii=False, indent=1)
+
+
+def load_routes(path, key):
+    """
+    Returns the saved visit sequences for key as a dict vehicle id -> list of [Individ, window start,
+    window end] (or only the Individ, as saved by earlier versions), or None.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        saved = json.load(f).get(key)
+    if saved is None:
+        return None
+    return {int(vehicle_id): visits for vehicle_id, visits in saved.items()}
+
+
+def route_is_feasible(route, time_transit, time_windows):
+    """
+    Checks a route of node indices the way the time and load dimensions of build_routing_model do:
+    the vehicle leaves the depot at 0, may wait at most MAX_WAIT after each arrival, must be inside
+    every time window and back at the depot by the end of the shift, and has at most
+    MAX_VISITS_PER_ROUTE visits. Keeps the interval of feasible start times at each stop.
+    """
+    if len(route) > MAX_VISITS_PER_ROUTE:
+        return False
+    earliest = latest = 0
+    previous = 0
+    for node in route:
+        start, end = time_windows[node]
+        transit = time_transit[previous][node]
+        earliest = max(earliest + transit, start)
+        latest = min(latest + transit + MAX_WAIT, end)
+        if earliest > latest:
+            return False
+        previous = node
+    return earliest + time_transit[previous][0] <= time_windows[0][1]
+
+
+def cheapest_insertion(routes, node, inputs, time_transit):
+    """
+    Inserts node where it adds the least travel time among the feasible positions of its allowed vehicles
+    (any vehicle for a visit no medarbetare fully qualifies for). Returns False if no feasible position exists.
+    """
+    best = None
+    allowed = inputs["allowed_vehicles"][node]
+    for vehicle_id in range(inputs["num_vehicles"]) if allowed is None else allowed:
+        route = routes[vehicle_id]
+        for position in range(len(route) + 1):
+            previous = route[position - 1] if position > 0 else 0
+            following = route[position] if position < len(route) else 0
+            added = (time_transit[previous][node] + time_transit[node][following]
+                     - time_transit[previous][following])
+            if best is not None and added >= best[0]:
+                continue
+            candidate = route[:position] + [node] + route[position:]
+            if route_is_feasible(candidate, time_transit, inputs["time_windows"]):
+                best = (added, vehicle_id, position)
+
+    if best is None:
+        return False
+    added, vehicle_id, position = best
+    routes[vehicle_id].insert(position, node)
+    return True
+
+
+def initial_routes_from_saved(saved_routes, inputs):
+    """
+    Maps saved visit sequences from load_routes onto the node indices of inputs, matching on the
+    Individ and time window. Visits that are gone are dropped, visits that a vehicle may no longer
+    serve or that no longer fit where they were are taken out, and they and the new visits are added
+    by cheapest insertion. Returns one list of node indices per vehicle, every route passes
+    route_is_feasible, so the model accepts them if every visit that cannot be dropped was placed.
+    """
+    time_transit, _ = transit_matrices(inputs["time_matrix"], inputs["distance_matrix"], inputs["service_times"])
+    time_transit = time_transit.tolist()
+
+    # Node indices per Individ, double staffing and several time windows give an Individ several nodes
+    nodes_of = defaultdict(list)
+    for node, individ in enumerate(inputs["individer"][1:], start=1):
+        nodes_of[individ].append(node)
+
+    def candidates(visit):
+        # Earlier versions saved only the Individ, then any of its visits matches
+        individ, window = (visit[0], list(visit[1:])) if isinstance(visit, list) else (visit, None)
+        return individ, [node for node in nodes_of[individ]
+                         if window is None or list(inputs["time_windows"][node]) == window]
+
+    # Keep the saved order, the visits that do not fit there any more are inserted below
+    routes = [[] for _ in range(inputs["num_vehicles"])]
+    remaining = []
+    for vehicle_id, visits in saved_routes.items():
+        route = routes[vehicle_id] if vehicle_id < inputs["num_vehicles"] else None
+        for visit in visits:
+            individ, nodes = candidates(visit)
+            if not nodes:
+                continue
+            fitting = [node for node in nodes if route is not None
+                       and (inputs["allowed_vehicles"][node] is None or vehicle_id in inputs["allowed_vehicles"][node])
+                       and route_is_feasible(route + [node], time_transit, inputs["time_windows"])]
+            node = fitting[0] if fitting else nodes[0]
+            nodes_of[individ].remove(node)
+            (route if fitting else remaining).append(node)
+
+    # Visits no medarbetare fully qualifies for (no allowed vehicles) are left to the search
+    remaining = sorted(node for node in remaining + [node for nodes in nodes_of.values() for node in nodes]
+                       if inputs["allowed_vehicles"][node] is not None)
+    not_inserted = [node for node in remaining if not cheapest_insertion(routes, node, inputs, time_transit)]
+    if not_inserted:
+        print(f"Warm start could not place {len(not_inserted)} visits, the search has to insert them.")
+    return routes
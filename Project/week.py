@@ -0,0 +1,129 @@
+import os
+import sys
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from data_processing import ladda_data, ladda_koordinater, rensa_medarb_data
+from dataframe_creation import vecko_dfs, skift_df, DATA_FIL, ADRESS_FIL
+from graph_snapshot import load_graph
+from snapping import snap_to_nodes
+from route_optimization import (build_adjacency, node_matrices, cached_node_matrices, prepare_routing_inputs,
+                                solve_inputs, format_report)
+from decomposition import optimize_routes_decomposed
+from portfolio import solve_portfolio
+
+VECKODAGAR = ["Måndag", "Tisdag", "Onsdag", "Torsdag", "Fredag"]
+DEPOT_LOCATION = (64.71128317136987, 21.16924807421642)
+
+# Start and end hour of the förmiddag (True) and eftermiddag (False) shifts
+SKIFT_TIDER = {True: (7, 15), False: (15, 22)}
+
+
+def veckans_jobb():
+    """
+    Returns all (dag, fm) jobs of a week, fm is True for the förmiddag shift.
+    """
+    return [(dag, fm) for dag in VECKODAGAR for fm in (True, False)]
+
+
+def week_matrices(G, brukare_dfs, depot_location, cache_dir="matrix_cache", workers=1):
+    """
+    Snaps the visits of all brukare_dfs and computes the matrices between the union of their
+    nodes once. Returns a function brukare_df -> (time_matrix, distance_matrix, nodes) that
+    prepare_routing_inputs can use instead of generating matrices per job.
+    """
+    latitudes = [depot_location[0]] + [lat for df in brukare_dfs for lat in df['Latitude'].astype("float")]
+    longitudes = [depot_location[1]] + [lon for df in brukare_dfs for lon in df['Longitude'].astype("float")]
+    union_nodes = list(dict.fromkeys(snap_to_nodes(G, latitudes, longitudes)[0].tolist()))
+
+    if cache_dir is None:
+        time_matrix, distance_matrix = node_matrices(build_adjacency(G), union_nodes, workers)
+    else:
+        time_matrix, distance_matrix = cached_node_matrices(G, union_nodes, cache_dir, workers=workers)
+    time_matrix = np.asarray(time_matrix)
+    distance_matrix = np.asarray(distance_matrix)
+    index_of = {node: i for i, node in enumerate(union_nodes)}
+
+    def job_matrices(brukare_df):
+        nodes = snap_to_nodes(G, [depot_location[0]] + list(brukare_df['Latitude'].astype("float")),
+                              [depot_location[1]] + list(brukare_df['Longitude'].astype("float")))[0].tolist()
+        index = [index_of[node] for node in nodes]
+        return (time_matrix[np.ix_(index, index)].tolist(), distance_matrix[np.ix_(index, index)].tolist(), nodes)
+
+    return job_matrices
+
+
+def solve_job(args):
+    return solve_inputs(*args)
+
+
+def solve_week(jobs=None, file_path=DATA_FIL, depot_location=DEPOT_LOCATION, workers=None, time_limit=120,
+               cache_dir="matrix_cache", adress_fil=ADRESS_FIL, matrix_workers=None, decompose=None,
+               portfolio=False):
+    """
+    Solves several (dag, fm) jobs in one run, the whole week by default.
+    The Excel file and road graph are loaded once, the travel matrices are computed once for
+    all visits of the week and the routing instances are solved in parallel worker processes.
+    matrix_workers is the number of processes for the matrices, the same as workers by default.
+    With decompose every job is planned by decomposition.optimize_routes_decomposed with decompose
+    clusters (0 picks the number from the visits), and with portfolio by portfolio.solve_portfolio,
+    the jobs then run one after the other.
+    Returns the week schedule as {dag: {"FM"/"EM": report}}.
+    """
+    if jobs is None:
+        jobs = veckans_jobb()
+
+    data = ladda_data(file_path)
+    medarbetare_df = rensa_medarb_data(data["medarbetare"])
+    G = load_graph(ladda_koordinater(file_path), network_type='drive')
+
+    dag_dfs = vecko_dfs(list(dict.fromkeys(dag for dag, fm in jobs)), data, adress_fil)
+    skift_dfs = [skift_df(dag_dfs[dag], fm) for dag, fm in jobs]
+
+    matrix_workers = matrix_workers or workers or os.cpu_count() or 1
+    if decompose is not None:
+        # The clusters of a job are solved in parallel, so the jobs run one after the other
+        reports = [optimize_routes_decomposed(brukare_df, medarbetare_df, G, depot_location, len(medarbetare_df),
+                                              *SKIFT_TIDER[fm], n_clusters=decompose or None, workers=workers,
+                                              time_limit=time_limit, cache_dir=cache_dir, matrix_workers=matrix_workers)
+                   for brukare_df, (dag, fm) in zip(skift_dfs, jobs)]
+    else:
+        job_matrices = week_matrices(G, skift_dfs, depot_location, cache_dir, workers=matrix_workers)
+        inputs = [prepare_routing_inputs(brukare_df, medarbetare_df, G, depot_location, len(medarbetare_df),
+                                         *SKIFT_TIDER[fm], matrices=job_matrices(brukare_df))
+                  for brukare_df, (dag, fm) in zip(skift_dfs, jobs)]
+
+        if portfolio:
+            # The configurations of a job are solved in parallel
+            reports = [solve_portfolio(job_inputs, time_limit, workers=workers) for job_inputs in inputs]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                reports = list(pool.map(solve_job, [(job_inputs, time_limit) for job_inputs in inputs]))
+
+    schedule = {}
+    for (dag, fm), report in zip(jobs, reports):
+        schedule.setdefault(dag, {})["FM" if fm else "EM"] = report
+    return schedule
+
+
+def write_week_schedule(schedule, json_file="week_schedule.json", text_file="route_output_week.txt"):
+    """
+    Writes the week schedule as JSON and as one timetable text per job.
+    """
+    with open(json_file, "w") as f:
+        json.dump(schedule, f, ensure_ascii=False, indent=1, default=int)
+
+    with open(text_file, "w") as f:
+        for dag, skift in schedule.items():
+            for namn, report in skift.items():
+                f.write(f"##### {dag} {namn} #####\n")
+                f.write(format_report(report) + "\n")
+
+
+if __name__ == '__main__':
+    # Schemalägger hela veckan: python Project/week.py [tidsgräns i sekunder]
+    time_limit = int(sys.argv[1]) if len(sys.argv) > 1 else 120
+    write_week_schedule(solve_week(time_limit=time_limit))
+    print("Week schedule written to week_schedule.json and route_output_week.txt")
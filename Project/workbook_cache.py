@@ -0,0 +1,83 @@
+import os
+import pickle
+import hashlib
+import pandas as pd
+
+from metrics import count
+
+WORKBOOK_CACHE_DIR = "workbook_cache"
+
+# Sheets used by the program and the row of their header (None for no header)
+SHEETS = {
+    'brukare': ('Individer, brukare', 1),
+    'medarbetare': ('Medarbetare', 2),
+    'koordinater': ('Koordinater', None),
+}
+
+
+def file_hash(file_path):
+    """
+    Returns the SHA-1 of the file contents.
+    """
+    hasher = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def workbook_cache_path(cache_dir, file_path):
+    key = hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"workbook_{key}.pkl")
+
+
+def parse_workbook(file_path):
+    """
+    Parses all sheets in SHEETS from one opening of the workbook.
+    """
+    excel_data = pd.ExcelFile(file_path)
+    return {name: excel_data.parse(sheet, header=header) for name, (sheet, header) in SHEETS.items()}
+
+
+def save_workbook_cache(cache_dir, file_path, sheets, mtime, sha1):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = workbook_cache_path(cache_dir, file_path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({"mtime": mtime, "sha1": sha1, "sheets": sheets}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_workbook(file_path, cache_dir=WORKBOOK_CACHE_DIR, refresh=False):
+    """
+    Returns the sheets of the workbook as a dict of dataframes (see SHEETS).
+    The parsed sheets are pickled in cache_dir together with the modification time and hash of
+    the workbook. A cached copy is used when the modification time is unchanged, or when the file
+    was touched but its contents hash the same. Pass cache_dir=None to always parse the workbook.
+    """
+    if cache_dir is None:
+        return parse_workbook(file_path)
+
+    mtime = os.stat(file_path).st_mtime_ns
+    path = workbook_cache_path(cache_dir, file_path)
+    cached = None
+    if not refresh and os.path.exists(path):
+        try:
+            with open(path, 'rb') as f:
+                cached = pickle.load(f)
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            cached = None  # Written by another pandas version or cut short, parse again
+
+    if cached is not None and cached["mtime"] == mtime:
+        count("workbook_cache_hits")
+        return cached["sheets"]
+
+    sha1 = file_hash(file_path)
+    if cached is not None and cached["sha1"] == sha1:
+        count("workbook_cache_hits")
+        sheets = cached["sheets"]
+    else:
+        count("workbook_cache_misses")
+        sheets = parse_workbook(file_path)
+    save_workbook_cache(cache_dir, file_path, sheets, mtime, sha1)
+    return sheets